@@ -0,0 +1,73 @@
+# Microbenchmark of the redis overhead of authenticate_oauth per request.
+#
+# Compares the previous validation (HGETALL of the token plus GET, SETEX or
+# DECR and GET of the daily limiter) with _check_token (a single EVALSHA, and
+# no redis access for the cached client tokens). It only needs the redis of
+# the Qiita configuration, and the tokens it creates expire after a minute.
+#
+# python benchmark-authenticate-oauth.py [number of requests]
+import sys
+from timeit import timeit
+from uuid import uuid4
+
+from qiita_core.qiita_settings import r_client
+from qiita_db.handlers import oauth2
+
+
+def previous_check_token(token):
+    db_token = r_client.hgetall(token)
+    if not db_token:
+        return 0
+    if db_token[b"grant_type"] == b"password":
+        limit_key = "%s_%s_daily_limit" % (
+            db_token[b"client_id"].decode("ascii"),
+            db_token[b"user"].decode("ascii"),
+        )
+        limiter = r_client.get(limit_key)
+        if limiter is None:
+            r_client.setex(limit_key, 86400, 5000)
+        else:
+            r_client.decr(limit_key)
+            if int(r_client.get(limit_key)) <= 0:
+                return 2
+    return 1
+
+
+def create_token(grant_type):
+    token = "benchmark-%s" % uuid4().hex
+    token_info = {
+        "timestamp": "12/12/12 12:12:00",
+        "client_id": "benchmark-%s" % uuid4().hex,
+        "grant_type": grant_type,
+    }
+    if grant_type == "password":
+        token_info["user"] = "test@foo.bar"
+    r_client.hmset(token, token_info)
+    r_client.expire(token, 60)
+    return token, "%s_test@foo.bar_daily_limit" % token_info["client_id"]
+
+
+def no_cache_check_token(token):
+    oauth2._token_cache.clear()
+    return oauth2._check_token(token)
+
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+client_token, _ = create_token("client")
+password_token, limit_key = create_token("password")
+# the limiter is big enough to not block any request
+r_client.setex(limit_key, 60, 10 * n)
+
+functions = [
+    ("previous", previous_check_token),
+    ("single script, no cache", no_cache_check_token),
+    ("single script", oauth2._check_token),
+]
+print("%-25s %-10s %10s" % ("validation", "token", "us/request"))
+for name, func in functions:
+    for token_name, token in [("client", client_token), ("password", password_token)]:
+        assert func(token) == 1
+        elapsed = timeit(lambda: func(token), number=n)
+        print("%-25s %-10s %10.1f" % (name, token_name, elapsed / n * 1e6))
+
+r_client.delete(client_token, password_token, limit_key)
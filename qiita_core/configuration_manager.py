@@ -48,6 +48,32 @@ class ConfigurationManager(object):
     job_scheduler_dependency_q_cnt : int
         Hard upper-limit on the number of an artifact's concurrent validation
         processes.
+    job_scheduler_local_workers : int
+        Max number of jobs running at the same time with the local
+        qiita-plugin-launcher. Defaults to the number of CPUs
+    job_scheduler_local_env_reuse : int
+        Number of jobs of a plugin launched with the local
+        qiita-plugin-launcher that reuse the environment set by its
+        environment script, before running the script again. None to run the
+        environment script for every job
+    job_scheduler_completion_workers : int
+        Max number of job completions processed at the same time by the Qiita
+        server, 0 to complete all the jobs with a scheduled complete_job.
+        Defaults to 2
+    job_scheduler_completion_max_size : int
+        Max size in bytes of the files of a job completion processed by the
+        Qiita server; the completions with larger files are escalated to a
+        scheduled complete_job. Defaults to 1 GB
+    job_scheduler_max_jobs : int
+        Max number of jobs submitted to the job scheduler by Qiita that are
+        queued or running; the private, validator and ENVIRONMENT jobs are not
+        limited nor counted. None for no limit
+    job_scheduler_max_user_jobs : int
+        Max number of jobs of a single user submitted to the job scheduler
+        that are queued or running. None for no limit
+    job_scheduler_max_command_jobs : int
+        Max number of jobs of a single command submitted to the job scheduler
+        that are queued or running. None for no limit
     user : str
         The postgres user
     password : str
@@ -302,6 +328,68 @@ class ConfigurationManager(object):
                 self.job_scheduler_dependency_q_cnt
             )
 
+        self.job_scheduler_local_workers = config.get(
+            "job_scheduler", "JOB_SCHEDULER_LOCAL_WORKERS", fallback=None
+        )
+        if self.job_scheduler_local_workers:
+            self.job_scheduler_local_workers = int(self.job_scheduler_local_workers)
+        else:
+            self.job_scheduler_local_workers = None
+
+        self.job_scheduler_local_env_reuse = config.get(
+            "job_scheduler", "JOB_SCHEDULER_LOCAL_ENV_REUSE", fallback=None
+        )
+        if self.job_scheduler_local_env_reuse:
+            self.job_scheduler_local_env_reuse = int(self.job_scheduler_local_env_reuse)
+        else:
+            self.job_scheduler_local_env_reuse = None
+
+        self.job_scheduler_completion_workers = config.get(
+            "job_scheduler", "JOB_SCHEDULER_COMPLETION_WORKERS", fallback=None
+        )
+        if self.job_scheduler_completion_workers:
+            self.job_scheduler_completion_workers = int(
+                self.job_scheduler_completion_workers
+            )
+        else:
+            self.job_scheduler_completion_workers = 2
+
+        self.job_scheduler_completion_max_size = config.get(
+            "job_scheduler", "JOB_SCHEDULER_COMPLETION_MAX_SIZE", fallback=None
+        )
+        if self.job_scheduler_completion_max_size:
+            self.job_scheduler_completion_max_size = int(
+                self.job_scheduler_completion_max_size
+            )
+        else:
+            self.job_scheduler_completion_max_size = 1073741824
+
+        self.job_scheduler_max_jobs = config.get(
+            "job_scheduler", "JOB_SCHEDULER_MAX_JOBS", fallback=None
+        )
+        if self.job_scheduler_max_jobs:
+            self.job_scheduler_max_jobs = int(self.job_scheduler_max_jobs)
+        else:
+            self.job_scheduler_max_jobs = None
+
+        self.job_scheduler_max_user_jobs = config.get(
+            "job_scheduler", "JOB_SCHEDULER_MAX_USER_JOBS", fallback=None
+        )
+        if self.job_scheduler_max_user_jobs:
+            self.job_scheduler_max_user_jobs = int(self.job_scheduler_max_user_jobs)
+        else:
+            self.job_scheduler_max_user_jobs = None
+
+        self.job_scheduler_max_command_jobs = config.get(
+            "job_scheduler", "JOB_SCHEDULER_MAX_COMMAND_JOBS", fallback=None
+        )
+        if self.job_scheduler_max_command_jobs:
+            self.job_scheduler_max_command_jobs = int(
+                self.job_scheduler_max_command_jobs
+            )
+        else:
+            self.job_scheduler_max_command_jobs = None
+
     def _get_postgres(self, config):
         """Get the configuration of the postgres section"""
         self.user = config.get("postgres", "USER")
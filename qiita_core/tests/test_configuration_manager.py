@@ -63,6 +63,13 @@ class ConfigurationManagerTests(TestCase):
         self.assertEqual(obs.job_scheduler_owner, "user@somewhere.org")
         self.assertEqual(obs.job_scheduler_poll_val, 15)
         self.assertEqual(obs.job_scheduler_dependency_q_cnt, 2)
+        self.assertEqual(obs.job_scheduler_local_workers, 4)
+        self.assertEqual(obs.job_scheduler_local_env_reuse, 50)
+        self.assertEqual(obs.job_scheduler_completion_workers, 4)
+        self.assertEqual(obs.job_scheduler_completion_max_size, 536870912)
+        self.assertEqual(obs.job_scheduler_max_jobs, 500)
+        self.assertEqual(obs.job_scheduler_max_user_jobs, 100)
+        self.assertEqual(obs.job_scheduler_max_command_jobs, 200)
 
         # Postgres section
         self.assertEqual(obs.user, "postgres")
@@ -220,8 +227,22 @@ class ConfigurationManagerTests(TestCase):
 
         conf_setter = partial(self.conf.set, "job_scheduler")
         conf_setter("JOB_SCHEDULER_JOB_OWNER", "")
+        conf_setter("JOB_SCHEDULER_LOCAL_WORKERS", "")
+        conf_setter("JOB_SCHEDULER_LOCAL_ENV_REUSE", "")
+        conf_setter("JOB_SCHEDULER_COMPLETION_WORKERS", "")
+        conf_setter("JOB_SCHEDULER_COMPLETION_MAX_SIZE", "")
+        conf_setter("JOB_SCHEDULER_MAX_JOBS", "")
+        conf_setter("JOB_SCHEDULER_MAX_USER_JOBS", "")
+        conf_setter("JOB_SCHEDULER_MAX_COMMAND_JOBS", "")
         obs._get_job_scheduler(self.conf)
         self.assertEqual("", obs.job_scheduler_owner)
+        self.assertIsNone(obs.job_scheduler_local_workers)
+        self.assertIsNone(obs.job_scheduler_local_env_reuse)
+        self.assertEqual(obs.job_scheduler_completion_workers, 2)
+        self.assertEqual(obs.job_scheduler_completion_max_size, 1073741824)
+        self.assertIsNone(obs.job_scheduler_max_jobs)
+        self.assertIsNone(obs.job_scheduler_max_user_jobs)
+        self.assertIsNone(obs.job_scheduler_max_command_jobs)
 
     def test_get_postgres(self):
         obs = ConfigurationManager()
@@ -422,6 +443,35 @@ JOB_SCHEDULER_POLLING_VALUE = 15
 # Hard upper-limit on concurrently running validator jobs
 JOB_SCHEDULER_PROCESSING_QUEUE_COUNT = 2
 
+# Max number of jobs running at the same time with the local
+# qiita-plugin-launcher, defaults to the number of CPUs
+JOB_SCHEDULER_LOCAL_WORKERS = 4
+
+# Number of jobs of a plugin launched with the local qiita-plugin-launcher
+# that reuse the environment set by its ENVIRONMENT_SCRIPT before running the
+# script again, leave empty to run the script for every job
+JOB_SCHEDULER_LOCAL_ENV_REUSE = 50
+
+# Max number of job completions processed at the same time by the Qiita
+# server, 0 to complete all the jobs with a scheduled complete_job, defaults
+# to 2
+JOB_SCHEDULER_COMPLETION_WORKERS = 4
+
+# Max size in bytes of the files of a job completion processed by the Qiita
+# server, the completions with larger files are completed with a scheduled
+# complete_job, defaults to 1 GB
+JOB_SCHEDULER_COMPLETION_MAX_SIZE = 536870912
+
+# Max number of jobs submitted by Qiita to the job scheduler
+# (qiita-plugin-launcher-slurm) that are queued or running, by all the users
+# (MAX_JOBS), a single user (MAX_USER_JOBS) or a single command
+# (MAX_COMMAND_JOBS); the rest of the jobs wait in Qiita and are submitted as
+# these finish. Leave empty for no limit, if all are empty the jobs are
+# submitted right away
+JOB_SCHEDULER_MAX_JOBS = 500
+JOB_SCHEDULER_MAX_USER_JOBS = 100
+JOB_SCHEDULER_MAX_COMMAND_JOBS = 200
+
 # ----------------------------- EBI settings -----------------------------
 [ebi]
 # The user to use when submitting to EBI
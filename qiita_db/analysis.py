@@ -17,8 +17,7 @@ Classes
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 from collections import defaultdict
-from itertools import product
-from json import dump, loads
+from json import dump, dumps, loads
 from os import mkdir
 from os.path import exists, join
 from re import sub
@@ -863,21 +862,24 @@ class Analysis(qdb.base.QiitaObject):
             if not overwrite_lock:
                 self._lock_samples()
 
+            artifact_ids = []
+            sample_ids = []
             for aid, samps in samples.items():
-                # get previously selected samples for aid and filter them out
-                sql = """SELECT sample_id
-                         FROM qiita.analysis_sample
-                         WHERE artifact_id = %s AND analysis_id = %s"""
-                qdb.sql_connection.TRN.add(sql, [aid, self._id])
-                prev_selected = qdb.sql_connection.TRN.execute_fetchflatten()
-
-                select = set(samps).difference(prev_selected)
-                sql = """INSERT INTO qiita.analysis_sample
-                            (analysis_id, artifact_id, sample_id)
-                         VALUES (%s, %s, %s)"""
-                args = [[self._id, aid, s] for s in select]
-                qdb.sql_connection.TRN.add(sql, args, many=True)
-                qdb.sql_connection.TRN.execute()
+                artifact_ids.extend([aid] * len(samps))
+                sample_ids.extend(samps)
+            if not sample_ids:
+                return
+
+            # a single set-based insert; the primary key of analysis_sample
+            # takes care of the samples that were already selected
+            sql = """INSERT INTO qiita.analysis_sample
+                        (analysis_id, artifact_id, sample_id)
+                     SELECT DISTINCT %s, artifact_id, sample_id
+                     FROM unnest(%s::bigint[], %s::varchar[])
+                        AS s (artifact_id, sample_id)
+                     ON CONFLICT DO NOTHING"""
+            qdb.sql_connection.TRN.add(sql, [self._id, artifact_ids, sample_ids])
+            qdb.sql_connection.TRN.execute()
 
     def remove_samples(self, artifacts=None, samples=None):
         """Removes samples from the analysis
@@ -903,25 +905,23 @@ class Analysis(qdb.base.QiitaObject):
             if artifacts and samples:
                 sql = """DELETE FROM qiita.analysis_sample
                          WHERE analysis_id = %s
-                            AND artifact_id = %s
-                            AND sample_id = %s"""
-                # Build the SQL arguments to remove the samples of the
-                # given artifacts.
-                args = [[self._id, a.id, s] for a, s in product(artifacts, samples)]
+                            AND artifact_id = ANY(%s)
+                            AND sample_id = ANY(%s)"""
+                args = [self._id, [a.id for a in artifacts], list(samples)]
             elif artifacts:
                 sql = """DELETE FROM qiita.analysis_sample
-                         WHERE analysis_id = %s AND artifact_id = %s"""
-                args = [[self._id, a.id] for a in artifacts]
+                         WHERE analysis_id = %s AND artifact_id = ANY(%s)"""
+                args = [self._id, [a.id for a in artifacts]]
             elif samples:
                 sql = """DELETE FROM qiita.analysis_sample
-                         WHERE analysis_id = %s AND sample_id = %s"""
-                args = [[self._id, s] for s in samples]
+                         WHERE analysis_id = %s AND sample_id = ANY(%s)"""
+                args = [self._id, list(samples)]
             else:
                 raise IncompetentQiitaDeveloperError(
                     "Must provide list of samples and/or proc_data for removal"
                 )
 
-            qdb.sql_connection.TRN.add(sql, args, many=True)
+            qdb.sql_connection.TRN.add(sql, args)
             qdb.sql_connection.TRN.execute()
 
     def build_files(self, merge_duplicated_sample_ids, categories=None):
@@ -1239,6 +1239,48 @@ class Analysis(qdb.base.QiitaObject):
             )
 
             self._add_file("%d_analysis_mapping.txt" % self._id, "plain_text")
+            # the sample ids are also a column of the mapping file
+            self._update_statistics(merged_map.shape[0], merged_map.shape[1] + 1)
+
+    def _update_statistics(self, samples=None, columns=None):
+        """Stores the size of the mapping file and artifacts of the analysis
+
+        Parameters
+        ----------
+        samples, columns : int, optional
+            The number of samples and columns of the mapping file. If not
+            provided they are read from the mapping file
+
+        Returns
+        -------
+        tuple of (int, int, dict of {str: int}) or None
+            The number of samples and columns of the mapping file and the
+            total size of the files of the artifacts of the analysis by
+            filepath type, None if the analysis doesn't have a mapping file
+
+        Notes
+        -----
+        The statistics are used by ProcessingJob.shape
+        """
+        with qdb.sql_connection.TRN:
+            if samples is None or columns is None:
+                mapping_file = self.mapping_file
+                if mapping_file is None:
+                    return None
+                mfp = qdb.util.get_filepath_information(mapping_file)["fullpath"]
+                samples, columns = pd.read_csv(mfp, sep="\t", dtype=str).shape
+            sizes = qdb.util.get_artifacts_filepath_sizes(self.samples)
+            sql = """INSERT INTO qiita.analysis_statistics
+                        (analysis_id, samples, columns, filepath_sizes)
+                     VALUES (%s, %s, %s, %s)
+                     ON CONFLICT (analysis_id) DO UPDATE
+                     SET samples = EXCLUDED.samples,
+                         columns = EXCLUDED.columns,
+                         filepath_sizes = EXCLUDED.filepath_sizes,
+                         updated = NOW()"""
+            qdb.sql_connection.TRN.add(sql, [self._id, samples, columns, dumps(sizes)])
+            qdb.sql_connection.TRN.execute()
+        return samples, columns, sizes
 
     def _add_file(self, filename, filetype, data_type=None):
         """adds analysis item to database
@@ -199,6 +199,7 @@ class Artifact(qdb.base.QiitaObject):
                         (data_type, mountpoint, subdirectory, active)
                         VALUES (%s, %s, %s, %s)"""
             qdb.sql_connection.TRN.add(sql, [name, mp, True, True])
+            qdb.util.clear_lookup_tables_cache()
 
             # We are intersted in the dirpath
             create_nested_path(qdb.util.get_mountpoint(name)[0][1])
@@ -379,6 +379,7 @@ def drop_and_rebuild_tst_database(drop_labcontrol=False):
         patch(test=True)
 
         qdb.sql_connection.TRN.execute()
+        qdb.util.clear_lookup_tables_cache()
 
 
 def reset_test_database(wrapped_fn):
@@ -474,6 +475,8 @@ def patch(patches_dir=PATCHES_DIR, verbose=False, test=False):
                     qdb.sql_connection.TRN.add(test_sql.read())
 
             qdb.sql_connection.TRN.execute()
+            # the patches can change the lookup tables
+            qdb.util.clear_lookup_tables_cache()
 
             if exists(py_patch_fp):
                 if verbose:
@@ -488,3 +491,65 @@ def patch(patches_dir=PATCHES_DIR, verbose=False, test=False):
         # require too many dev hours so the easiest is just do it here
     if test:
         qdb.study.Study(1).sample_template.generate_files()
+
+
+def consolidate_metadata_templates(verbose=False):
+    """Moves the sample and prep information files to the consolidated storage
+
+    Each template table (qiita.sample_X/qiita.prep_X) is moved to the
+    partitioned qiita.metadata_template_values table and replaced by a view
+    with the same name, and the new templates are created in the consolidated
+    storage. Each template is moved in its own transaction, so the migration
+    can be interrupted and resumed.
+
+    Parameters
+    ----------
+    verbose : bool, optional
+        If True, print the templates as they are moved. Default: False
+
+    Returns
+    -------
+    int
+        The number of templates moved
+    """
+    with qdb.sql_connection.TRN:
+        qdb.sql_connection.TRN.add(
+            "UPDATE qiita.metadata_template_settings SET consolidated_storage = true"
+        )
+        sql = """SELECT 'sample', study_id FROM qiita.study
+                 UNION
+                 SELECT 'prep', prep_template_id FROM qiita.prep_template
+                 ORDER BY 1, 2"""
+        qdb.sql_connection.TRN.add(sql)
+        templates = qdb.sql_connection.TRN.execute_fetchindex()
+
+    moved = 0
+    sql = "SELECT qiita.consolidate_metadata_template(%s, %s)"
+    for ttype, tid in templates:
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, [ttype, tid])
+            if qdb.sql_connection.TRN.execute_fetchlast():
+                moved += 1
+                if verbose:
+                    print("Moved %s information %d" % (ttype, tid))
+
+    return moved
+
+
+def set_background_template_files(background):
+    """Sets whether the sample and prep information files are generated in
+    the background
+
+    Parameters
+    ----------
+    background : bool
+        If True, the changes to the information files queue the generation
+        of their files, which are generated by
+        qiita_db.metadata_template.util.generate_queued_template_files.
+        Otherwise, the files are generated when the information changes
+    """
+    with qdb.sql_connection.TRN:
+        sql = """UPDATE qiita.metadata_template_settings
+                 SET background_file_generation = %s"""
+        qdb.sql_connection.TRN.add(sql, [background])
+        qdb.sql_connection.TRN.execute()
@@ -362,7 +362,9 @@ class APIArtifactHandler(OauthBaseHandler):
             # adding default pipeline to the preparation
             pt = qdb.metadata_template.prep_template.PrepTemplate(prep_id)
             pt.add_default_workflow(user, pwk)
-            pwk.submit()
+            # the plugins add the default workflow to many preparations at
+            # once, so they are submitted after the rest of the jobs
+            pwk.submit(bulk=True)
         else:
             new_job = PJ.create(user, params, True)
             new_job.submit()
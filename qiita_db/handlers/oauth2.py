@@ -11,6 +11,7 @@ import functools
 from base64 import urlsafe_b64decode
 from random import SystemRandom
 from string import ascii_letters, digits
+from time import monotonic
 from traceback import format_exception
 
 from tornado.web import RequestHandler
@@ -23,6 +24,90 @@ from qiita_core.exceptions import (
 )
 from qiita_core.qiita_settings import r_client
 
+# Daily request limit for password style tokens
+DAILY_LIMIT = 5000
+DAILY_LIMIT_TIMEOUT = 86400
+
+# Seconds a validated client token is trusted without asking redis again, and
+# max number of tokens kept in memory; a token is never cached past its expiry
+# but a token deleted from redis is still accepted by the processes that
+# cached it for up to TOKEN_CACHE_TTL seconds
+TOKEN_CACHE_TTL = 5
+TOKEN_CACHE_MAX_SIZE = 10000
+_token_cache = {}
+
+# Validates the token and applies the daily limit in a single round trip. The
+# script runs atomically in redis so the limiter can't race between requests.
+# Returns [status, grant_type, ttl]; status is 0 if the token doesn't exist, 1
+# if the request is allowed and 2 if the daily limit has been reached, and ttl
+# is the milliseconds until the token expires (-1 if it doesn't expire)
+_AUTHENTICATE_LUA = """
+local info = redis.call('HGETALL', KEYS[1])
+if #info == 0 then
+    return {0, '', 0}
+end
+local token = {}
+for i = 1, #info, 2 do
+    token[info[i]] = info[i + 1]
+end
+if token['grant_type'] == 'password' then
+    local limit_key = token['client_id'] .. '_' .. token['user'] ..
+        '_daily_limit'
+    if redis.call('EXISTS', limit_key) == 0 then
+        redis.call('SETEX', limit_key, ARGV[1], ARGV[2])
+    elseif redis.call('DECR', limit_key) <= 0 then
+        return {2, token['grant_type'], 0}
+    end
+end
+return {1, token['grant_type'], redis.call('PTTL', KEYS[1])}
+"""
+# register_script uses EVALSHA and only sends the full script body if redis
+# doesn't have it cached already
+_authenticate_script = r_client.register_script(_AUTHENTICATE_LUA)
+
+
+def _check_token(token):
+    """Validates the token and applies the daily rate limit
+
+    Parameters
+    ----------
+    token : str
+        The access token sent by the client
+
+    Returns
+    -------
+    int
+        0 if the token has timed out or never existed, 1 if the request is
+        allowed and 2 if the daily limit has been reached
+
+    Notes
+    -----
+    Client tokens are not rate limited so they are kept in memory for
+    TOKEN_CACHE_TTL seconds, or until they expire if that's sooner, avoiding
+    any redis access on repeated requests. This means that a client token
+    deleted from redis is still accepted for up to TOKEN_CACHE_TTL seconds.
+    Password tokens always go to redis as the limiter must be decremented.
+    """
+    now = monotonic()
+    expires = _token_cache.get(token)
+    if expires is not None:
+        if expires > now:
+            return 1
+        del _token_cache[token]
+
+    status, grant_type, ttl = _authenticate_script(
+        keys=[token], args=[DAILY_LIMIT_TIMEOUT, DAILY_LIMIT]
+    )
+    if status == 1 and grant_type == b"client":
+        cache_ttl = TOKEN_CACHE_TTL if ttl < 0 else min(TOKEN_CACHE_TTL, ttl / 1000)
+        if len(_token_cache) >= TOKEN_CACHE_MAX_SIZE:
+            for t in [t for t, e in _token_cache.items() if e <= now]:
+                del _token_cache[t]
+            if len(_token_cache) >= TOKEN_CACHE_MAX_SIZE:
+                _token_cache.clear()
+        _token_cache[token] = now + cache_ttl
+    return status
+
 
 def _oauth_error(handler, error_msg, error):
     """Set expected status and error formatting for Oauth2 style error
@@ -85,31 +170,18 @@ def authenticate_oauth(f):
             _oauth_error(handler, "Oauth2 error: invalid access token", "invalid_grant")
             return
 
-        token = token_info[1]
-        db_token = r_client.hgetall(token)
-        if not db_token:
+        status = _check_token(token_info[1])
+        if status == 0:
             # token has timed out or never existed
             _oauth_error(handler, "Oauth2 error: token has timed out", "invalid_grant")
             return
-        # Check daily rate limit for key if password style key
-        if db_token[b"grant_type"] == b"password":
-            limit_key = "%s_%s_daily_limit" % (
-                db_token[b"client_id"].decode("ascii"),
-                db_token[b"user"].decode("ascii"),
+        if status == 2:
+            _oauth_error(
+                handler,
+                "Oauth2 error: daily request limit reached",
+                "invalid_grant",
             )
-            limiter = r_client.get(limit_key)
-            if limiter is None:
-                # Set limit to 5,000 requests per day
-                r_client.setex(limit_key, 86400, 5000)
-            else:
-                r_client.decr(limit_key)
-                if int(r_client.get(limit_key)) <= 0:
-                    _oauth_error(
-                        handler,
-                        "Oauth2 error: daily request limit reached",
-                        "invalid_grant",
-                    )
-                    return
+            return
 
         return f(handler, *args, **kwargs)
 
@@ -236,10 +308,8 @@ class TokenAuthHandler(OauthBaseHandler):
         if grant_type == "password":
             # Check if client has access limit key, and if not, create it
             limit_key = "%s_%s_daily_limit" % (client_id, user)
-            limiter = r_client.get(limit_key)
-            if limiter is None:
-                # Set limit to 5,000 requests per day
-                r_client.setex(limit_key, 86400, 5000)
+            # Set limit to DAILY_LIMIT requests per day, only if not set
+            r_client.set(limit_key, DAILY_LIMIT, ex=DAILY_LIMIT_TIMEOUT, nx=True)
 
         self.write(
             {"access_token": token, "token_type": "Bearer", "expires_in": timeout}
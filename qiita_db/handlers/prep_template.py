@@ -73,11 +73,15 @@ class PrepTemplateDBHandler(OauthBaseHandler):
         """
         with qdb.sql_connection.TRN:
             pt = _get_prep_template(prep_id)
+            sid = pt.study_id
+            # the job reading the files needs the latest changes, even if
+            # their generation is queued
+            pt.generate_queued_files()
+            qdb.study.Study(sid).sample_template.generate_queued_files()
             prep_files = [
                 fp for _, fp in pt.get_filepaths() if "qiime" not in basename(fp)
             ]
             artifact = pt.artifact.id if pt.artifact is not None else None
-            sid = pt.study_id
             response = {
                 "data_type": pt.data_type(),
                 "artifact": artifact,
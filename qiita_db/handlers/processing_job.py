@@ -138,18 +138,9 @@ class CompleteHandler(OauthBaseHandler):
             if job.status != "running":
                 raise HTTPError(403, "Can't complete job: not in a running state")
 
-            qiita_plugin = qdb.software.Software.from_name_and_version("Qiita", "alpha")
-            cmd = qiita_plugin.get_command("complete_job")
-            params = qdb.software.Parameters.load(
-                cmd,
-                values_dict={
-                    "job_id": job_id,
-                    "payload": self.request.body.decode("ascii"),
-                },
-            )
-            # complete_job are unique so it is fine to force them to be created
-            job = qdb.processing_job.ProcessingJob.create(job.user, params, force=True)
-            job.submit()
+            qdb.processing_job.queue_completion(job, self.request.body.decode("ascii"))
+
+        qdb.processing_job.dispatch_completions()
 
         self.finish()
 
@@ -6,9 +6,11 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 from json import loads
+from time import monotonic
 from unittest import main
 
 from qiita_core.qiita_settings import r_client
+from qiita_db.handlers.oauth2 import _token_cache
 from qiita_pet.test.tornado_test_base import TestHandlerBase
 
 
@@ -38,6 +40,7 @@ class OAuth2BaseHandlerTests(TestHandlerBase):
         # Create test access limit token
         self.user_rate_key = "testuser_test@foo.bar_daily_limit"
         r_client.setex(self.user_rate_key, 5, 2)
+        _token_cache.clear()
         super(OAuth2BaseHandlerTests, self).setUp()
 
     def test_authenticate_header_client(self):
@@ -67,6 +70,57 @@ class OAuth2BaseHandlerTests(TestHandlerBase):
         }
         self.assertEqual(loads(obs.body), exp)
 
+    def test_authenticate_header_username_no_limit_key(self):
+        r_client.delete(self.user_rate_key)
+        obs = self.get(
+            "/qiita_db/artifacts/1/",
+            headers={"Authorization": "Bearer " + self.user_token},
+        )
+        self.assertEqual(obs.code, 200)
+        # the first request creates the limiter without decrementing it
+        self.assertEqual(int(r_client.get(self.user_rate_key)), 5000)
+        obs = self.get(
+            "/qiita_db/artifacts/1/",
+            headers={"Authorization": "Bearer " + self.user_token},
+        )
+        self.assertEqual(obs.code, 200)
+        self.assertEqual(int(r_client.get(self.user_rate_key)), 4999)
+
+    def test_authenticate_header_client_cached(self):
+        obs = self.get(
+            "/qiita_db/artifacts/1/",
+            headers={"Authorization": "Bearer " + self.client_token},
+        )
+        self.assertEqual(obs.code, 200)
+        self.assertIn(self.client_token, _token_cache)
+
+        # the token is removed from redis but it's still valid in memory
+        r_client.delete(self.client_token)
+        obs = self.get(
+            "/qiita_db/artifacts/1/",
+            headers={"Authorization": "Bearer " + self.client_token},
+        )
+        self.assertEqual(obs.code, 200)
+
+        # once the cache entry expires redis is checked again
+        _token_cache[self.client_token] = 0
+        obs = self.get(
+            "/qiita_db/artifacts/1/",
+            headers={"Authorization": "Bearer " + self.client_token},
+        )
+        self.assertEqual(obs.code, 400)
+        self.assertNotIn(self.client_token, _token_cache)
+
+    def test_authenticate_header_client_cached_expiry(self):
+        # the token is not cached past its expiry
+        r_client.pexpire(self.client_token, 500)
+        obs = self.get(
+            "/qiita_db/artifacts/1/",
+            headers={"Authorization": "Bearer " + self.client_token},
+        )
+        self.assertEqual(obs.code, 200)
+        self.assertLessEqual(_token_cache[self.client_token] - monotonic(), 0.5)
+
     def test_authenticate_header_missing(self):
         obs = self.get("/qiita_db/artifacts/100/")
         self.assertEqual(obs.code, 400)
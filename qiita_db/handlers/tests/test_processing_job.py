@@ -12,12 +12,14 @@ from os import close, remove
 from os.path import exists
 from tempfile import mkstemp
 from unittest import TestCase, main
+from unittest.mock import patch
 
 import numpy.testing as npt
 import pandas as pd
 from tornado.web import HTTPError
 
 import qiita_db as qdb
+from qiita_core.qiita_settings import qiita_config
 from qiita_core.testing import wait_for_processing_job
 from qiita_db.handlers.processing_job import _get_job
 from qiita_db.handlers.tests.oauthbase import OauthTestingBase
@@ -260,7 +262,62 @@ class CompleteHandlerTests(OauthTestingBase):
         self.assertEqual(obs.code, 200)
         self.assertEqual(job.status, "success")
         self.assertEqual(qdb.util.get_count("qiita.artifact"), exp_artifact_count)
-        # and now that is not None
+        # the job was completed by the server so there is no complete_job
+        self.assertIsNone(job.complete_processing_job)
+        self.assertEqual(
+            job.trace,
+            [
+                f"{job.id} [Not Available] (success): Validate | "
+                "-p qiita -N 1 -n 1 --mem 90gb --time 150:00:00 --nice=10000",
+            ],
+        )
+
+    def test_post_job_success_escalated(self):
+        pt = npt.assert_warns(
+            qdb.exceptions.QiitaDBWarning,
+            qdb.metadata_template.prep_template.PrepTemplate.create,
+            pd.DataFrame({"new_col": {"1.SKD6.640190": 1}}),
+            qdb.study.Study(1),
+            "16S",
+        )
+        job = qdb.processing_job.ProcessingJob.create(
+            qdb.user.User("test@foo.bar"),
+            qdb.software.Parameters.load(
+                qdb.software.Command.get_validator("BIOM"),
+                values_dict={
+                    "template": pt.id,
+                    "files": dumps({"BIOM": ["file"]}),
+                    "artifact_type": "BIOM",
+                },
+            ),
+        )
+        job._set_status("running")
+
+        fd, fp = mkstemp(suffix="_table.biom")
+        close(fd)
+        with open(fp, "w") as f:
+            f.write("\n")
+
+        self._clean_up_files.append(fp)
+
+        payload = dumps(
+            {
+                "success": True,
+                "error": "",
+                "artifacts": {
+                    "OTU table": {"filepaths": [(fp, "biom")], "artifact_type": "BIOM"}
+                },
+            }
+        )
+        # the files are larger than the max size so the completion is
+        # escalated to a complete_job
+        with patch.object(qiita_config, "job_scheduler_completion_max_size", 0):
+            obs = self.post(
+                "/qiita_db/jobs/%s/complete/" % job.id, payload, headers=self.header
+            )
+        wait_for_processing_job(job.id)
+        self.assertEqual(obs.code, 200)
+        self.assertEqual(job.status, "success")
         cj = job.complete_processing_job
         self.assertIsNotNone(cj)
         # additionally we can test that job.print_trace is correct
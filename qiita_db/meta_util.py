@@ -14,6 +14,7 @@ Methods
     :toctree: generated/
 
     get_lat_longs
+    search_metadata
 """
 
 # -----------------------------------------------------------------------------
@@ -50,6 +51,22 @@ from qiita_db.util import (
     retrieve_resource_data,
 )
 
+# max number of points shown in the stats page map
+STATS_MAP_MAX_POINTS = 10000
+
+# the operators supported by search_metadata and the SQL condition they use
+# in qiita.metadata_search_value; note that the range operators only match
+# numeric values
+METADATA_SEARCH_OPERATORS = {
+    "=": "value = %s",
+    "!=": "value != %s",
+    "<": "numeric_value < %s",
+    "<=": "numeric_value <= %s",
+    ">": "numeric_value > %s",
+    ">=": "numeric_value >= %s",
+    "contains": "value ILIKE %s",
+}
+
 # global constant list used in resource_allocation_page
 COLUMNS = [
     "sName",
@@ -270,7 +287,7 @@ def update_redis_stats():
     num_users = qdb.util.get_count("qiita.qiita_user")
     num_processing_jobs = qdb.util.get_count("qiita.processing_job")
 
-    lat_longs = dumps(get_lat_longs())
+    lat_longs = dumps(get_lat_longs(max_points=STATS_MAP_MAX_POINTS))
 
     summary = {}
     all_dates = []
@@ -384,13 +401,28 @@ def update_redis_stats():
     return missing_files
 
 
-def get_lat_longs():
+def get_lat_longs(max_points=None, precision=1):
     """Retrieve the latitude and longitude of all the public samples in the DB
 
+    Parameters
+    ----------
+    max_points : int, optional
+        If given, the coordinates of each study are clustered in a grid of
+        `precision` decimal places, and the grid is made coarser (down to
+        100 degrees) until there are at most max_points clusters; every
+        cluster is returned, so isolated samples are kept. If even the
+        coarsest grid has too many clusters, the studies are merged in each
+        cluster and the ones with the most samples are returned. Default:
+        all the samples.
+    precision : int, optional
+        The number of decimal places of the finest clustering grid. Default:
+        1, around 11km at the equator.
+
     Returns
     -------
-    list of [float, float]
-        The latitude and longitude for each sample in the database
+    list of [int, float, float]
+        The study id, latitude and longitude for each sample (or cluster of
+        samples) in the database
     """
     with qdb.sql_connection.TRN:
         # getting all the public studies
@@ -398,27 +430,144 @@ def get_lat_longs():
 
         results = []
         if studies:
-            # we are going to create multiple union selects to retrieve the
-            # latigute and longitude of all available studies. Note that
-            # UNION in PostgreSQL automatically removes duplicates
-            sql_query = """
-                SELECT {0}, CAST(sample_values->>'latitude' AS FLOAT),
-                       CAST(sample_values->>'longitude' AS FLOAT)
-                FROM qiita.sample_{0}
-                WHERE sample_values->>'latitude' != 'NaN' AND
-                      sample_values->>'longitude' != 'NaN' AND
-                      isnumeric(sample_values->>'latitude') AND
-                      isnumeric(sample_values->>'longitude')"""
-            sql = [sql_query.format(s.id) for s in studies]
-            sql = " UNION ".join(sql)
-            qdb.sql_connection.TRN.add(sql)
-
-            # note that we are returning set to remove duplicates
+            study_ids = tuple(s.id for s in studies)
+            if max_points is None:
+                # note that we are using DISTINCT to remove duplicates
+                sql = """SELECT DISTINCT study_id, latitude, longitude
+                         FROM qiita.sample_coordinate
+                         WHERE study_id IN %s"""
+                qdb.sql_connection.TRN.add(sql, [study_ids])
+            else:
+                sql_cells = """SELECT study_id, AVG(latitude), AVG(longitude)
+                               FROM qiita.sample_coordinate
+                               WHERE study_id IN %s
+                               GROUP BY study_id,
+                                        ROUND(latitude::numeric, %s),
+                                        ROUND(longitude::numeric, %s)"""
+                # the number of cells of each grid, from the finest to the
+                # coarsest, in a single pass
+                sql = """SELECT p, COUNT(DISTINCT (study_id,
+                                                  ROUND(latitude::numeric, p),
+                                                  ROUND(longitude::numeric, p)))
+                         FROM qiita.sample_coordinate,
+                              generate_series(%s, -2, -1) AS p
+                         WHERE study_id IN %s
+                         GROUP BY p
+                         ORDER BY p DESC"""
+                qdb.sql_connection.TRN.add(sql, [precision, study_ids])
+                grids = [
+                    p
+                    for p, cells in qdb.sql_connection.TRN.execute_fetchindex()
+                    if cells <= max_points
+                ]
+                if grids:
+                    qdb.sql_connection.TRN.add(
+                        sql_cells, [study_ids, grids[0], grids[0]]
+                    )
+                else:
+                    sql = """SELECT MIN(study_id), AVG(latitude),
+                                    AVG(longitude)
+                             FROM qiita.sample_coordinate
+                             WHERE study_id IN %s
+                             GROUP BY ROUND(latitude::numeric, -2),
+                                      ROUND(longitude::numeric, -2)
+                             ORDER BY COUNT(*) DESC
+                             LIMIT %s"""
+                    qdb.sql_connection.TRN.add(sql, [study_ids, max_points])
+
             results = qdb.sql_connection.TRN.execute_fetchindex()
 
         return results
 
 
+def search_metadata(conditions, template=None, study_ids=None):
+    """Search samples by the values of their sample and prep information
+
+    Parameters
+    ----------
+    conditions : list of (str, str, str)
+        The (column, operator, value) conditions the samples must match, the
+        operator is one of METADATA_SEARCH_OPERATORS. `contains` is a case
+        insensitive substring search and the range operators only match
+        numeric values
+    template : {'sample', 'prep'}, optional
+        Only search the sample or the prep information. Default: both
+    study_ids : iterable of int, optional
+        The studies to search. Default: all the public studies, and only the
+        preparations of those studies with public artifacts
+
+    Returns
+    -------
+    dict of {int: list of str}
+        The ids of the samples that match all the conditions by study id
+
+    Raises
+    ------
+    ValueError
+        If there are no conditions, an operator or the template are not
+        valid, or the value of a range operator is not numeric
+    """
+    if not conditions:
+        raise ValueError("At least one condition is required")
+    if template not in (None, "sample", "prep"):
+        raise ValueError("Not a valid template: %s" % template)
+
+    sql_template = ""
+    if template == "sample":
+        sql_template = " AND prep_template_id IS NULL"
+    elif template == "prep":
+        sql_template = " AND prep_template_id IS NOT NULL"
+
+    with qdb.sql_connection.TRN:
+        if study_ids is None:
+            study_ids = [s.id for s in qdb.study.Study.get_by_status("public")]
+            # a public study can have private or sandboxed preparations
+            sql_template += """ AND (prep_template_id IS NULL
+                                     OR prep_template_id IN (
+                SELECT prep_template_id
+                FROM qiita.preparation_artifact
+                    JOIN qiita.artifact USING (artifact_id)
+                    JOIN qiita.visibility USING (visibility_id)
+                WHERE visibility = 'public'))"""
+        study_ids = tuple(study_ids)
+        if not study_ids:
+            return {}
+
+        sqls = []
+        args = []
+        for column, operator, value in conditions:
+            if operator not in METADATA_SEARCH_OPERATORS:
+                raise ValueError("Not a valid operator: %s" % operator)
+            if operator == "contains":
+                value = qdb.util._like_pattern(str(value))
+            elif METADATA_SEARCH_OPERATORS[operator].startswith("numeric"):
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    raise ValueError(
+                        "%s %s needs a numeric value: %s" % (column, operator, value)
+                    )
+            else:
+                value = str(value)
+            sqls.append(
+                """SELECT study_id, sample_id
+                   FROM qiita.metadata_search_value
+                   WHERE study_id IN %s{0} AND column_name = %s
+                        AND {1}""".format(
+                    sql_template, METADATA_SEARCH_OPERATORS[operator]
+                )
+            )
+            args.extend([study_ids, column, value])
+
+        sql = """SELECT study_id, array_agg(sample_id ORDER BY sample_id)
+                 FROM ({0}) AS matches
+                 GROUP BY study_id
+                 ORDER BY study_id""".format(" INTERSECT ".join(sqls))
+        qdb.sql_connection.TRN.add(sql, args)
+
+        return dict(qdb.sql_connection.TRN.execute_fetchindex())
+
+
 def generate_biom_and_metadata_release(study_status="public"):
     """Generate a list of biom/meatadata filepaths and a tgz of those files
 
@@ -429,6 +578,7 @@ def generate_biom_and_metadata_release(study_status="public"):
         to 'public' but having this exposed helps with testing. The other
         options are 'private' and 'sandbox'
     """
+    PT = qdb.metadata_template.prep_template.PrepTemplate
     studies = qdb.study.Study.get_by_status(study_status)
     qiita_config = ConfigurationManager()
     working_dir = qiita_config.working_dir
@@ -448,21 +598,23 @@ def generate_biom_and_metadata_release(study_status="public"):
             merging_schemes, parent_softwares = a.merging_scheme
             software = a.processing_parameters.command.software
             software = "%s v%s" % (software.name, software.version)
+            prep_templates = a.prep_templates
+            prep_values = PT.get_categories(
+                ["platform", "target_gene"], templates=prep_templates
+            )
 
             for x in a.filepaths:
                 if x["fp_type"] != "biom" or "only-16s" in x["fp"]:
                     continue
                 fp = relpath(x["fp"], bdir)
-                for pt in a.prep_templates:
-                    categories = pt.categories
-                    platform = ""
-                    target_gene = ""
-                    if "platform" in categories:
-                        platform = ", ".join(set(pt.get_category("platform").values()))
-                    if "target_gene" in categories:
-                        target_gene = ", ".join(
-                            set(pt.get_category("target_gene").values())
-                        )
+                for pt in prep_templates:
+                    values = prep_values[pt.id]
+                    platform = ", ".join(
+                        set(v for v in values["platform"] if v is not None)
+                    )
+                    target_gene = ", ".join(
+                        set(v for v in values["target_gene"] if v is not None)
+                    )
                     for _, prep_fp in pt.get_filepaths():
                         if "qiime" not in prep_fp:
                             break
@@ -16,7 +16,10 @@ Classes
     BaseSample
     Sample
     PrepSample
+    SampleSnapshot
+    LazySample
     MetadataTemplate
+    MetadataTemplateSnapshot
     SampleTemplate
     PrepTemplate
 
@@ -36,14 +39,18 @@ Methods
 # -----------------------------------------------------------------------------
 import warnings
 from copy import deepcopy
-from datetime import datetime
+from filecmp import cmp
 from itertools import chain
 from json import dumps, loads
+from os import remove, rename
+from os.path import exists
 from string import ascii_letters, digits
+from time import perf_counter
 
 import numpy as np
 import pandas as pd
 from iteration_utilities import duplicates
+from six import StringIO
 
 import qiita_db as qdb
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
@@ -329,6 +336,8 @@ class BaseSample(qdb.base.QiitaObject):
 
             qdb.sql_connection.TRN.execute()
 
+            self._md_template._update_search_values([self._id])
+
     def __delitem__(self, key):
         r"""Removes the sample with sample id `key` from the database
 
@@ -429,6 +438,208 @@ class BaseSample(qdb.base.QiitaObject):
             return None
 
 
+class SampleSnapshot(object):
+    r"""Read-only, in memory, metadata of a sample
+
+    Implements the same mapping protocol than BaseSample but without
+    accessing the database, see MetadataTemplate.snapshot
+
+    Parameters
+    ----------
+    sample_id : str
+        The sample id
+    values : dict of {str: str}
+        The metadata of the sample in the form {category: value}
+
+    See Also
+    --------
+    BaseSample
+    LazySample
+    MetadataTemplateSnapshot
+    """
+
+    def __init__(self, sample_id, values):
+        self._id = sample_id
+        self._values = values
+
+    @property
+    def id(self):
+        """The sample id"""
+        return self._id
+
+    def _get_values(self):
+        return self._values
+
+    def __hash__(self):
+        r"""Defines the hash function so samples are hashable"""
+        return hash(self._id)
+
+    def __eq__(self, other):
+        r"""Self and other are equal based on type, id and values"""
+        if not isinstance(other, SampleSnapshot):
+            return False
+        return other._id == self._id and other._get_values() == self._get_values()
+
+    def __len__(self):
+        return len(self._get_values())
+
+    def __getitem__(self, key):
+        key = key.lower()
+        values = self._get_values()
+        if key not in values:
+            raise KeyError(
+                "Metadata category %s does not exists for sample %s" % (key, self._id)
+            )
+        return values[key]
+
+    def __iter__(self):
+        return iter(self._get_values())
+
+    def __contains__(self, key):
+        return key.lower() in self._get_values()
+
+    def keys(self):
+        return self._get_values().keys()
+
+    def values(self):
+        return self._get_values().values()
+
+    def items(self):
+        return self._get_values().items()
+
+    def get(self, key):
+        return self._get_values().get(key.lower())
+
+
+class LazySample(SampleSnapshot):
+    r"""Read-only sample that doesn't access the database until a value is
+    read, at which point all its metadata is retrieved in a single query
+
+    Parameters
+    ----------
+    sample_id : str
+        The sample id
+    md_template : MetadataTemplate
+        The metadata template to which the sample belongs to
+
+    Raises
+    ------
+    QiitaDBUnknownIDError
+        When reading a value, if `sample_id` is not in md_template
+    """
+
+    def __init__(self, sample_id, md_template):
+        super(LazySample, self).__init__(sample_id, None)
+        self._md_template = md_template
+
+    def _get_values(self):
+        if self._values is None:
+            with qdb.sql_connection.TRN:
+                sql = """SELECT sample_values
+                         FROM qiita.{0}
+                         WHERE sample_id = %s""".format(
+                    self._md_template._table_name(self._md_template.id)
+                )
+                qdb.sql_connection.TRN.add(sql, [self._id])
+                values = qdb.sql_connection.TRN.execute_fetchflatten()
+            if not values or self._id == QIITA_COLUMN_NAME:
+                raise qdb.exceptions.QiitaDBUnknownIDError(
+                    self._id, self.__class__.__name__
+                )
+            self._values = values[0]
+        return self._values
+
+
+class MetadataTemplateSnapshot(object):
+    r"""Read-only, in memory, copy of a metadata template
+
+    Implements the same mapping protocol than MetadataTemplate, with
+    SampleSnapshot as values, from a single query to the database; see
+    MetadataTemplate.snapshot
+
+    Parameters
+    ----------
+    md_template : MetadataTemplate
+        The metadata template
+    samples : iterable of str, optional
+        The sample ids to retrieve. Defaults to all the samples
+
+    Attributes
+    ----------
+    id
+    categories
+
+    See Also
+    --------
+    MetadataTemplate
+    SampleSnapshot
+    """
+
+    def __init__(self, md_template, samples=None):
+        self._id = md_template.id
+        with qdb.sql_connection.TRN:
+            sql = """SELECT sample_id, sample_values
+                     FROM qiita.{0}""".format(md_template._table_name(self._id))
+            sql_args = None
+            if samples is not None:
+                sql += " WHERE sample_id IN %s OR sample_id = %s"
+                sql_args = [tuple(samples) or (None,), QIITA_COLUMN_NAME]
+            qdb.sql_connection.TRN.add(sql + " ORDER BY sample_id", sql_args)
+            rows = qdb.sql_connection.TRN.execute_fetchindex()
+
+        self._categories = []
+        self._samples = {}
+        for sample_id, values in rows:
+            if sample_id == QIITA_COLUMN_NAME:
+                self._categories = sorted(values["columns"])
+            else:
+                self._samples[sample_id] = SampleSnapshot(sample_id, values)
+
+    @property
+    def id(self):
+        """The id of the metadata template"""
+        return self._id
+
+    @property
+    def categories(self):
+        """The metadata categories of the template
+
+        Returns
+        -------
+        list of str
+            The sorted metadata categories
+        """
+        return self._categories
+
+    def __len__(self):
+        return len(self._samples)
+
+    def __getitem__(self, key):
+        if key not in self._samples:
+            raise KeyError(
+                "Sample id %s does not exists in template %d" % (key, self._id)
+            )
+        return self._samples[key]
+
+    def __iter__(self):
+        return iter(self._samples)
+
+    def __contains__(self, key):
+        return key in self._samples
+
+    def keys(self):
+        return self._samples.keys()
+
+    def values(self):
+        return self._samples.values()
+
+    def items(self):
+        return self._samples.items()
+
+    def get(self, key):
+        return self._samples.get(key)
+
+
 class MetadataTemplate(qdb.base.QiitaObject):
     r"""Metadata map object that accesses the db to get the sample/prep
     template information
@@ -450,6 +661,8 @@ class MetadataTemplate(qdb.base.QiitaObject):
     values
     items
     get
+    snapshot
+    lazy_sample
     to_file
     add_filepath
     update
@@ -609,15 +822,13 @@ class MetadataTemplate(qdb.base.QiitaObject):
                 set(duplicates(md_template.columns))
             )
 
-        # validate the INSDC_NULL_VALUES
-        _df = md_template.fillna("").applymap(str).applymap(str.lower)
-        _ddf = _df[_df.isin(INSDC_NULL_VALUES.keys()).any(axis=1)]
-        if _ddf.shape[0] != 0:
-            for c in _ddf.columns:
-                if set(INSDC_NULL_VALUES) & set(_ddf[c].values):
-                    for s, v in _ddf[c].to_dict().items():
-                        if v in INSDC_NULL_VALUES:
-                            md_template[c][s] = INSDC_NULL_VALUES[v]
+        # validate the INSDC_NULL_VALUES, column by column
+        _df = md_template.fillna("").astype(str).apply(lambda c: c.str.lower())
+        nulls = _df.isin(INSDC_NULL_VALUES.keys())
+        for c in nulls.columns[nulls.any().values]:
+            md_template[c] = md_template[c].mask(
+                nulls[c], _df[c].map(INSDC_NULL_VALUES)
+            )
 
         return md_template
 
@@ -631,9 +842,20 @@ class MetadataTemplate(qdb.base.QiitaObject):
             The metadata template file contents indexed by sample ids
         obj_id : int
             The id of the object being created
+
+        Returns
+        -------
+        dict of {str: float}
+            The seconds spent in each of the steps
+
+        Notes
+        -----
+        The rows are streamed to the database with COPY, and the values are
+        encoded to JSON for all the samples at once
         """
         with qdb.sql_connection.TRN:
             cls._check_subclass()
+            timings = {}
 
             # Get some useful information from the metadata template
             sample_ids = md_template.index.tolist()
@@ -642,30 +864,50 @@ class MetadataTemplate(qdb.base.QiitaObject):
                 raise ValueError("Your info file only has sample_name")
 
             # Insert values on template_sample table
-            values = [[obj_id, s_id] for s_id in sample_ids]
-            sql = """INSERT INTO qiita.{0} ({1}, sample_id)
-                     VALUES (%s, %s)""".format(cls._table, cls._id_column)
-            qdb.sql_connection.TRN.add(sql, values, many=True)
+            start = perf_counter()
+            data = StringIO()
+            pd.DataFrame({"id": obj_id, "sample_id": sample_ids}).to_csv(
+                data, header=False, index=False
+            )
+            data.seek(0)
+            qdb.sql_connection.TRN.add_copy(
+                "qiita.%s" % cls._table, [cls._id_column, "sample_id"], data
+            )
+            qdb.sql_connection.TRN.execute()
+            timings["link_samples"] = perf_counter() - start
 
-            # Create table with custom columns
+            # Create table with custom columns; depending on the storage of
+            # the database this is a table or a view of the consolidated
+            # qiita.metadata_template_values table
+            start = perf_counter()
             table_name = cls._table_name(obj_id)
-            sql = """CREATE TABLE qiita.{0} (
-                        sample_id VARCHAR NOT NULL PRIMARY KEY,
-                        sample_values JSONB NOT NULL)""".format(table_name)
-            qdb.sql_connection.TRN.add(sql)
-
-            values = dumps({"columns": md_template.columns.tolist()})
-            sql = """INSERT INTO qiita.{0} (sample_id, sample_values)
-                     VALUES ('{1}', %s)""".format(table_name, QIITA_COLUMN_NAME)
-            qdb.sql_connection.TRN.add(sql, [values])
-
-            values = [(k, df.to_json()) for k, df in md_template.iterrows()]
-            sql = """INSERT INTO qiita.{0} (sample_id, sample_values)
-                     VALUES (%s, %s)""".format(table_name)
-            qdb.sql_connection.TRN.add(sql, values, many=True)
-
-            # Execute all the steps
+            sql = "SELECT qiita.create_metadata_template_storage(%s, %s)"
+            qdb.sql_connection.TRN.add(sql, [cls._table_prefix[:-1], obj_id])
+            qdb.sql_connection.TRN.execute()
+            timings["create_storage"] = perf_counter() - start
+
+            # one JSON document per sample, in the same order than the index
+            start = perf_counter()
+            columns = dumps({"columns": md_template.columns.tolist()})
+            values = md_template.to_json(orient="records", lines=True).splitlines()
+            data = StringIO()
+            pd.DataFrame(
+                {
+                    "sample_id": [QIITA_COLUMN_NAME] + sample_ids,
+                    "sample_values": [columns] + values,
+                }
+            ).to_csv(data, header=False, index=False)
+            data.seek(0)
+            timings["encode_values"] = perf_counter() - start
+
+            start = perf_counter()
+            qdb.sql_connection.TRN.add_copy(
+                "qiita.%s" % table_name, ["sample_id", "sample_values"], data
+            )
             qdb.sql_connection.TRN.execute()
+            timings["copy_values"] = perf_counter() - start
+
+            return timings
 
     @classmethod
     def metadata_headers(cls):
@@ -679,13 +921,8 @@ class MetadataTemplate(qdb.base.QiitaObject):
         with qdb.sql_connection.TRN:
             sql = """SELECT DISTINCT table_name
                      FROM information_schema.columns
-                     WHERE table_name LIKE '{0}%' AND
-                        table_name != 'sample_template_filepath' AND
-                        table_name != 'prep_template_filepath' AND
-                        table_name != 'prep_template_sample' AND
-                        table_name != 'prep_template_processing_job' AND
-                        table_name != 'preparation_artifact' AND
-                        table_name != 'prep_template'""".format(cls._table_prefix)
+                     WHERE table_schema = 'qiita' AND
+                        table_name ~ '^{0}[0-9]+$'""".format(cls._table_prefix)
             qdb.sql_connection.TRN.add(sql)
             tables = qdb.sql_connection.TRN.execute_fetchflatten()
             sql = """SELECT sample_values->>'columns'
@@ -744,6 +981,8 @@ class MetadataTemplate(qdb.base.QiitaObject):
                     "You cannot delete all samples from an information file"
                 )
 
+            qdb.study.Study(self.study_id).clear_prep_samples_membership()
+
             self.generate_files(samples=sample_names)
 
     def delete_column(self, column_name):
@@ -943,6 +1182,9 @@ class MetadataTemplate(qdb.base.QiitaObject):
             # Execute all the steps
             qdb.sql_connection.TRN.execute()
 
+            if new_samples:
+                qdb.study.Study(self.study_id).clear_prep_samples_membership()
+
         return new_samples, new_cols
 
     def unique_ids(self):
@@ -1150,6 +1392,42 @@ class MetadataTemplate(qdb.base.QiitaObject):
         except KeyError:
             return None
 
+    def snapshot(self, samples=None):
+        r"""Returns a read-only, in memory, copy of the template
+
+        Parameters
+        ----------
+        samples : iterable of str, optional
+            The sample ids to retrieve. Defaults to all the samples
+
+        Returns
+        -------
+        MetadataTemplateSnapshot
+            The snapshot of the template
+
+        Notes
+        -----
+        Iterating over the template or its samples queries the database for
+        each sample and value; use this when reading many of them
+        """
+        return MetadataTemplateSnapshot(self, samples=samples)
+
+    def lazy_sample(self, sample_id):
+        r"""Returns a read-only sample that doesn't access the database until
+        a value is read
+
+        Parameters
+        ----------
+        sample_id : str
+            The sample id
+
+        Returns
+        -------
+        LazySample
+            The sample
+        """
+        return LazySample(sample_id, self)
+
     def _transform_to_dict(self, values):
         r"""Transforms `values` to a dict keyed by sample id
 
@@ -1188,6 +1466,209 @@ class MetadataTemplate(qdb.base.QiitaObject):
             "generate_files should be implemented in the subclass!"
         )
 
+    def _generate_template_files(self):
+        r"""Writes the files of this template to disk
+
+        Raises
+        ------
+        QiitaDBNotImplementedError
+            This method should be implemented by the subclasses
+        """
+        raise qdb.exceptions.QiitaDBNotImplementedError(
+            "_generate_template_files should be implemented in the subclass!"
+        )
+
+    def _queue_template_files(self):
+        r"""Generates the files of this template, or queues their generation
+        if the files are generated in the background
+
+        Notes
+        -----
+        The queue has a single entry per template, so a burst of changes to a
+        template only generates the files once, for the latest change; see
+        qiita_db.metadata_template.util.generate_queued_template_files
+        """
+        with qdb.sql_connection.TRN:
+            sql = """SELECT background_file_generation
+                     FROM qiita.metadata_template_settings"""
+            qdb.sql_connection.TRN.add(sql)
+            if qdb.sql_connection.TRN.execute_fetchlast():
+                sql = """INSERT INTO qiita.metadata_template_file_queue
+                            (template_type, template_id)
+                         VALUES (%s, %s)
+                         ON CONFLICT (template_type, template_id)
+                         DO UPDATE SET requested = clock_timestamp(),
+                                       claimed = NULL"""
+                qdb.sql_connection.TRN.add(sql, [self._table_prefix[:-1], self.id])
+                qdb.sql_connection.TRN.execute()
+            else:
+                self._generate_template_files()
+
+    def generate_queued_files(self):
+        r"""Generates the files of this template now if their generation is
+        queued, so the callers reading the files get the latest changes
+
+        Returns
+        -------
+        bool
+            Whether the generation of the files was queued
+        """
+        with qdb.sql_connection.TRN:
+            sql = """DELETE FROM qiita.metadata_template_file_queue
+                     WHERE template_type = %s AND template_id = %s
+                     RETURNING template_id"""
+            qdb.sql_connection.TRN.add(sql, [self._table_prefix[:-1], self.id])
+            if not qdb.sql_connection.TRN.execute_fetchflatten():
+                return False
+            self._generate_template_files()
+            return True
+
+    def _store_template_file(self, fp, fp_type):
+        r"""Writes the template to `fp` and attaches it to the template, unless
+        its contents are the same than the latest file of the same type
+
+        Parameters
+        ----------
+        fp : str
+            The filepath to write
+        fp_type : str
+            The filepath type
+
+        Returns
+        -------
+        bool
+            Whether the file was stored
+        """
+        tmp_fp = "%s.tmp" % fp
+        try:
+            with qdb.sql_connection.TRN:
+                self.to_file(tmp_fp)
+
+                latest = [
+                    x
+                    for x in qdb.util.retrieve_filepaths(
+                        self._filepath_table,
+                        self._id_column,
+                        self.id,
+                        sort="descending",
+                    )
+                    if x["fp_type"] == fp_type
+                ]
+                # comparing the stored checksum first so the previous file is
+                # only read if it's likely to be the same
+                if latest:
+                    latest = latest[0]
+                    checksum = qdb.util.compute_checksum(tmp_fp)
+                    if (
+                        str(latest["checksum"]) == str(checksum)
+                        and exists(latest["fp"])
+                        and cmp(latest["fp"], tmp_fp, shallow=False)
+                    ):
+                        return False
+
+                rename(tmp_fp, fp)
+                self.add_filepath(
+                    fp, fp_id=qdb.util.convert_to_id(fp_type, "filepath_type")
+                )
+                return True
+        finally:
+            # the temporary file is only renamed if it's stored, so remove it
+            # if it's the same as the latest file or if writing it failed
+            if exists(tmp_fp):
+                remove(tmp_fp)
+
+    def _update_statistics(self):
+        r"""Stores the number of samples and columns of the template
+
+        Returns
+        -------
+        int, int
+            The number of samples and columns of the template
+
+        Notes
+        -----
+        The statistics are used by ProcessingJob.shape, so they must be
+        updated every time the samples or columns of the template change
+        """
+        with qdb.sql_connection.TRN:
+            samples = len(self)
+            columns = len(self.categories)
+            sql = """INSERT INTO qiita.template_statistics
+                        (template_type, template_id, samples, columns)
+                     VALUES (%s, %s, %s, %s)
+                     ON CONFLICT (template_type, template_id) DO UPDATE
+                     SET samples = EXCLUDED.samples,
+                         columns = EXCLUDED.columns, updated = NOW()"""
+            qdb.sql_connection.TRN.add(
+                sql, [self._table_prefix[:-1], self.id, samples, columns]
+            )
+            qdb.sql_connection.TRN.execute()
+        return samples, columns
+
+    def _update_search_values(self, samples=None, columns=None):
+        r"""Refreshes the template values in the metadata search projection
+
+        Parameters
+        ----------
+        samples : iterable of str, optional
+            The samples that were added/updated
+        columns : iterable of str, optional
+            The columns that were added/updated
+
+        Notes
+        -----
+        If neither samples nor columns are given all the values of the
+        template are refreshed, otherwise only the values of the given
+        samples and the values of the given columns in every sample.
+        """
+        if samples is not None:
+            samples = tuple(samples)
+        if columns is not None:
+            columns = tuple(columns)
+        if (samples is not None or columns is not None) and not (samples or columns):
+            # nothing changed
+            return
+
+        with qdb.sql_connection.TRN:
+            # the sample information is stored without prep_template_id
+            if self._id_column == "prep_template_id":
+                prep_template_id = self._id
+                sql_template = "prep_template_id = %s"
+            else:
+                prep_template_id = None
+                sql_template = "study_id = %s AND prep_template_id IS NULL"
+
+            sql_filter = ""
+            filter_args = []
+            if samples or columns:
+                sql_filter = " AND (sample_id IN %s OR {0} IN %s)"
+                # an empty tuple is not valid SQL so using a value that
+                # can't be a sample or column name
+                filter_args = [samples or ("",), columns or ("",)]
+
+            sql = """DELETE FROM qiita.metadata_search_value
+                     WHERE {0}{1}""".format(
+                sql_template, sql_filter.format("column_name")
+            )
+            qdb.sql_connection.TRN.add(sql, [self._id] + filter_args)
+
+            sql = """INSERT INTO qiita.metadata_search_value (
+                        sample_id, study_id, prep_template_id, column_name,
+                        value, numeric_value)
+                     SELECT sample_id, %s, %s, key, value,
+                        CASE WHEN value NOT IN ('NaN', 'Infinity', '-Infinity')
+                            AND isnumeric(value) THEN CAST(value AS FLOAT8) END
+                     FROM qiita.{0}, jsonb_each_text(sample_values)
+                     WHERE sample_id != '{1}'{2}""".format(
+                self._table_name(self._id),
+                QIITA_COLUMN_NAME,
+                sql_filter.format("key"),
+            )
+            qdb.sql_connection.TRN.add(
+                sql, [self.study_id, prep_template_id] + filter_args
+            )
+            qdb.sql_connection.TRN.execute()
+
     def to_file(self, fp, samples=None):
         r"""Writes the MetadataTemplate to the file `fp` in tab-delimited
         format
@@ -1532,6 +2013,8 @@ class MetadataTemplate(qdb.base.QiitaObject):
 
             qdb.sql_connection.TRN.execute()
 
+            self._update_search_values(samples_and_values.keys())
+
     def get_category(self, category):
         """Returns the values of all samples for the given category
 
@@ -1562,6 +2045,83 @@ class MetadataTemplate(qdb.base.QiitaObject):
             qdb.sql_connection.TRN.add(sql)
             return dict(qdb.sql_connection.TRN.execute_fetchindex())
 
+    @classmethod
+    def get_categories(cls, columns, samples=None, templates=None, missing=None):
+        """Returns the values of several categories for several templates
+
+        Parameters
+        ----------
+        columns : iterable of str
+            Metadata categories to get information for
+        samples : iterable of str, optional
+            The sample ids to retrieve. Defaults to all the samples
+        templates : iterable of int or MetadataTemplate, optional
+            The templates to retrieve. Defaults to all the templates that
+            have samples
+        missing : object, optional
+            The value of the samples that don't have the category, or whose
+            value is null. Use 'None' to get the values that get_category
+            returns. Defaults to None
+
+        Returns
+        -------
+        dict of {int: dict of {str: list}}
+            The values per template id, column oriented: {template_id:
+            {'sample_id': [sample ids], column: [values]}}; the lists are
+            sorted by sample id and the value is `missing` if the sample
+            doesn't have the category
+
+        Notes
+        -----
+        Contrary to get_category this doesn't raise an error if a category is
+        not part of a template, so the values of many templates can be
+        retrieved in a single query
+        """
+        columns = list(columns)
+        with qdb.sql_connection.TRN:
+            if templates is None:
+                sql = "SELECT DISTINCT {0} FROM qiita.{1}".format(
+                    cls._id_column, cls._table
+                )
+                qdb.sql_connection.TRN.add(sql)
+                templates = qdb.sql_connection.TRN.execute_fetchflatten()
+            template_ids = sorted({int(getattr(t, "id", t)) for t in templates})
+
+            result = {
+                tid: {c: [] for c in ["sample_id"] + columns} for tid in template_ids
+            }
+            if samples is not None:
+                samples = tuple(samples)
+            if not template_ids or samples == ():
+                return result
+
+            sql = """SELECT {0} AS template_id, sample_id{1}
+                     FROM qiita.{2}
+                     WHERE sample_id != %s{3}"""
+            values = "".join([", sample_values->>%s"] * len(columns))
+            sample_filter = "" if samples is None else " AND sample_id IN %s"
+            sql_args = []
+            selects = []
+            for tid in template_ids:
+                selects.append(
+                    sql.format(tid, values, cls._table_name(tid), sample_filter)
+                )
+                sql_args.extend(columns)
+                sql_args.append(QIITA_COLUMN_NAME)
+                if samples is not None:
+                    sql_args.append(samples)
+            qdb.sql_connection.TRN.add(
+                "%s ORDER BY template_id, sample_id" % " UNION ALL ".join(selects),
+                sql_args,
+            )
+            for row in qdb.sql_connection.TRN.execute_fetchindex():
+                template = result[row[0]]
+                template["sample_id"].append(row[1])
+                for c, v in zip(columns, row[2:]):
+                    template[c].append(missing if v is None else v)
+
+            return result
+
     def check_restrictions(self, restrictions):
         """Checks if the template fulfills the restrictions
 
@@ -1674,51 +2234,39 @@ class MetadataTemplate(qdb.base.QiitaObject):
             If the values aren't castable
         """
         warning_msg = []
-        columns = self.categories
         wrong_msg = 'Sample "%s", column "%s", wrong value "%s"'
-        for label, restriction in restriction_dict.items():
-            missing = set(restriction.columns).difference(columns)
-            if missing:
+        # retrieving all the restricted columns in a single query
+        columns = self.categories
+        restricted = {
+            c
+            for restriction in restriction_dict.values()
+            for c in restriction.columns
+            if c in columns
+        }
+        values = self.get_categories(restricted, templates=[self.id], missing="None")
+        values = values[self.id]
+        md_template = pd.DataFrame(
+            {c: values[c] for c in restricted},
+            index=values["sample_id"],
+            dtype=object,
+        )
+        report = qdb.metadata_template.util.check_restriction_values(
+            md_template, restriction_dict
+        )
+        for label, errors in report.items():
+            if errors["missing"]:
                 warning_msg.append(
-                    "%s: %s" % (restriction.error_msg, ", ".join(sorted(missing)))
+                    "%s: %s"
+                    % (
+                        restriction_dict[label].error_msg,
+                        ", ".join(errors["missing"]),
+                    )
+                )
+            for column, error in errors["columns"].items():
+                warning_msg.extend(
+                    wrong_msg % (sample, column, val)
+                    for sample, val in error["examples"]
                 )
-            else:
-                valid_null = qdb.metadata_template.constants.EBI_NULL_VALUES
-                for column, datatype in restriction.columns.items():
-                    # sorting by key (sample id) so we always check in the
-                    # same order, helpful for testing
-                    cats_by_column = self.get_category(column)
-                    for sample in sorted(cats_by_column):
-                        val = cats_by_column[sample]
-                        # ignore if valid null value
-                        if val in valid_null:
-                            continue
-                        # test values
-                        if datatype == datetime:
-                            val = str(val)
-                            formats = [
-                                # 4 digits year
-                                "%Y-%m-%d %H:%M:%S",
-                                "%Y-%m-%d %H:%M",
-                                "%Y-%m-%d %H",
-                                "%Y-%m-%d",
-                                "%Y-%m",
-                                "%Y",
-                            ]
-                            date = None
-                            for fmt in formats:
-                                try:
-                                    date = datetime.strptime(val, fmt)
-                                    break
-                                except ValueError:
-                                    pass
-                            if date is None:
-                                warning_msg.append(wrong_msg % (sample, column, val))
-                        else:
-                            try:
-                                datatype(val)
-                            except (ValueError, TypeError):
-                                warning_msg.append(wrong_msg % (sample, column, val))
 
         if warning_msg:
             warnings.warn(
@@ -1844,8 +2392,11 @@ class MetadataTemplate(qdb.base.QiitaObject):
                 )
 
             to_review = set(restrictions.keys()) & set(categories)
+            values = self.get_categories(
+                to_review, templates=[self.id], missing="None"
+            )[self.id]
             for key in to_review:
-                info_vals = set(self.get_category(key).values())
+                info_vals = set(values[key])
                 msg = []
                 for v in info_vals:
                     if v not in restrictions[key]:
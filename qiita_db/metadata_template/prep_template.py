@@ -8,6 +8,7 @@
 from copy import deepcopy
 from itertools import chain
 from os.path import join
+from time import perf_counter
 
 from iteration_utilities import duplicates
 
@@ -107,6 +108,7 @@ class PrepTemplate(MetadataTemplate):
         investigation_type=None,
         name=None,
         creation_job_id=None,
+        timings=None,
     ):
         r"""Creates the metadata template in the database
 
@@ -124,6 +126,9 @@ class PrepTemplate(MetadataTemplate):
             The prep template name
         creation_job_id : str, optional
             The prep template creation_job_id
+        timings : dict, optional
+            If given, it's updated with the seconds spent in each step of
+            the creation, {step: seconds}
 
         Returns
         -------
@@ -135,6 +140,8 @@ class PrepTemplate(MetadataTemplate):
             If the investigation_type is not valid
             If a required column is missing in md_template
         """
+        if timings is None:
+            timings = {}
         with qdb.sql_connection.TRN:
             # Check if the data_type is the id or the string
             if isinstance(data_type, int):
@@ -161,10 +168,12 @@ class PrepTemplate(MetadataTemplate):
                 pt_cols = deepcopy(PREP_TEMPLATE_COLUMNS)
                 pt_cols.update(PREP_TEMPLATE_COLUMNS_TARGET_GENE)
 
+            start = perf_counter()
             md_template = cls._clean_validate_template(md_template, study.id)
             _check_duplicated_columns(
                 list(md_template.columns), study.sample_template.categories
             )
+            timings["clean_validate"] = perf_counter() - start
 
             # check that we are within the limit of number of samples
             ms = cls.max_samples()
@@ -192,7 +201,7 @@ class PrepTemplate(MetadataTemplate):
             prep_id = qdb.sql_connection.TRN.execute_fetchlast()
 
             try:
-                cls._common_creation_steps(md_template, prep_id)
+                timings.update(cls._common_creation_steps(md_template, prep_id))
             except Exception:
                 # Check if sample IDs present here but not in sample template
                 sql = """SELECT sample_id from qiita.study_sample
@@ -220,10 +229,15 @@ class PrepTemplate(MetadataTemplate):
             qdb.sql_connection.TRN.add(sql, [study.id, prep_id])
 
             qdb.sql_connection.TRN.execute()
+            study.clear_prep_samples_membership()
 
             pt = cls(prep_id)
+            start = perf_counter()
             pt.validate(pt_cols)
+            timings["validate"] = perf_counter() - start
+            start = perf_counter()
             pt.generate_files()
+            timings["generate_files"] = perf_counter() - start
 
             # Add the name to the prep information
             pt.name = name if name is not None else "Prep information %s" % pt.id
@@ -270,10 +284,9 @@ class PrepTemplate(MetadataTemplate):
             If no prep template with id = id_ exists
         """
         with qdb.sql_connection.TRN:
-            table_name = cls._table_name(id_)
-
             if not cls.exists(id_):
                 raise qdb.exceptions.QiitaDBUnknownIDError(id_, cls.__name__)
+            study = qdb.study.Study(cls(id_).study_id)
 
             sql = """SELECT (
                         SELECT artifact_id
@@ -318,9 +331,13 @@ class PrepTemplate(MetadataTemplate):
                      WHERE prep_template_id = %s"""
             qdb.sql_connection.TRN.add(sql, args)
 
-            # Drop the prep_X table
-            sql = "DROP TABLE qiita.{0}".format(table_name)
-            qdb.sql_connection.TRN.add(sql)
+            # Drop the prep_X table (or view)
+            sql = "SELECT qiita.drop_metadata_template_storage(%s, %s)"
+            qdb.sql_connection.TRN.add(sql, [cls._table_prefix[:-1], id_])
+
+            sql = """DELETE FROM qiita.template_statistics
+                     WHERE template_type = %s AND template_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [cls._table_prefix[:-1], id_])
 
             # Remove the rows from prep_template_samples
             sql = "DELETE FROM qiita.{0} WHERE {1} = %s".format(
@@ -340,6 +357,7 @@ class PrepTemplate(MetadataTemplate):
             qdb.sql_connection.TRN.add(sql, args)
 
             qdb.sql_connection.TRN.execute()
+            study.clear_prep_samples_membership()
 
     def unique_ids(self):
         r"""Return a stable mapping of sample_name to integers
@@ -622,8 +640,10 @@ class PrepTemplate(MetadataTemplate):
             The columns that were added/updated
         """
         with qdb.sql_connection.TRN:
-            # figuring out the filepath of the prep template
-            _id, fp = qdb.util.get_mountpoint("templates")[0]
+            # keeping the metadata search values in sync with the template
+            self._update_search_values(samples, columns)
+            self._update_statistics()
+
             # update timestamp in the DB first
             qdb.sql_connection.TRN.add(
                 """UPDATE qiita.prep_template
@@ -631,17 +651,22 @@ class PrepTemplate(MetadataTemplate):
                    WHERE prep_template_id = %s""",
                 [self._id],
             )
+
+            self._queue_template_files()
+
+    def _generate_template_files(self):
+        r"""Writes the prep information file to disk"""
+        with qdb.sql_connection.TRN:
+            # figuring out the filepath of the prep template
+            _id, fp = qdb.util.get_mountpoint("templates")[0]
             ctime = self.modification_timestamp
             fp = join(
                 fp,
                 "%d_prep_%d_%s.txt"
                 % (self.study_id, self._id, ctime.strftime("%Y%m%d-%H%M%S")),
             )
-            # storing the template
-            self.to_file(fp)
-            # adding the fp to the object
-            fp_id = qdb.util.convert_to_id("prep_template", "filepath_type")
-            self.add_filepath(fp, fp_id=fp_id)
+            # storing the template, if it changed
+            self._store_template_file(fp, "prep_template")
 
     @property
     def status(self):
@@ -6,7 +6,7 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 from os.path import join
-from time import strftime
+from time import perf_counter, strftime
 
 import qiita_db as qdb
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
@@ -43,6 +43,25 @@ class Sample(BaseSample):
         if not isinstance(md_template, SampleTemplate):
             raise IncompetentQiitaDeveloperError()
 
+    def __setitem__(self, column, value):
+        r"""Sets the metadata value for the category `column`
+
+        Parameters
+        ----------
+        column : str
+            The column to update
+        value : str
+            The value to set
+
+        See Also
+        --------
+        BaseSample.__setitem__
+        """
+        with qdb.sql_connection.TRN:
+            super(Sample, self).__setitem__(column, value)
+            if column in ("latitude", "longitude"):
+                self._md_template._update_coordinates([self._id])
+
 
 class SampleTemplate(MetadataTemplate):
     r"""Represent the SampleTemplate of a study. Provides access to the
@@ -73,7 +92,7 @@ class SampleTemplate(MetadataTemplate):
     }
 
     @classmethod
-    def create(cls, md_template, study):
+    def create(cls, md_template, study, timings=None):
         r"""Creates the sample template in the database
 
         Parameters
@@ -82,7 +101,12 @@ class SampleTemplate(MetadataTemplate):
             The metadata template file contents indexed by samples Ids
         study : Study
             The study to which the sample template belongs to.
+        timings : dict, optional
+            If given, it's updated with the seconds spent in each step of
+            the creation, {step: seconds}
         """
+        if timings is None:
+            timings = {}
         with qdb.sql_connection.TRN:
             cls._check_subclass()
 
@@ -93,13 +117,20 @@ class SampleTemplate(MetadataTemplate):
                 )
 
             # Clean and validate the metadata template given
+            start = perf_counter()
             md_template = cls._clean_validate_template(md_template, study.id)
+            timings["clean_validate"] = perf_counter() - start
 
-            cls._common_creation_steps(md_template, study.id)
+            timings.update(cls._common_creation_steps(md_template, study.id))
+            study.clear_prep_samples_membership()
 
             st = cls(study.id)
+            start = perf_counter()
             st.validate(qdb.metadata_template.constants.SAMPLE_TEMPLATE_COLUMNS)
+            timings["validate"] = perf_counter() - start
+            start = perf_counter()
             st.generate_files()
+            timings["generate_files"] = perf_counter() - start
 
             return st
 
@@ -136,16 +167,18 @@ class SampleTemplate(MetadataTemplate):
                     "templates associated."
                 )
 
-            table_name = cls._table_name(id_)
-
             # Delete the sample template filepaths
             sql = """DELETE FROM qiita.sample_template_filepath
                      WHERE study_id = %s"""
             args = [id_]
             qdb.sql_connection.TRN.add(sql, args)
 
-            sql = "DROP TABLE qiita.{0}".format(table_name)
-            qdb.sql_connection.TRN.add(sql)
+            sql = "SELECT qiita.drop_metadata_template_storage(%s, %s)"
+            qdb.sql_connection.TRN.add(sql, [cls._table_prefix[:-1], id_])
+
+            sql = """DELETE FROM qiita.template_statistics
+                     WHERE template_type = %s AND template_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [cls._table_prefix[:-1], id_])
 
             sql = "DELETE FROM qiita.{0} WHERE {1} = %s".format(
                 cls._table, cls._id_column
@@ -154,6 +187,8 @@ class SampleTemplate(MetadataTemplate):
 
             qdb.sql_connection.TRN.execute()
 
+            qdb.study.Study(id_).clear_prep_samples_membership()
+
     @property
     def study_id(self):
         """Gets the study id with which this sample template is associated
@@ -303,16 +338,88 @@ class SampleTemplate(MetadataTemplate):
         columns : iterable of str, optional
             The columns that were added/updated
         """
+        with qdb.sql_connection.TRN:
+            # keeping the coordinates and search values in sync with the template
+            if columns is None or {"latitude", "longitude"} & set(columns):
+                self._update_coordinates()
+            elif samples:
+                self._update_coordinates(samples)
+            self._update_search_values(samples, columns)
+            self._update_statistics()
+
+            self._queue_template_files()
+
+    def _generate_template_files(self):
+        r"""Writes the sample information file to disk"""
         with qdb.sql_connection.TRN:
             # figuring out the filepath of the sample template
             _id, fp = qdb.util.get_mountpoint("templates")[0]
             fp = join(fp, "%d_%s.txt" % (self.id, strftime("%Y%m%d-%H%M%S")))
-            # storing the sample template
-            self.to_file(fp)
+            # storing the sample template, if it changed
+            self._store_template_file(fp, "sample_template")
+
+    def update_category(self, category, samples_and_values):
+        """Update an existing column
+
+        Parameters
+        ----------
+        category : str
+            The category to update
+        samples_and_values : dict
+            A mapping of {sample_id: value}
+
+        See Also
+        --------
+        MetadataTemplate.update_category
+        """
+        with qdb.sql_connection.TRN:
+            super(SampleTemplate, self).update_category(category, samples_and_values)
+            if category in ("latitude", "longitude"):
+                self._update_coordinates(samples_and_values.keys())
 
-            # adding the fp to the object
-            fp_id = qdb.util.convert_to_id("sample_template", "filepath_type")
-            self.add_filepath(fp, fp_id=fp_id)
+    def _update_coordinates(self, samples=None):
+        r"""Refreshes the coordinates of the samples in sample_coordinate
+
+        Parameters
+        ----------
+        samples : iterable of str, optional
+            The samples to refresh. Default: all the samples in the template.
+
+        Notes
+        -----
+        Only samples with numeric latitude and longitude are stored
+        """
+        if samples is not None:
+            samples = tuple(samples)
+            if not samples:
+                return
+
+        with qdb.sql_connection.TRN:
+            sql_filter = ""
+            args = [self._id]
+            if samples is not None:
+                sql_filter = " AND sample_id IN %s"
+                args.append(samples)
+
+            sql = """DELETE FROM qiita.sample_coordinate
+                     WHERE study_id = %s{0}""".format(sql_filter)
+            qdb.sql_connection.TRN.add(sql, args)
+
+            sql = """INSERT INTO qiita.sample_coordinate
+                        (sample_id, study_id, latitude, longitude)
+                     SELECT sample_id, %s,
+                            CAST(sample_values->>'latitude' AS FLOAT),
+                            CAST(sample_values->>'longitude' AS FLOAT)
+                     FROM qiita.{0}
+                     WHERE sample_id != '{1}' AND
+                           sample_values->>'latitude' != 'NaN' AND
+                           sample_values->>'longitude' != 'NaN' AND
+                           isnumeric(sample_values->>'latitude') AND
+                           isnumeric(sample_values->>'longitude'){2}""".format(
+                self._table_name(self._id), QIITA_COLUMN_NAME, sql_filter
+            )
+            qdb.sql_connection.TRN.add(sql, args)
+            qdb.sql_connection.TRN.execute()
 
     @property
     def ebi_sample_accessions(self):
@@ -8,8 +8,12 @@
 
 from unittest import TestCase, main
 
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
 import qiita_db as qdb
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
+from qiita_core.util import qiita_test_checker
 
 
 class TestBaseSample(TestCase):
@@ -201,5 +205,60 @@ class TestMetadataTemplateReadOnly(TestCase):
         self.assertEqual(obs, exp)
 
 
+@qiita_test_checker()
+class TestConsolidatedStorage(TestCase):
+    """Tests the templates in the consolidated storage"""
+
+    def test_consolidate_metadata_templates(self):
+        ST = qdb.metadata_template.sample_template.SampleTemplate
+        PT = qdb.metadata_template.prep_template.PrepTemplate
+        st_df = ST(1).to_dataframe()
+        pt_df = PT(1).to_dataframe()
+        headers = ST.metadata_headers()
+
+        obs = qdb.environment_manager.consolidate_metadata_templates()
+        self.assertEqual(obs, 3)
+        # a second run doesn't have anything to move
+        self.assertEqual(qdb.environment_manager.consolidate_metadata_templates(), 0)
+
+        # the templates are read and updated through the views
+        self.assertTrue(ST.exists(1))
+        assert_frame_equal(ST(1).to_dataframe().sort_index(), st_df.sort_index())
+        assert_frame_equal(PT(1).to_dataframe().sort_index(), pt_df.sort_index())
+        self.assertCountEqual(ST.metadata_headers(), headers)
+        ST(1).update_category("season_environment", {"1.SKB8.640193": "summer"})
+        self.assertEqual(ST(1)["1.SKB8.640193"]["season_environment"], "summer")
+
+        # new templates are created in the consolidated storage
+        metadata = pd.DataFrame.from_dict(
+            {
+                "SKB8.640193": {
+                    "primer": "GTGCCAGCMGCCGCGGTAA",
+                    "barcode": "GTCCGCAAGTTA",
+                    "instrument_model": "Illumina MiSeq",
+                    "platform": "Illumina",
+                    "library_construction_protocol": "AAAA",
+                    "experiment_design_description": "BBBB",
+                }
+            },
+            orient="index",
+            dtype=str,
+        )
+        pt = PT.create(metadata, qdb.study.Study(1), "16S")
+        with qdb.sql_connection.TRN:
+            sql = """SELECT COUNT(*) FROM qiita.metadata_template_values
+                     WHERE template_type = 'prep' AND template_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [pt.id])
+            # the sample and the row with the column names
+            self.assertEqual(qdb.sql_connection.TRN.execute_fetchlast(), 2)
+        self.assertEqual(list(pt.keys()), ["1.SKB8.640193"])
+
+        PT.delete(pt.id)
+        self.assertFalse(PT.exists(pt.id))
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, [pt.id])
+            self.assertEqual(qdb.sql_connection.TRN.execute_fetchlast(), 0)
+
+
 if __name__ == "__main__":
     main()
@@ -1135,6 +1135,66 @@ class TestPrepTemplate(TestCase):
         with self.assertRaises(qdb.exceptions.QiitaDBColumnError):
             pt.get_category("DOESNOTEXIST")
 
+    def test_get_categories(self):
+        PT = qdb.metadata_template.prep_template.PrepTemplate
+        obs = PT.get_categories(
+            ["primer", "center_name", "DOESNOTEXIST"], templates=[1, PT(2)]
+        )
+        self.assertCountEqual(obs, [1, 2])
+        for ptid in obs:
+            pt = PT(ptid)
+            samples = sorted(pt.keys())
+            self.assertEqual(obs[ptid]["sample_id"], samples)
+            primer = pt.get_category("primer")
+            self.assertEqual(obs[ptid]["primer"], [primer[s] for s in samples])
+            center_name = pt.get_category("center_name")
+            self.assertEqual(
+                obs[ptid]["center_name"], [center_name[s] for s in samples]
+            )
+            self.assertEqual(obs[ptid]["DOESNOTEXIST"], [None] * len(samples))
+
+        # filtering by sample
+        obs = PT.get_categories(
+            ["primer"], samples=["1.SKB8.640193", "1.SKD8.640184"], templates=[1]
+        )
+        exp = {
+            1: {
+                "sample_id": ["1.SKB8.640193", "1.SKD8.640184"],
+                "primer": ["GTGCCAGCMGCCGCGGTAA", "GTGCCAGCMGCCGCGGTAA"],
+            }
+        }
+        self.assertEqual(obs, exp)
+
+        # no samples
+        obs = PT.get_categories(["primer"], samples=[], templates=[1])
+        self.assertEqual(obs, {1: {"sample_id": [], "primer": []}})
+
+        # all the templates
+        obs = PT.get_categories(["primer"])
+        self.assertTrue({1, 2}.issubset(obs))
+
+        # missing and null values are None
+        sql = """UPDATE qiita.prep_1
+                 SET sample_values = jsonb_set(
+                    sample_values - 'center_name', '{primer}', 'null')
+                 WHERE sample_id = '1.SKB8.640193'"""
+        qdb.sql_connection.perform_as_transaction(sql)
+        obs = PT.get_categories(
+            ["primer", "center_name"], samples=["1.SKB8.640193"], templates=[1]
+        )
+        exp = {
+            1: {"sample_id": ["1.SKB8.640193"], "primer": [None], "center_name": [None]}
+        }
+        self.assertEqual(obs, exp)
+        obs = PT.get_categories(
+            ["primer", "center_name"],
+            samples=["1.SKB8.640193"],
+            templates=[1],
+            missing="None",
+        )
+        exp[1].update({"primer": ["None"], "center_name": ["None"]})
+        self.assertEqual(obs, exp)
+
     def test_create_duplicate_header(self):
         """Create raises an error when duplicate headers are present"""
         self.metadata["STR_COLUMN"] = pd.Series(["", "", ""], index=self.metadata.index)
@@ -1313,6 +1373,16 @@ class TestPrepTemplate(TestCase):
         self.assertEqual(message, "")
         self.assertTrue(success)
 
+        # a null value is reported as 'None'
+        sql = """UPDATE qiita.prep_{0}
+                 SET sample_values = jsonb_set(
+                    sample_values, '{{target_gene}}', 'null')
+                 WHERE sample_id = %s""".format(pt.id)
+        qdb.sql_connection.perform_as_transaction(sql, [sorted(pt.keys())[0]])
+        success, message = pt.validate_restrictions()
+        self.assertIn('has invalid values: "None"', message)
+        self.assertFalse(success)
+
         # cleaning
         PT.delete(pt.id)
 
@@ -1359,6 +1429,17 @@ class TestPrepTemplate(TestCase):
         # We just make sure that the count has been increased by 1, since
         # the contents of the files have been tested elsewhere.
         self.assertEqual(obs, fp_count + 1)
+        # the contents didn't change so a new file is not stored
+        self.tester.generate_files()
+        self.assertEqual(qdb.util.get_count("qiita.filepath"), fp_count + 1)
+        # the sizes used by ProcessingJob.shape are updated
+        with qdb.sql_connection.TRN:
+            sql = """SELECT samples, columns
+                     FROM qiita.template_statistics
+                     WHERE template_type = %s AND template_id = %s"""
+            qdb.sql_connection.TRN.add(sql, ["prep", self.tester.id])
+            obs = qdb.sql_connection.TRN.execute_fetchindex()
+        self.assertEqual(obs, [[len(self.tester), len(self.tester.categories)]])
 
     def test_create_data_type_id(self):
         """Creates a new PrepTemplate passing the data_type_id"""
@@ -1647,6 +1728,10 @@ class TestPrepTemplate(TestCase):
         self.assertEqual(self.tester["1.SKB8.640193"]["center_name"], "FOO")
         self.assertEqual(self.tester["1.SKD8.640184"]["center_name"], "BAR")
 
+        # nothing to update
+        self.tester.update_category("center_name", {})
+        self.assertEqual(self.tester["1.SKB8.640193"]["center_name"], "FOO")
+
     def test_qiime_map_fp(self):
         pt = qdb.metadata_template.prep_template.PrepTemplate(1)
         exp = join(
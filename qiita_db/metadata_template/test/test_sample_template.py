@@ -7,9 +7,11 @@
 # -----------------------------------------------------------------------------
 from collections import Iterable
 from os import close, remove
+from os.path import exists
 from tempfile import mkstemp
 from time import time
 from unittest import TestCase, main
+from unittest.mock import patch
 from warnings import catch_warnings
 
 import numpy.testing as npt
@@ -287,6 +289,14 @@ class TestSample(TestCase):
         tester["tot_nitro"] = "1234.5"
         self.assertEqual(tester["tot_nitro"], "1234.5")
 
+        # the coordinates used by the stats map are kept in sync
+        tester["latitude"] = "12.5"
+        with qdb.sql_connection.TRN:
+            sql = """SELECT latitude FROM qiita.sample_coordinate
+                     WHERE sample_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [tester.id])
+            self.assertEqual(qdb.sql_connection.TRN.execute_fetchlast(), 12.5)
+
     def test_delitem(self):
         """delitem raises an error (currently not allowed)"""
         with self.assertRaises(qdb.exceptions.QiitaDBNotImplementedError):
@@ -1180,6 +1190,48 @@ class TestSampleTemplate(TestCase):
         with self.assertRaises(qdb.exceptions.QiitaDBColumnError):
             pt.get_category("DOESNOTEXIST")
 
+    def test_snapshot(self):
+        st = qdb.metadata_template.sample_template.SampleTemplate(1)
+        obs = st.snapshot()
+        self.assertEqual(obs.id, 1)
+        self.assertEqual(obs.categories, st.categories)
+        self.assertEqual(len(obs), len(st))
+        self.assertCountEqual(obs.keys(), st.keys())
+        self.assertIn("1.SKB2.640194", obs)
+        self.assertNotIn("Not_a_Sample", obs)
+        self.assertIsNone(obs.get("Not_a_Sample"))
+        with self.assertRaises(KeyError):
+            obs["Not_a_Sample"]
+        for sample_id, sample in obs.items():
+            self.assertEqual(sample.id, sample_id)
+            self.assertEqual(dict(sample), dict(st[sample_id].items()))
+        sample = obs["1.SKB2.640194"]
+        self.assertEqual(sample["latitude"], "35.2374368957")
+        self.assertEqual(sample["LATITUDE"], "35.2374368957")
+        self.assertIsNone(sample.get("DOESNOTEXIST"))
+        with self.assertRaises(KeyError):
+            sample["DOESNOTEXIST"]
+
+        obs = st.snapshot(samples=["1.SKB2.640194", "1.SKM4.640180"])
+        self.assertEqual(obs.categories, st.categories)
+        self.assertEqual(list(obs), ["1.SKB2.640194", "1.SKM4.640180"])
+        obs = st.snapshot(samples=[])
+        self.assertEqual(obs.categories, st.categories)
+        self.assertEqual(len(obs), 0)
+
+    def test_lazy_sample(self):
+        st = qdb.metadata_template.sample_template.SampleTemplate(1)
+        obs = st.lazy_sample("1.SKB2.640194")
+        self.assertEqual(obs.id, "1.SKB2.640194")
+        self.assertIsNone(obs._values)
+        self.assertEqual(obs["latitude"], "35.2374368957")
+        self.assertEqual(dict(obs), dict(st["1.SKB2.640194"].items()))
+        self.assertEqual(obs, st.snapshot()["1.SKB2.640194"])
+
+        obs = st.lazy_sample("Not_a_Sample")
+        with self.assertRaises(qdb.exceptions.QiitaDBUnknownIDError):
+            obs["latitude"]
+
     def test_create_duplicate(self):
         """Create raises an error when creating a duplicated SampleTemplate"""
         with self.assertRaises(qdb.exceptions.QiitaDBDuplicateError):
@@ -1208,8 +1260,21 @@ class TestSampleTemplate(TestCase):
 
     def test_create(self):
         """Creates a new SampleTemplate"""
+        timings = {}
         st = qdb.metadata_template.sample_template.SampleTemplate.create(
-            self.metadata, self.new_study
+            self.metadata, self.new_study, timings=timings
+        )
+        self.assertCountEqual(
+            timings,
+            [
+                "clean_validate",
+                "link_samples",
+                "create_storage",
+                "encode_values",
+                "copy_values",
+                "validate",
+                "generate_files",
+            ],
         )
         new_id = self.new_study.id
         # The returned object has the correct id
@@ -1711,6 +1776,75 @@ class TestSampleTemplate(TestCase):
         # We just make sure that the count has been increased by 1, since
         # the contents of the files have been tested elsewhere.
         self.assertEqual(obs, fp_count + 1)
+        # the contents didn't change so a new file is not stored
+        self.tester.generate_files()
+        self.assertEqual(qdb.util.get_count("qiita.filepath"), fp_count + 1)
+        # the sizes used by ProcessingJob.shape are updated
+        with qdb.sql_connection.TRN:
+            sql = """SELECT samples, columns
+                     FROM qiita.template_statistics
+                     WHERE template_type = %s AND template_id = %s"""
+            qdb.sql_connection.TRN.add(sql, ["sample", self.tester.id])
+            obs = qdb.sql_connection.TRN.execute_fetchindex()
+        self.assertEqual(obs, [[len(self.tester), len(self.tester.categories)]])
+
+    def test_generate_files_background(self):
+        qdb.environment_manager.set_background_template_files(True)
+        fp_count = qdb.util.get_count("qiita.filepath")
+        # multiple changes only queue the template once
+        self.tester.update_category("season_environment", {"1.SKB1.640202": "winter2"})
+        self.tester.update_category("season_environment", {"1.SKB1.640202": "winter3"})
+        self.assertEqual(qdb.util.get_count("qiita.filepath"), fp_count)
+        self.assertEqual(qdb.util.get_count("qiita.metadata_template_file_queue"), 1)
+        self.assertTrue(qdb.metadata_template.util.has_queued_template_files())
+
+        obs = qdb.metadata_template.util.generate_queued_template_files()
+        self.assertEqual(obs, 1)
+        self.assertFalse(qdb.metadata_template.util.has_queued_template_files())
+        self.assertEqual(qdb.util.get_count("qiita.filepath"), fp_count + 1)
+        self.assertEqual(qdb.util.get_count("qiita.metadata_template_file_queue"), 0)
+        with open(self.tester.get_filepaths()[0][1]) as f:
+            self.assertIn("winter3", f.read())
+
+        # the templates claimed by another process are skipped, unless the
+        # claim is stale
+        self.tester.update_category("season_environment", {"1.SKB1.640202": "winter4"})
+        qdb.sql_connection.perform_as_transaction(
+            "UPDATE qiita.metadata_template_file_queue SET claimed = NOW()"
+        )
+        self.assertFalse(qdb.metadata_template.util.has_queued_template_files())
+        self.assertEqual(qdb.metadata_template.util.generate_queued_template_files(), 0)
+        qdb.sql_connection.perform_as_transaction(
+            "UPDATE qiita.metadata_template_file_queue "
+            "SET claimed = NOW() - interval '2 hours'"
+        )
+        self.assertEqual(qdb.metadata_template.util.generate_queued_template_files(), 1)
+        self.assertEqual(qdb.util.get_count("qiita.metadata_template_file_queue"), 0)
+
+        # the readers of the files can generate them right away
+        self.tester.update_category("season_environment", {"1.SKB1.640202": "winter5"})
+        self.assertTrue(self.tester.generate_queued_files())
+        self.assertEqual(qdb.util.get_count("qiita.metadata_template_file_queue"), 0)
+        with open(self.tester.get_filepaths()[0][1]) as f:
+            self.assertIn("winter5", f.read())
+        self.assertFalse(self.tester.generate_queued_files())
+        qdb.environment_manager.set_background_template_files(False)
+
+    def test_store_template_file_cleanup(self):
+        fd, fp = mkstemp()
+        close(fd)
+        remove(fp)
+
+        # writing the file fails half way through
+        def to_file(fp, *args, **kwargs):
+            with open(fp, "w") as f:
+                f.write("sample_name")
+            raise ValueError("to_file failed")
+
+        with patch.object(self.tester, "to_file", side_effect=to_file):
+            with self.assertRaises(ValueError):
+                self.tester._store_template_file(fp, "sample_template")
+        self.assertFalse(exists("%s.tmp" % fp))
 
     def test_to_file(self):
         """to file writes a tab delimited file with all the metadata"""
@@ -7,6 +7,7 @@
 # -----------------------------------------------------------------------------
 
 import warnings
+from datetime import datetime
 from inspect import currentframe, getfile
 from os.path import abspath, dirname, join
 from unittest import TestCase, main
@@ -290,6 +291,80 @@ class TestUtil(TestCase):
                 )
             )
 
+    def test_check_restriction_values(self):
+        Restriction = qdb.metadata_template.constants.Restriction
+        restrictions = {
+            "EBI": Restriction(
+                columns={
+                    "collection_timestamp": datetime,
+                    "taxon_id": int,
+                    "description": str,
+                },
+                error_msg="EBI submission disabled",
+            ),
+            "qiita_main": Restriction(
+                columns={"latitude": float, "longitude": float},
+                error_msg="Processed data approval disabled",
+            ),
+            "demultiplex": Restriction(
+                columns={"barcode": str}, error_msg="Demultiplexing disabled."
+            ),
+        }
+        md = pd.DataFrame(
+            {
+                "collection_timestamp": ["2015-01", "Not applicable", "05/2015"],
+                "taxon_id": ["9606", "9606.5", None],
+                "description": ["a", "b", "c"],
+                "latitude": ["1.5", "nan", "north"],
+                "longitude": ["1", "2", "3"],
+            },
+            index=["2.S3", "2.S1", "2.S2"],
+            dtype=object,
+        )
+        obs = qdb.metadata_template.util.check_restriction_values(md, restrictions)
+        exp = {
+            "EBI": {
+                "missing": [],
+                "columns": {
+                    "collection_timestamp": {
+                        "datatype": "datetime",
+                        "count": 1,
+                        "examples": [("2.S2", "05/2015")],
+                    },
+                    "taxon_id": {
+                        "datatype": "int",
+                        "count": 2,
+                        "examples": [("2.S1", "9606.5"), ("2.S2", None)],
+                    },
+                },
+            },
+            "qiita_main": {
+                "missing": [],
+                "columns": {
+                    "latitude": {
+                        "datatype": "float",
+                        "count": 1,
+                        "examples": [("2.S2", "north")],
+                    }
+                },
+            },
+            "demultiplex": {"missing": ["barcode"], "columns": {}},
+        }
+        self.assertEqual(obs, exp)
+
+        obs = qdb.metadata_template.util.check_restriction_values(
+            md, restrictions, max_examples=1
+        )
+        self.assertEqual(obs["EBI"]["columns"]["taxon_id"]["count"], 2)
+        self.assertEqual(
+            obs["EBI"]["columns"]["taxon_id"]["examples"], [("2.S1", "9606.5")]
+        )
+
+        obs = qdb.metadata_template.util.check_restriction_values(
+            md[["description"]], {"EBI": Restriction({"description": str}, "")}
+        )
+        self.assertEqual(obs, {})
+
     def test_get_invalid_sample_names(self):
         all_valid = [
             "2.sample.1",
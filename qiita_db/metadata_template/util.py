@@ -6,6 +6,7 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 import warnings
+from datetime import datetime
 from string import ascii_letters, digits
 
 import numpy as np
@@ -263,6 +264,122 @@ def get_invalid_sample_names(sample_names):
     return inv
 
 
+# the datetime formats accepted in the columns restricted to datetime
+RESTRICTION_DATETIME_FORMATS = [
+    # 4 digits year
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d %H",
+    "%Y-%m-%d",
+    "%Y-%m",
+    "%Y",
+]
+
+
+def _is_castable(value, datatype):
+    """Checks if value can be casted to datatype
+
+    Parameters
+    ----------
+    value : object
+        The value to check
+    datatype : type
+        The type to cast to; datetime values should match one of the
+        RESTRICTION_DATETIME_FORMATS
+
+    Returns
+    -------
+    bool
+        Whether value can be casted to datatype
+    """
+    if datatype is datetime:
+        value = str(value)
+        for fmt in RESTRICTION_DATETIME_FORMATS:
+            try:
+                datetime.strptime(value, fmt)
+                return True
+            except ValueError:
+                pass
+        return False
+
+    try:
+        datatype(value)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+def check_restriction_values(md_template, restriction_dict, max_examples=None):
+    """Checks the restricted columns of md_template, column by column
+
+    Parameters
+    ----------
+    md_template : DataFrame
+        The metadata to check, indexed by sample id
+    restriction_dict : dict of {str: Restriction}
+        The restrictions that apply to the metadata
+    max_examples : int, optional
+        The maximum number of wrong (sample id, value) to return per column.
+        Defaults to all of them
+
+    Returns
+    -------
+    dict of {str: dict}
+        The errors by restriction label, {label: {'missing': list of str,
+        'columns': {column: {'datatype': str, 'count': int, 'examples':
+        list of (str, object)}}}}; 'missing' are the restricted columns that
+        are not in md_template, which are not checked, and 'columns' only
+        has the columns with wrong values. The labels without errors are not
+        part of the report
+
+    Notes
+    -----
+    The valid null values (EBI_NULL_VALUES) are ignored. The cast of each
+    distinct value is only tested once and the wrong values are located with
+    a single isin per column, so the cost depends on the number of distinct
+    values instead of the number of cells. The examples are sorted by
+    sample id.
+    """
+    valid_null = qdb.metadata_template.constants.EBI_NULL_VALUES
+    md_template = md_template.sort_index()
+    wrong_values = {}
+    report = {}
+    for label, restriction in restriction_dict.items():
+        missing = sorted(set(restriction.columns).difference(md_template.columns))
+        columns = {}
+        if not missing:
+            for column, datatype in restriction.columns.items():
+                # str and bool accept any value
+                if datatype in (str, bool):
+                    continue
+                key = (column, datatype)
+                if key not in wrong_values:
+                    values = md_template[column]
+                    values = values[~values.isin(valid_null)]
+                    if datatype is float:
+                        # values parsed by pandas are valid floats so only
+                        # the rest needs to be tested one by one
+                        values = values[pd.to_numeric(values, errors="coerce").isna()]
+                    wrong = [
+                        v for v in pd.unique(values) if not _is_castable(v, datatype)
+                    ]
+                    wrong_values[key] = values[values.isin(wrong)]
+                wrong = wrong_values[key]
+                if not wrong.empty:
+                    examples = list(wrong.items())
+                    if max_examples is not None:
+                        examples = examples[:max_examples]
+                    columns[column] = {
+                        "datatype": datatype.__name__,
+                        "count": len(wrong),
+                        "examples": examples,
+                    }
+        if missing or columns:
+            report[label] = {"missing": missing, "columns": columns}
+
+    return report
+
+
 def looks_like_qiime_mapping_file(fp):
     """Checks if the file looks like a QIIME mapping file
 
@@ -412,3 +529,95 @@ def get_qiime2_reserved_words():
     ]
 
     return set(qiime2_reserved_column_names)
+
+
+def has_queued_template_files():
+    """Checks if there are templates to generate the files of
+
+    Returns
+    -------
+    bool
+        Whether there are templates in the queue of the background generation
+        that generate_queued_template_files would process
+
+    Notes
+    -----
+    This is a single read of the queue, so the master server can check it
+    before starting a process to generate the files
+    """
+    with qdb.sql_connection.TRN:
+        sql = """SELECT EXISTS (
+                    SELECT 1 FROM qiita.metadata_template_file_queue
+                    WHERE claimed IS NULL
+                        OR claimed < clock_timestamp() - interval '1 hour')"""
+        qdb.sql_connection.TRN.add(sql)
+        return qdb.sql_connection.TRN.execute_fetchlast()
+
+
+def generate_queued_template_files(max_templates=None):
+    """Generates the files of the templates queued for background generation
+
+    Parameters
+    ----------
+    max_templates : int, optional
+        The maximum number of templates to process. Defaults to all of them
+
+    Returns
+    -------
+    int
+        The number of templates processed
+
+    Notes
+    -----
+    The templates are claimed before generating their files so the master
+    server and qiita-cron-job don't generate the same files; a claim older
+    than an hour is from a call that was lost. Each template is processed in
+    its own transaction and its entry is only removed from the queue if it
+    wasn't changed in the meantime, otherwise it is kept for the next run so
+    the files reflect the latest change
+    """
+    classes = {
+        "sample": qdb.metadata_template.sample_template.SampleTemplate,
+        "prep": qdb.metadata_template.prep_template.PrepTemplate,
+    }
+    limit = "" if max_templates is None else "LIMIT %d" % max_templates
+    with qdb.sql_connection.TRN:
+        sql = """UPDATE qiita.metadata_template_file_queue
+                 SET claimed = clock_timestamp()
+                 WHERE (template_type, template_id) IN (
+                    SELECT template_type, template_id
+                    FROM qiita.metadata_template_file_queue
+                    WHERE claimed IS NULL
+                        OR claimed < clock_timestamp() - interval '1 hour'
+                    ORDER BY requested
+                    {0}
+                    FOR UPDATE SKIP LOCKED)
+                 RETURNING template_type, template_id, requested""".format(limit)
+        qdb.sql_connection.TRN.add(sql)
+        queued = qdb.sql_connection.TRN.execute_fetchindex()
+
+    sql_delete = """DELETE FROM qiita.metadata_template_file_queue
+                    WHERE template_type = %s AND template_id = %s
+                        AND requested = %s"""
+    sql_release = """UPDATE qiita.metadata_template_file_queue
+                     SET claimed = NULL
+                     WHERE template_type = %s AND template_id = %s"""
+    for ttype, tid, requested in sorted(queued, key=lambda x: x[2]):
+        try:
+            with qdb.sql_connection.TRN:
+                cls = classes[ttype]
+                # the template could have been deleted since it was queued
+                if cls.exists(tid):
+                    cls(tid)._generate_template_files()
+                qdb.sql_connection.TRN.add(sql_delete, [ttype, tid, requested])
+                # the template changed while generating, keep it for next run
+                qdb.sql_connection.TRN.add(sql_release, [ttype, tid])
+                qdb.sql_connection.TRN.execute()
+        except Exception as e:
+            # the template stays claimed, so it's retried in an hour
+            qdb.logger.LogEntry.create(
+                "Runtime",
+                "Error generating the files of %s information %d: %s" % (ttype, tid, e),
+            )
+
+    return len(queued)
@@ -101,6 +101,7 @@ class Portal(qdb.base.QiitaObject):
                 END LOOP;
             END $do$;"""
         qdb.sql_connection.perform_as_transaction(sql, [portal, desc])
+        qdb.util.clear_lookup_tables_cache()
 
         return cls(portal)
 
@@ -169,6 +170,7 @@ class Portal(qdb.base.QiitaObject):
                 END $do$;"""
             qdb.sql_connection.TRN.add(sql, [portal_id] * 2)
             qdb.sql_connection.TRN.execute()
+            qdb.util.clear_lookup_tables_cache()
 
     @staticmethod
     def exists(portal):
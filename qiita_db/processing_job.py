@@ -6,27 +6,38 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 
-from collections import Iterable, defaultdict
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from itertools import chain
 from json import dumps, loads
-from multiprocessing import Event, Process, Queue
-from os import environ
-from os.path import join
+from math import isfinite
+from multiprocessing import Event, Process, Queue, cpu_count
+from os import environ, kill, walk
+from os.path import exists, getsize, isdir, join
+from queue import Empty
 from re import findall, search
+from resource import RUSAGE_CHILDREN, getrusage
+from socket import gethostname
 from subprocess import PIPE, Popen
+from sys import exc_info
 from time import sleep
+from traceback import format_exception
 from uuid import UUID
 
 import networkx as nx
 import pandas as pd
 from humanize import naturalsize
-from numpy import log as nlog  # noqa
 
 import qiita_db as qdb
-from qiita_core.qiita_settings import qiita_config
+from qiita_core.qiita_settings import qiita_config, r_client
 from qiita_db.util import create_nested_path
 
+# redis pub/sub channels where the job status changes are published
+JOB_EVENTS_STUDY_CHANNEL = "job_events:study:%s"
+JOB_EVENTS_ANALYSIS_CHANNEL = "job_events:analysis:%s"
+JOB_EVENTS_COMMAND_CHANNEL = "job_events:command:%s"
+
 
 class Watcher(Process):
     # TODO: Qiita will need a proper mapping of these states to Qiita states
@@ -207,7 +218,88 @@ class Watcher(Process):
         self.join()
 
 
-def launch_local(env_script, start_script, url, job_id, job_dir):
+# the environments of the plugins, reused by the jobs launched locally
+# {(software name, software version): [environment, number of jobs]}
+_PLUGIN_ENVIRONMENTS = {}
+# the environments loaded by the launched processes, see launch_local
+_PLUGIN_ENVIRONMENT_UPDATES = Queue()
+
+
+def _load_environment(env_script):
+    """Runs an environment script and returns the environment it sets
+
+    Parameters
+    ----------
+    env_script : str
+        The environment script of a plugin
+
+    Returns
+    -------
+    dict of {str: str} or None
+        The environment variables once the script is run, or None if the
+        script failed
+    """
+    # env only runs if the script succeeded, otherwise the exit status is the
+    # one of the script
+    cmd = "%s > /dev/null 2>&1 && env -0" % env_script
+    proc = Popen(["bash", "-c", cmd], stdout=PIPE, stderr=PIPE)
+    stdout, _ = proc.communicate()
+    if proc.returncode != 0:
+        return None
+    return dict(var.split("=", 1) for var in stdout.decode().split("\0") if "=" in var)
+
+
+def _plugin_environment(software):
+    """Returns the environment set by the environment script of a plugin
+
+    Parameters
+    ----------
+    software : qiita_db.software.Software
+        The plugin
+
+    Returns
+    -------
+    dict of {str: str} or None
+        The environment variables once the environment script of the plugin
+        is run, or None if the environments are not reused or the
+        environment has to be loaded (again) by the launched process
+
+    Notes
+    -----
+    The environment of a plugin is loaded by the process launching a job of
+    the plugin (see launch_local), so the dispatcher never waits for the
+    environment script, and it is kept in this process and reused by the
+    next `job_scheduler_local_env_reuse` jobs, so those don't pay the cost of
+    running the environment script (e.g. activating a conda environment);
+    afterwards the script is run again so changes in the plugin environment
+    are picked up. The environments of the scripts that failed are never
+    kept.
+    """
+    max_jobs = qiita_config.job_scheduler_local_env_reuse
+    if not max_jobs:
+        return None
+
+    # the environments loaded by the processes launched so far
+    while True:
+        try:
+            key, environment = _PLUGIN_ENVIRONMENT_UPDATES.get_nowait()
+        except Empty:
+            break
+        _PLUGIN_ENVIRONMENTS[key] = [environment, 0]
+
+    key = (software.name, software.version)
+    cached = _PLUGIN_ENVIRONMENTS.get(key)
+    if cached is None or cached[1] >= max_jobs:
+        _PLUGIN_ENVIRONMENTS.pop(key, None)
+        return None
+    cached[1] += 1
+
+    return cached[0]
+
+
+def launch_local(
+    env_script, start_script, url, job_id, job_dir, environment=None, plugin=None
+):
     # launch_local() differs from launch_job_scheduler(), as no Watcher() is
     # used.
     # each launch_local() process will execute the cmd as a child process,
@@ -222,14 +314,27 @@ def launch_local(env_script, start_script, url, job_id, job_dir):
     print("JOB ID: %s" % job_id)
     print("JOB DIR: %s" % job_dir)
 
-    # When Popen() executes, the shell is not in interactive mode,
-    # so it is not sourcing any of the bash configuration files
-    # We need to source it so the env_script are available
-    cmd = "bash -c '%s; %s'" % (env_script, " ".join(cmd))
+    if environment is None and plugin is not None:
+        # loading the environment of the plugin so it is reused by the next
+        # jobs of the plugin, see _plugin_environment; if the script fails
+        # it is sourced below so the error is reported as before
+        environment = _load_environment(env_script)
+        if environment is not None:
+            _PLUGIN_ENVIRONMENT_UPDATES.put((plugin, environment))
+
+    if environment is not None:
+        # the environment of the plugin is already set, see
+        # _plugin_environment
+        cmd = " ".join(cmd)
+    else:
+        # When Popen() executes, the shell is not in interactive mode,
+        # so it is not sourcing any of the bash configuration files
+        # We need to source it so the env_script are available
+        cmd = "bash -c '%s; %s'" % (env_script, " ".join(cmd))
     print("CMD STRING: %s" % cmd)
 
     # Popen() may also need universal_newlines=True
-    proc = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
+    proc = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE, env=environment)
 
     # Communicate pulls all stdout/stderr from the PIPEs
     # This call waits until cmd is done
@@ -244,15 +349,502 @@ def launch_local(env_script, start_script, url, job_id, job_dir):
     print("RETURN CODE: %s" % proc.returncode)
     print("JOB ID: %s" % job_id)
 
+    # this function runs in its own process so the resources used by its
+    # children are the ones used by the job
+    usage = getrusage(RUSAGE_CHILDREN)
+
+    # Forcing the creation of a new connection
+    qdb.sql_connection.create_new_transaction()
+    with qdb.sql_connection.TRN:
+        sql = """UPDATE qiita.local_job_queue
+                 SET finished = clock_timestamp(), exit_status = %s,
+                     cpu_time = %s, memory_used = %s
+                 WHERE processing_job_id = %s"""
+        qdb.sql_connection.TRN.add(
+            sql,
+            [
+                proc.returncode,
+                usage.ru_utime + usage.ru_stime,
+                # ru_maxrss is in kilobytes
+                usage.ru_maxrss * 1024,
+                job_id,
+            ],
+        )
+        qdb.sql_connection.TRN.execute()
+
     if proc.returncode != 0:
         error = "error from launch_local when launching cmd='%s'" % cmd
         error = "%s\n%s\n%s" % (error, stdout, stderr)
 
-        # Forcing the creation of a new connection
-        qdb.sql_connection.create_new_transaction()
         ProcessingJob(job_id).complete(False, error=error)
 
 
+# The local jobs, the completions and the admissions are queued in the
+# database and dispatched by any Qiita process (when a job is submitted or
+# completed) and periodically by the master server; these are the parts
+# shared by their dispatchers
+@contextmanager
+def _locked_queue(table):
+    """Locks a queue while the jobs to dispatch are claimed
+
+    Parameters
+    ----------
+    table : str
+        The name of the queue table, without the schema
+
+    Notes
+    -----
+    Only one process can claim jobs at a time so the limits of the queue are
+    respected by all the Qiita processes. The claims are committed, and the
+    lock released, when the context exits and before the jobs are launched,
+    so the queue is not locked while the jobs are launched or until the
+    transaction of the caller (if any) finishes, and a rollback of the caller
+    can't undo the claim of a job that was launched; note that this also
+    commits the changes done by the caller so far.
+    """
+    with qdb.sql_connection.TRN:
+        qdb.sql_connection.TRN.add(
+            "LOCK TABLE qiita.%s IN SHARE ROW EXCLUSIVE MODE" % table
+        )
+        yield
+        qdb.sql_connection.TRN.execute()
+        qdb.sql_connection.TRN.commit()
+
+
+def _process_lost(host, pid):
+    """Checks if a process started by one of the queues doesn't exist anymore
+
+    Parameters
+    ----------
+    host : str or None
+        The host where the process was started
+    pid : int
+        The id of the process
+
+    Returns
+    -------
+    bool
+        Whether the process was lost
+
+    Notes
+    -----
+    The process ids are only meaningful in the host (and pid namespace) that
+    started the process, so only the processes of this host are checked; the
+    ones of other hosts are checked when the queue is dispatched there.
+    """
+    if host is not None and host != gethostname():
+        return False
+    try:
+        kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _lost_processes(table):
+    """Returns the jobs of a queue whose process was lost
+
+    Parameters
+    ----------
+    table : str
+        The name of the queue table, without the schema
+
+    Returns
+    -------
+    list of str
+        The ids of the started jobs whose process doesn't exist anymore (e.g.
+        it was killed), or that lost their process before its pid was set
+
+    Notes
+    -----
+    Needs to be called within _locked_queue
+    """
+    sql = """SELECT processing_job_id, host, pid FROM qiita.{0}
+             WHERE started IS NOT NULL AND finished IS NULL
+                AND (pid IS NOT NULL
+                     OR started < clock_timestamp() - interval '1 minute')
+          """.format(table)
+    qdb.sql_connection.TRN.add(sql)
+    return [
+        jid
+        for jid, host, pid in qdb.sql_connection.TRN.execute_fetchindex()
+        if pid is None or _process_lost(host, pid)
+    ]
+
+
+def _start_process(table, job_id, target, args):
+    """Starts the process of a job claimed from a queue
+
+    Parameters
+    ----------
+    table : str
+        The name of the queue table, without the schema
+    job_id : str
+        The id of the job
+    target : function
+        The function run by the process
+    args : tuple
+        The arguments of `target`
+
+    Returns
+    -------
+    int
+        The pid of the process, which is stored in the queue with the host
+    """
+    p = Process(target=target, args=args)
+    p.start()
+    sql = """UPDATE qiita.{0} SET pid = %s, host = %s
+             WHERE processing_job_id = %s""".format(table)
+    qdb.sql_connection.perform_as_transaction(sql, [p.pid, gethostname(), job_id])
+    return p.pid
+
+
+def queue_local_jobs(jobs):
+    """Adds jobs to the queue of the local qiita-plugin-launcher
+
+    Parameters
+    ----------
+    jobs : list of ProcessingJob
+        The jobs to queue, each job is started after the previous one in the
+        list finishes successfully
+
+    Notes
+    -----
+    The jobs are started by dispatch_local_jobs
+    """
+    with qdb.sql_connection.TRN:
+        sql = """INSERT INTO qiita.local_job_queue
+                    (processing_job_id, depends_on)
+                 VALUES (%s, %s)
+                 ON CONFLICT (processing_job_id) DO UPDATE
+                 SET depends_on = EXCLUDED.depends_on,
+                     queued = clock_timestamp(), started = NULL,
+                     finished = NULL, pid = NULL, host = NULL,
+                     exit_status = NULL, cpu_time = NULL, memory_used = NULL"""
+        depends_on = None
+        for job in jobs:
+            if job.status != "queued":
+                job._set_status("queued")
+            qdb.sql_connection.TRN.add(sql, [job.id, depends_on])
+            depends_on = job.id
+        qdb.sql_connection.TRN.execute()
+
+
+def dispatch_local_jobs():
+    """Starts the queued local jobs that are ready to run
+
+    A job is ready when the job it depends on (if any) finished successfully,
+    and the jobs are started in the same order they were queued while there
+    are less than `job_scheduler_local_workers` jobs running. The queued jobs
+    whose dependency failed are set as error.
+
+    Returns
+    -------
+    list of str
+        The ids of the jobs started
+
+    Notes
+    -----
+    The jobs are claimed within _locked_queue, so this commits the
+    transaction of the caller (if any)
+    """
+    workers = qiita_config.job_scheduler_local_workers
+    if workers is None:
+        workers = cpu_count()
+    with _locked_queue("local_job_queue"):
+        # dropping the jobs whose dependency failed, this is repeated so the
+        # jobs that depend on the dropped ones are also dropped
+        sql = """UPDATE qiita.local_job_queue q
+                 SET started = clock_timestamp(), finished = clock_timestamp(),
+                     exit_status = -1
+                 FROM qiita.local_job_queue d
+                 WHERE q.depends_on = d.processing_job_id
+                    AND q.started IS NULL AND d.exit_status <> 0
+                 RETURNING q.processing_job_id, q.depends_on"""
+        dropped = []
+        while True:
+            qdb.sql_connection.TRN.add(sql)
+            res = qdb.sql_connection.TRN.execute_fetchindex()
+            if not res:
+                break
+            dropped.extend(res)
+
+        # the jobs whose process was lost don't count as running
+        lost = _lost_processes("local_job_queue")
+        if lost:
+            sql = """UPDATE qiita.local_job_queue
+                     SET finished = clock_timestamp(), exit_status = -1
+                     WHERE processing_job_id IN %s"""
+            qdb.sql_connection.TRN.add(sql, [tuple(lost)])
+
+        sql = """SELECT COUNT(*) FROM qiita.local_job_queue
+                 WHERE started IS NOT NULL AND finished IS NULL"""
+        qdb.sql_connection.TRN.add(sql)
+        free = workers - qdb.sql_connection.TRN.execute_fetchlast()
+
+        to_start = []
+        if free > 0:
+            sql = """UPDATE qiita.local_job_queue
+                     SET started = clock_timestamp()
+                     WHERE processing_job_id IN (
+                        SELECT q.processing_job_id
+                        FROM qiita.local_job_queue q
+                        LEFT JOIN qiita.local_job_queue d
+                            ON q.depends_on = d.processing_job_id
+                        WHERE q.started IS NULL
+                            AND (q.depends_on IS NULL OR d.exit_status = 0)
+                        ORDER BY q.queued
+                        LIMIT %s)
+                     RETURNING processing_job_id"""
+            qdb.sql_connection.TRN.add(sql, [free])
+            to_start = qdb.sql_connection.TRN.execute_fetchflatten()
+
+        for jid, depends_on in dropped:
+            ProcessingJob(jid)._set_error(
+                "Not executed because the job it depends on, %s, failed" % depends_on
+            )
+        for jid in lost:
+            job = ProcessingJob(jid)
+            if job.status not in {"success", "error"}:
+                job._set_error("The process running the job was lost")
+
+    url = "%s%s" % (qiita_config.base_url, qiita_config.portal_dir)
+    for jid in to_start:
+        job = ProcessingJob(jid)
+        software = job.command.software
+        environment = _plugin_environment(software)
+        # when the environment is not reused or has to be loaded again, it is
+        # loaded by the launched process, see launch_local
+        plugin = None
+        if qiita_config.job_scheduler_local_env_reuse and environment is None:
+            plugin = (software.name, software.version)
+        job.external_id = _start_process(
+            "local_job_queue",
+            jid,
+            launch_local,
+            (
+                software.environment_script,
+                software.start_script,
+                url,
+                job.id,
+                join(qdb.util.get_work_base_dir(), job.id),
+                environment,
+                plugin,
+            ),
+        )
+
+    return to_start
+
+
+def _completion_size(payload):
+    """Returns the size of the files of a job completion
+
+    Parameters
+    ----------
+    payload : dict
+        The completion posted by the plugin
+
+    Returns
+    -------
+    int
+        The size in bytes of the files and directories of the artifacts in
+        the payload
+    """
+    size = 0
+    for a_data in (payload.get("artifacts") or {}).values():
+        for fp, _ in a_data["filepaths"]:
+            if isdir(fp):
+                for root, _, files in walk(fp):
+                    size += sum(getsize(join(root, f)) for f in files)
+            elif exists(fp):
+                size += getsize(fp)
+    return size
+
+
+def _escalate_completion(job, payload):
+    """Completes a job with a complete_job submitted to the scheduler
+
+    Parameters
+    ----------
+    job : ProcessingJob
+        The job to complete
+    payload : str
+        The completion posted by the plugin, as a JSON string
+
+    Returns
+    -------
+    ProcessingJob
+        The complete_job that completes the job
+    """
+    with qdb.sql_connection.TRN:
+        qiita_plugin = qdb.software.Software.from_name_and_version("Qiita", "alpha")
+        cmd = qiita_plugin.get_command("complete_job")
+        params = qdb.software.Parameters.load(
+            cmd, values_dict={"job_id": job.id, "payload": payload}
+        )
+        # complete_job are unique so it is fine to force them to be created
+        c_job = ProcessingJob.create(job.user, params, force=True)
+        sql = """UPDATE qiita.completion_queue
+                 SET started = COALESCE(started, clock_timestamp()),
+                     finished = clock_timestamp(), complete_job_id = %s
+                 WHERE processing_job_id = %s"""
+        qdb.sql_connection.TRN.add(sql, [c_job.id, job.id])
+        c_job.submit()
+
+    return c_job
+
+
+def queue_completion(job, payload):
+    """Adds the completion of a job to the completion queue
+
+    Parameters
+    ----------
+    job : ProcessingJob
+        The job to complete
+    payload : str
+        The completion posted by the plugin, as a JSON string
+
+    Returns
+    -------
+    ProcessingJob or None
+        The complete_job that completes the job if the completion was
+        escalated to the scheduler, None otherwise
+
+    Notes
+    -----
+    The completions are completed by dispatch_completions, or escalated to a
+    complete_job if there are no `job_scheduler_completion_workers`. A
+    completion that is already queued is not queued again, so a plugin can
+    safely retry it.
+    """
+    with qdb.sql_connection.TRN:
+        sql = """INSERT INTO qiita.completion_queue
+                    (processing_job_id, payload)
+                 VALUES (%s, %s)
+                 ON CONFLICT (processing_job_id) DO UPDATE
+                 SET payload = EXCLUDED.payload, queued = clock_timestamp(),
+                     started = NULL, finished = NULL, pid = NULL, host = NULL,
+                     attempts = 0, complete_job_id = NULL
+                 WHERE qiita.completion_queue.finished IS NOT NULL
+                 RETURNING processing_job_id"""
+        qdb.sql_connection.TRN.add(sql, [job.id, payload])
+        if not qdb.sql_connection.TRN.execute_fetchflatten():
+            return None
+
+        if qiita_config.job_scheduler_completion_workers > 0:
+            return None
+
+        return _escalate_completion(job, payload)
+
+
+def dispatch_completions(max_attempts=3):
+    """Starts processing the queued completions
+
+    The completions are processed in the same order they were queued while
+    there are less than `job_scheduler_completion_workers` completions being
+    processed. The completions whose process was lost (e.g. the server was
+    restarted) are queued again, and their job is set as error once they were
+    started `max_attempts` times.
+
+    Parameters
+    ----------
+    max_attempts : int, optional
+        The number of times a completion is started before giving up
+
+    Returns
+    -------
+    list of str
+        The ids of the jobs whose completion started
+    """
+    workers = qiita_config.job_scheduler_completion_workers
+    with _locked_queue("completion_queue"):
+        lost = _lost_processes("completion_queue")
+        failed = []
+        if lost:
+            sql = """UPDATE qiita.completion_queue
+                     SET finished = clock_timestamp()
+                     WHERE processing_job_id IN %s AND attempts >= %s
+                     RETURNING processing_job_id"""
+            qdb.sql_connection.TRN.add(sql, [tuple(lost), max_attempts])
+            failed = qdb.sql_connection.TRN.execute_fetchflatten()
+            sql = """UPDATE qiita.completion_queue
+                     SET started = NULL, pid = NULL, host = NULL
+                     WHERE processing_job_id IN %s AND finished IS NULL"""
+            qdb.sql_connection.TRN.add(sql, [tuple(lost)])
+
+        sql = """SELECT COUNT(*) FROM qiita.completion_queue
+                 WHERE started IS NOT NULL AND finished IS NULL"""
+        qdb.sql_connection.TRN.add(sql)
+        free = workers - qdb.sql_connection.TRN.execute_fetchlast()
+
+        to_start = []
+        if free > 0:
+            sql = """UPDATE qiita.completion_queue
+                     SET started = clock_timestamp(), attempts = attempts + 1
+                     WHERE processing_job_id IN (
+                        SELECT processing_job_id
+                        FROM qiita.completion_queue
+                        WHERE started IS NULL
+                        ORDER BY queued
+                        LIMIT %s)
+                     RETURNING processing_job_id"""
+            qdb.sql_connection.TRN.add(sql, [free])
+            to_start = qdb.sql_connection.TRN.execute_fetchflatten()
+
+        for jid in failed:
+            job = ProcessingJob(jid)
+            if job.status == "running":
+                job._set_error(
+                    "The completion of the job was lost %d times" % max_attempts
+                )
+
+    for jid in to_start:
+        _start_process("completion_queue", jid, _complete_queued, (jid,))
+
+    return to_start
+
+
+def _complete_queued(job_id):
+    """Completes a job with its queued completion
+
+    Parameters
+    ----------
+    job_id : str
+        The id of the job to complete
+
+    Notes
+    -----
+    The completions whose files are larger than
+    `job_scheduler_completion_max_size` (moving and checksumming them is too
+    slow for the server) are escalated to a complete_job
+    """
+    # Forcing the creation of a new connection
+    qdb.sql_connection.create_new_transaction()
+    with qdb.sql_connection.TRN:
+        sql = """SELECT payload FROM qiita.completion_queue
+                 WHERE processing_job_id = %s"""
+        qdb.sql_connection.TRN.add(sql, [job_id])
+        payload = qdb.sql_connection.TRN.execute_fetchlast()
+        job = ProcessingJob(job_id)
+        # the job is not running if it was already completed by a process
+        # that was lost before finishing the completion
+        if job.status == "running":
+            if (
+                _completion_size(loads(payload))
+                > qiita_config.job_scheduler_completion_max_size
+            ):
+                _escalate_completion(job, payload)
+                return
+            job.step = "Completing via Qiita"
+            job._complete_from_payload(loads(payload))
+        sql = """UPDATE qiita.completion_queue SET finished = clock_timestamp()
+                 WHERE processing_job_id = %s"""
+        qdb.sql_connection.TRN.add(sql, [job_id])
+        qdb.sql_connection.TRN.execute()
+
+
 def launch_job_scheduler(
     env_script, start_script, url, job_id, job_dir, dependent_job_id, resource_params
 ):
@@ -303,6 +895,426 @@ def launch_job_scheduler(
     return job_id
 
 
+def launch_job_scheduler_array(jobs, url, resource_params):
+    """Submits jobs to the job scheduler as a single job array
+
+    Parameters
+    ----------
+    jobs : list of ProcessingJob
+        The jobs to submit, the task i of the array runs jobs[i]
+    url : str
+        The url of the portal that the jobs report to
+    resource_params : str
+        The resources requested for each of the tasks of the array
+
+    Returns
+    -------
+    str
+        The id of the job array, the id of the task i is '<id>_<i>'
+
+    Raises
+    ------
+    AssertionError
+        If the job array couldn't be submitted
+    """
+    work_dir = qdb.util.get_work_base_dir()
+    array_dir = join(work_dir, "job_arrays")
+    create_nested_path(array_dir)
+
+    # the options of sbatch need to be before any command of the script
+    lines = [
+        "#!/bin/bash",
+        f"#SBATCH --array 0-{len(jobs) - 1}",
+        f"#SBATCH --error {array_dir}/%A_%a-slurm-error.txt",
+        f"#SBATCH --output {array_dir}/%A_%a-slurm-output.txt",
+    ]
+    epilogue = environ.get("QIITA_JOB_SCHEDULER_EPILOGUE", "")
+    if epilogue:
+        lines.append(f"#SBATCH --epilog {epilogue}")
+    lines.append("echo $SLURM_ARRAY_JOB_ID $SLURM_ARRAY_TASK_ID")
+    lines.append("source ~/.bash_profile")
+
+    lines.append('case "$SLURM_ARRAY_TASK_ID" in')
+    for i, job in enumerate(jobs):
+        software = job.command.software
+        job_dir = join(work_dir, job.id)
+        create_nested_path(job_dir)
+        cmd = [software.start_script, url, job.id, job_dir]
+        lines.append(f"    {i})")
+        lines.append(f"        {software.environment_script}")
+        lines.append(f"        {' '.join(cmd)}")
+        lines.append("        ;;")
+    lines.append("esac")
+
+    fp = join(array_dir, "%s.txt" % jobs[0].id)
+    with open(fp, "w") as job_file:
+        job_file.write("\n".join(lines))
+
+    sbatch_cmd = ["sbatch", resource_params, fp]
+    stdout, stderr, return_value = _system_call(" ".join(sbatch_cmd))
+
+    if return_value != 0:
+        raise AssertionError(f"Error submitting job array: {sbatch_cmd} :: {stderr}")
+
+    return stdout.strip("\n").split(" ")[-1]
+
+
+def _submitted_by_plugin(command):
+    """Whether the jobs of the command are submitted by their plugin
+
+    Parameters
+    ----------
+    command : qiita_db.software.Command
+        The command of the job
+
+    Returns
+    -------
+    bool
+        Whether the environment script of the plugin executes the job and
+        returns its external id (ENVIRONMENT in the script)
+
+    Notes
+    -----
+    This is the hardcoded lines described in issue:
+    https://github.com/qiita-spots/qiita/issues/3340
+    the idea is that in the future we shouldn't check specific command
+    names to know if it should be executed differently and the
+    plugin should let Qiita know that a specific command should be ran
+    as job array or not
+    """
+    cnames_to_skip = {"Calculate Cell Counts", "Calculate RNA Copy Counts"}
+    return (
+        "ENVIRONMENT" in command.software.environment_script
+        and command.name not in cnames_to_skip
+    )
+
+
+# The priority classes of the jobs in the admission queue, the jobs of the
+# lower classes are submitted first
+ADMISSION_PRIORITIES = {"processing": 1, "bulk": 2}
+
+
+def _admission_priority(job):
+    """Returns the priority class of a job in the admission queue
+
+    Parameters
+    ----------
+    job : ProcessingJob
+        The job to submit
+
+    Returns
+    -------
+    int or None
+        The priority of the job, None if the job has to be submitted right
+        away
+
+    Notes
+    -----
+    The jobs are only queued if any of `job_scheduler_max_jobs`,
+    `job_scheduler_max_user_jobs` or `job_scheduler_max_command_jobs` is set.
+    The private and validator jobs are never queued: they are short and the
+    submitted jobs can be waiting for them (e.g. a complete_job or
+    release_validators), so holding them back could block the queue
+    """
+    if (
+        qiita_config.job_scheduler_max_jobs is None
+        and qiita_config.job_scheduler_max_user_jobs is None
+        and qiita_config.job_scheduler_max_command_jobs is None
+    ):
+        return None
+    if job.command.software.type in {"private", "artifact definition"}:
+        return None
+    workflow = job.processing_job_workflow
+    if workflow is not None and workflow.bulk:
+        return ADMISSION_PRIORITIES["bulk"]
+    return ADMISSION_PRIORITIES["processing"]
+
+
+def queue_admissions(jobs, priority):
+    """Adds jobs to the admission queue of the job scheduler
+
+    Parameters
+    ----------
+    jobs : list of ProcessingJob
+        The jobs to queue, each job is submitted after the previous one in
+        the list finishes successfully
+    priority : int
+        The priority class of the jobs, one of ADMISSION_PRIORITIES
+
+    Notes
+    -----
+    The jobs are submitted by dispatch_admissions
+    """
+    with qdb.sql_connection.TRN:
+        sql = """INSERT INTO qiita.admission_queue
+                    (processing_job_id, depends_on, priority)
+                 VALUES (%s, %s, %s)
+                 ON CONFLICT (processing_job_id) DO UPDATE
+                 SET depends_on = EXCLUDED.depends_on,
+                     priority = EXCLUDED.priority,
+                     queued = clock_timestamp(), submitted = NULL,
+                     finished = NULL"""
+        depends_on = None
+        for job in jobs:
+            if job.status != "queued":
+                job._set_status("queued")
+            qdb.sql_connection.TRN.add(sql, [job.id, depends_on, priority])
+            depends_on = job.id
+        qdb.sql_connection.TRN.execute()
+
+
+def dispatch_admissions():
+    """Submits the queued jobs to the job scheduler as capacity frees up
+
+    The submitted jobs that are still queued or running count against
+    `job_scheduler_max_jobs`, and against `job_scheduler_max_user_jobs` and
+    `job_scheduler_max_command_jobs` for their user and command. While there
+    is capacity, the next job submitted is the one of the lowest priority
+    class whose user has the fewest jobs submitted, and the oldest one among
+    those, so a user with many queued jobs can't hold back the jobs of the
+    other users. A job that depends on another one is submitted once that job
+    finishes successfully, and set as error if it fails.
+    Only the jobs that go through this queue count against the limits: the
+    private and validator jobs (including the validator job arrays) and the
+    jobs of the plugins whose environment script submits them (ENVIRONMENT)
+    are submitted right away and are not counted.
+
+    Returns
+    -------
+    list of str
+        The ids of the jobs submitted
+
+    Notes
+    -----
+    The jobs are claimed within _locked_queue, so this commits the
+    transaction of the caller (if any) and the jobs are submitted after the
+    claims are committed; a job is never submitted twice.
+    """
+    max_jobs = qiita_config.job_scheduler_max_jobs
+    max_user = qiita_config.job_scheduler_max_user_jobs
+    max_command = qiita_config.job_scheduler_max_command_jobs
+    with _locked_queue("admission_queue"):
+        sql = """SELECT q.processing_job_id, q.priority, q.submitted IS NOT NULL,
+                        pj.email, pj.command_id, pjs.processing_job_status,
+                        q.depends_on, djs.processing_job_status
+                 FROM qiita.admission_queue q
+                    JOIN qiita.processing_job pj USING (processing_job_id)
+                    JOIN qiita.processing_job_status pjs
+                        USING (processing_job_status_id)
+                    LEFT JOIN qiita.processing_job dj
+                        ON q.depends_on = dj.processing_job_id
+                    LEFT JOIN qiita.processing_job_status djs
+                        ON dj.processing_job_status_id =
+                            djs.processing_job_status_id
+                 WHERE q.finished IS NULL
+                 ORDER BY q.priority, q.queued"""
+        qdb.sql_connection.TRN.add(sql)
+        rows = qdb.sql_connection.TRN.execute_fetchindex()
+
+        running = 0
+        user_jobs = defaultdict(int)
+        command_jobs = defaultdict(int)
+        finished = []
+        dropped = []
+        pending = []
+        for jid, priority, submitted, email, cid, status, depends_on, d_status in rows:
+            if submitted:
+                if status in {"queued", "running"}:
+                    running += 1
+                    user_jobs[email] += 1
+                    command_jobs[cid] += 1
+                else:
+                    finished.append(jid)
+            elif status != "queued":
+                # the job was changed while it was queued, e.g. set as error
+                finished.append(jid)
+            elif d_status == "error":
+                finished.append(jid)
+                dropped.append((jid, depends_on))
+            elif depends_on is None or d_status in {"success", "waiting"}:
+                pending.append((jid, priority, email, cid))
+
+        # pending is sorted by priority class and queued time, so the first
+        # job with the lowest (priority, user jobs) is the next one
+        to_submit = []
+        while max_jobs is None or running < max_jobs:
+            best = best_key = None
+            for i, (jid, priority, email, cid) in enumerate(pending):
+                if max_user is not None and user_jobs[email] >= max_user:
+                    continue
+                if max_command is not None and command_jobs[cid] >= max_command:
+                    continue
+                key = (priority, user_jobs[email])
+                if best_key is None or key < best_key:
+                    best = i
+                    best_key = key
+            if best is None:
+                break
+            jid, _, email, cid = pending.pop(best)
+            to_submit.append(jid)
+            running += 1
+            user_jobs[email] += 1
+            command_jobs[cid] += 1
+
+        if finished:
+            sql = """UPDATE qiita.admission_queue
+                     SET finished = clock_timestamp()
+                     WHERE processing_job_id IN %s"""
+            qdb.sql_connection.TRN.add(sql, [tuple(finished)])
+        if to_submit:
+            sql = """UPDATE qiita.admission_queue
+                     SET submitted = clock_timestamp()
+                     WHERE processing_job_id IN %s"""
+            qdb.sql_connection.TRN.add(sql, [tuple(to_submit)])
+
+        for jid, depends_on in dropped:
+            ProcessingJob(jid)._set_error(
+                "Not executed because the job it depends on, %s, failed" % depends_on
+            )
+
+    launcher = ProcessingJob._launch_map[qiita_config.plugin_launcher]
+    url = "%s%s" % (qiita_config.base_url, qiita_config.portal_dir)
+    for jid in to_submit:
+        job = ProcessingJob(jid)
+        software = job.command.software
+        try:
+            resource_params = job.resource_allocation_info
+            external_id = launcher["function"](
+                software.environment_script,
+                software.start_script,
+                url,
+                job.id,
+                join(qdb.util.get_work_base_dir(), job.id),
+                None,
+                resource_params,
+            )
+        except (qdb.exceptions.QiitaDBUnknownIDError, AssertionError) as e:
+            job._set_error(str(e))
+        else:
+            job.external_id = external_id
+
+    return to_submit
+
+
+def admission_queue_stats():
+    """Returns the depth of the admission queue of the job scheduler
+
+    Returns
+    -------
+    pandas.DataFrame
+        The number of jobs waiting to be submitted (queued) and submitted
+        that are not finished yet (submitted), the number of users with jobs
+        queued (users) and the seconds waited by the oldest job queued
+        (oldest), by priority class
+    """
+    with qdb.sql_connection.TRN:
+        sql = """SELECT priority,
+                        COUNT(*) FILTER (WHERE submitted IS NULL),
+                        COUNT(*) FILTER (WHERE submitted IS NOT NULL),
+                        COUNT(DISTINCT email) FILTER (WHERE submitted IS NULL),
+                        EXTRACT(EPOCH FROM clock_timestamp() - MIN(queued)
+                            FILTER (WHERE submitted IS NULL))
+                 FROM qiita.admission_queue
+                    JOIN qiita.processing_job USING (processing_job_id)
+                 WHERE finished IS NULL
+                 GROUP BY priority"""
+        qdb.sql_connection.TRN.add(sql)
+        res = {p: vals for p, *vals in qdb.sql_connection.TRN.execute_fetchindex()}
+
+    return pd.DataFrame(
+        [res.get(p, [0, 0, 0, None]) for p in ADMISSION_PRIORITIES.values()],
+        index=list(ADMISSION_PRIORITIES),
+        columns=["queued", "submitted", "users", "oldest"],
+    )
+
+
+def _format_allocation(param, value):
+    """Formats the memory or time of a resource allocation
+
+    Parameters
+    ----------
+    param : {'mem ', 'mem-per-cpu ', 'time '}
+        The resource
+    value : float
+        The memory in bytes or the time in seconds
+
+    Returns
+    -------
+    str
+        The value as expected by the job scheduler
+    """
+    if param == "time ":
+        td = timedelta(seconds=value)
+        if td.days > 0:
+            days = td.days
+            td = td - timedelta(days=days)
+            part = f"{days}-{str(td)}"
+        else:
+            part = str(td)
+        return part.split(".")[0]
+    return naturalsize(value, gnu=True, format="%.0f")
+
+
+def _shape_statistics(prep_id=None, study_id=None, analysis_id=None):
+    """Returns the stored sizes of the template and analysis of a job
+
+    Parameters
+    ----------
+    prep_id : int, optional
+        The prep template id
+    study_id : int, optional
+        The study id, whose sample template sizes are returned
+    analysis_id : int, optional
+        The analysis id
+
+    Returns
+    -------
+    dict
+        The (samples, columns) of the 'prep' and 'sample' templates, and the
+        (samples, columns, filepath sizes by type) of the 'analysis'. The
+        objects that don't exist are not included
+
+    Notes
+    -----
+    The sizes are retrieved in a single query; the ones that are not stored
+    yet (the objects created before they were kept) are calculated and
+    stored
+    """
+    with qdb.sql_connection.TRN:
+        sql = """SELECT template_type, samples, columns, NULL::JSONB
+                 FROM qiita.template_statistics
+                 WHERE (template_type = 'prep' AND template_id = %s)
+                    OR (template_type = 'sample' AND template_id = %s)
+                 UNION ALL
+                 SELECT 'analysis', samples, columns, filepath_sizes
+                 FROM qiita.analysis_statistics
+                 WHERE analysis_id = %s"""
+        qdb.sql_connection.TRN.add(sql, [prep_id, study_id, analysis_id])
+        stats = {
+            otype: (samples, columns) if sizes is None else (samples, columns, sizes)
+            for otype, samples, columns, sizes in (
+                qdb.sql_connection.TRN.execute_fetchindex()
+            )
+        }
+
+        MT = qdb.metadata_template
+        if prep_id is not None and "prep" not in stats:
+            if MT.prep_template.PrepTemplate.exists(prep_id):
+                pt = MT.prep_template.PrepTemplate(prep_id)
+                stats["prep"] = pt._update_statistics()
+        if study_id is not None and "sample" not in stats:
+            if MT.sample_template.SampleTemplate.exists(study_id):
+                st = MT.sample_template.SampleTemplate(study_id)
+                stats["sample"] = st._update_statistics()
+        if analysis_id is not None and "analysis" not in stats:
+            if qdb.analysis.Analysis.exists(analysis_id):
+                analysis = qdb.analysis.Analysis(analysis_id)
+                analysis_stats = analysis._update_statistics()
+                if analysis_stats is not None:
+                    stats["analysis"] = analysis_stats
+    return stats
+
+
 def _system_call(cmd):
     """Execute the command `cmd`
 
@@ -409,6 +1421,43 @@ class ProcessingJob(qdb.base.QiitaObject):
             qdb.sql_connection.TRN.add(sql, [external_id])
             return cls(qdb.sql_connection.TRN.execute_fetchlast())
 
+    @classmethod
+    def by_parameters(cls, parameters, status=None):
+        """Return the jobs created with the given parameters
+
+        Parameters
+        ----------
+        parameters : qiita_db.software.Parameters
+            The parameters of the jobs
+        status : list of str, optional
+            If given, only return the jobs in these status
+
+        Returns
+        -------
+        list of qiita_db.processing_job.ProcessingJob
+            The jobs of the command of `parameters` with the same parameter
+            values, the values are compared as case insensitive text
+
+        Notes
+        -----
+        The lookup uses the indexed parameters_fingerprint of the jobs
+        """
+        with qdb.sql_connection.TRN:
+            sql = """SELECT processing_job_id
+                     FROM qiita.processing_job
+                     LEFT JOIN qiita.processing_job_status
+                        USING (processing_job_status_id)
+                     WHERE command_id = %s
+                        AND parameters_fingerprint =
+                            qiita.processing_job_parameters_fingerprint(%s)"""
+            sql_args = [parameters.command.id, parameters.dump()]
+            if status is not None:
+                sql += " AND processing_job_status IN %s"
+                sql_args.append(tuple(status))
+            sql += " ORDER BY processing_job_id"
+            qdb.sql_connection.TRN.add(sql, sql_args)
+            return [cls(jid) for jid in qdb.sql_connection.TRN.execute_fetchflatten()]
+
     @property
     def resource_allocation_info(self):
         """Return resource allocation defined for this job. For
@@ -468,28 +1517,20 @@ class ProcessingJob(qdb.base.QiitaObject):
                 elif ia:
                     analysis = ia[0].analysis
 
-            # first, query for resources matching name and type
+            # the resources matching name and type or, if there are none, the
+            # 'default' value for the type
             sql = """SELECT allocation FROM
                      qiita.processing_job_resource_allocation
-                     WHERE name = %s and job_type = %s"""
-            qdb.sql_connection.TRN.add(sql, [name, jtype])
+                     WHERE job_type = %s AND name IN (%s, 'default')
+                     ORDER BY name = 'default'
+                     LIMIT 1"""
+            qdb.sql_connection.TRN.add(sql, [jtype, name])
 
             result = qdb.sql_connection.TRN.execute_fetchflatten()
-
-            # if no matches for both type and name were found, query the
-            # 'default' value for the type
-
             if not result:
-                sql = """SELECT allocation FROM
-                         qiita.processing_job_resource_allocation WHERE
-                         name = %s and job_type = %s"""
-                qdb.sql_connection.TRN.add(sql, ["default", jtype])
-
-                result = qdb.sql_connection.TRN.execute_fetchflatten()
-                if not result:
-                    AssertionError(
-                        "Could not match %s to a resource allocation!" % name
-                    )
+                raise AssertionError(
+                    "Could not match %s to a resource allocation!" % name
+                )
 
             allocation = result[0]
             # adding user_level extra parameters
@@ -546,16 +1587,21 @@ class ProcessingJob(qdb.base.QiitaObject):
                             return "Not valid"
 
                         try:
-                            # if eval has something that can't be processed
-                            # it will raise a NameError
-                            value = eval(
+                            # the formula is compiled once and cached, and
+                            # anything that isn't a formula of the variables
+                            # raises a ValueError
+                            formula = qdb.util.compile_formula(
                                 part.format(
-                                    samples=samples,
-                                    columns=columns,
-                                    input_size=input_size,
-                                )
+                                    samples="samples",
+                                    columns="columns",
+                                    input_size="input_size",
+                                ),
+                                ("samples", "columns", "input_size"),
+                            )
+                            value = formula(
+                                samples=samples, columns=columns, input_size=input_size
                             )
-                        except NameError:
+                        except ValueError:
                             self._set_error(error_msg)
                             return "Not valid"
                         else:
@@ -563,23 +1609,101 @@ class ProcessingJob(qdb.base.QiitaObject):
                                 self._set_error(error_msg)
                                 return "Not valid"
 
-                            if param == "time ":
-                                td = timedelta(seconds=value)
-                                if td.days > 0:
-                                    days = td.days
-                                    td = td - timedelta(days=days)
-                                    part = f"{days}-{str(td)}"
-                                else:
-                                    part = str(td)
-                                part = part.split(".")[0]
-                            else:
-                                part = naturalsize(value, gnu=True, format="%.0f")
+                            part = _format_allocation(param, value)
                     parts.append(f"--{param}{part}".strip())
 
                 allocation = " ".join(parts)
 
+            if jtype == "RESOURCE_PARAMS_COMMAND":
+                allocation = self._learned_resource_allocation(allocation)
+
             return allocation
 
+    def _learned_resource_allocation(self, allocation):
+        """Replaces the memory and time of an allocation with the ones
+        predicted by the model of the command of the job
+
+        Parameters
+        ----------
+        allocation : str
+            The resource allocation of the job
+
+        Returns
+        -------
+        str
+            The allocation with the memory and time predicted by the model,
+            or `allocation` if the command doesn't have an enabled model or
+            the model can't predict the resources of the job
+
+        Notes
+        -----
+        The job requests the prediction or the largest resources used by the
+        jobs the model was fitted to, whichever is larger, multiplied by the
+        margin of the model; as in the backtest of the model (see
+        qdb.util.update_resource_allocation_models), so it can request less
+        than `allocation`. A memory requested with --mem-per-cpu is replaced
+        by the memory per task (-n, 1 by default), so the total is the one
+        predicted
+        """
+        with qdb.sql_connection.TRN:
+            sql = """SELECT memory_expression, memory_parameters,
+                            max_memory_used, time_expression, time_parameters,
+                            max_time_used, margin
+                     FROM qiita.resource_allocation_model
+                     WHERE command_id = %s AND enabled"""
+            qdb.sql_connection.TRN.add(sql, [self.command.id])
+            res = qdb.sql_connection.TRN.execute_fetchindex()
+            if not res:
+                return allocation
+            (
+                mem_expr,
+                mem_params,
+                max_mem,
+                time_expr,
+                time_params,
+                max_time,
+                margin,
+            ) = res[0]
+
+            samples, columns, _ = self.shape
+            if not samples or not columns or max_mem is None or max_time is None:
+                return allocation
+
+            values = {}
+            for param, expression, (k, a, b), max_used in (
+                ("mem ", mem_expr, mem_params, max_mem),
+                ("time ", time_expr, time_params, max_time),
+            ):
+                try:
+                    equation = qdb.util._resource_allocation_equation(expression)
+                    value = float(equation(samples * columns, k, a, b))
+                except Exception:
+                    return allocation
+                if not isfinite(value) or value <= 0:
+                    return allocation
+                values[param] = max(value, max_used) * margin
+
+        first, *rest = allocation.split("--")
+        if any(part.startswith("mem-per-cpu ") for part in rest):
+            tasks = search(r"(?:^|\s)-n\s*(\d+)|--ntasks[= ](\d+)", allocation)
+            tasks = int(next(t for t in tasks.groups() if t)) if tasks else 1
+            values["mem-per-cpu "] = values.pop("mem ") / tasks
+
+        parts = [first.strip()] if first.strip() else []
+        for part in rest:
+            for param in list(values):
+                if part.startswith(param):
+                    part = f"{param}{_format_allocation(param, values.pop(param))}"
+                    break
+            parts.append(f"--{part.strip()}")
+        # the allocation didn't request the memory or time
+        parts.extend(
+            f"--{param}{_format_allocation(param, value)}"
+            for param, value in values.items()
+        )
+
+        return " ".join(parts)
+
     @classmethod
     def create(cls, user, parameters, force=False):
         """Creates a new job in the system
@@ -615,39 +1739,14 @@ class ProcessingJob(qdb.base.QiitaObject):
                         USING (processing_job_status_id)
                      LEFT JOIN qiita.artifact_output_processing_job aopj
                         USING (processing_job_id)
-                     WHERE command_id = %s AND processing_job_status IN (
-                        'success', 'waiting', 'running', 'in_construction') {0}
+                     WHERE command_id = %s
+                        AND parameters_fingerprint =
+                            qiita.processing_job_parameters_fingerprint(%s)
+                        AND processing_job_status IN (
+                            'success', 'waiting', 'running', 'in_construction')
                      GROUP BY processing_job_id, email,
                         processing_job_status"""
-
-                # we need to use ILIKE because of booleans as they can be
-                # false or False
-                params = []
-                for k, v in parameters.values.items():
-                    # this is necessary in case we have an Iterable as a value
-                    # but that is string
-                    if isinstance(v, Iterable) and not isinstance(v, str):
-                        for vv in v:
-                            params.extend([k, str(vv)])
-                    else:
-                        params.extend([k, str(v)])
-
-                if params:
-                    # divided by 2 as we have key-value pairs
-                    len_params = int(len(params) / 2)
-                    sql = sql.format(
-                        " AND "
-                        + " AND ".join(
-                            ["command_parameters->>%s ILIKE %s"] * len_params
-                        )
-                    )
-                    params = [command.id] + params
-                    TTRN.add(sql, params)
-                else:
-                    # the sql variable expects the list of parameters but if
-                    # there is no param we need to replace the {0} with an
-                    # empty string
-                    TTRN.add(sql.format(""), [command.id])
+                TTRN.add(sql, [command.id, parameters.dump()])
 
                 # checking that if the job status is success, it has children
                 # [2] status, [3] children count
@@ -899,6 +1998,59 @@ class ProcessingJob(qdb.base.QiitaObject):
 
         return {"subject": subject, "message": message}
 
+    def _job_event_channels(self):
+        """The redis channels where the events of this job are published
+
+        Returns
+        -------
+        set of str
+            The command channel of the job, and its study and analysis
+            channels
+        """
+        channels = {JOB_EVENTS_COMMAND_CHANNEL % self.command.id}
+        input_artifacts = self.input_artifacts
+        if input_artifacts:
+            for artifact in input_artifacts:
+                if artifact.analysis is not None:
+                    channels.add(JOB_EVENTS_ANALYSIS_CHANNEL % artifact.analysis.id)
+                elif artifact.study is not None:
+                    channels.add(JOB_EVENTS_STUDY_CHANNEL % artifact.study.id)
+            return channels
+
+        # private jobs don't have input artifacts, so use the parameters
+        values = self.parameters.values
+        if "study" in values:
+            channels.add(JOB_EVENTS_STUDY_CHANNEL % values["study"])
+        # the prep template could have been deleted by the job
+        if "prep_template" in values and (
+            qdb.metadata_template.prep_template.PrepTemplate.exists(
+                values["prep_template"]
+            )
+        ):
+            pt = qdb.metadata_template.prep_template.PrepTemplate(
+                values["prep_template"]
+            )
+            channels.add(JOB_EVENTS_STUDY_CHANNEL % pt.study_id)
+        if "analysis_id" in values:
+            channels.add(JOB_EVENTS_ANALYSIS_CHANNEL % values["analysis_id"])
+        return channels
+
+    def _publish_event(self, status, step=None):
+        """Publishes a job event once the current transaction is committed
+
+        Parameters
+        ----------
+        status : str
+            The status of the job
+        step : str, optional
+            The current step of the job
+        """
+        event = dumps({"job_id": self.id, "status": status, "step": step})
+        for channel in self._job_event_channels():
+            qdb.sql_connection.TRN.add_post_commit_func(
+                r_client.publish, channel, event
+            )
+
     def _set_status(self, value, error_msg=None):
         """Sets the status of the job
 
@@ -933,12 +2085,12 @@ class ProcessingJob(qdb.base.QiitaObject):
 
             msg = self._generate_notification_message(value, error_msg)
             if msg is not None:
-                # send email
-                qdb.util.send_email(self.user.email, msg["subject"], msg["message"])
+                # queue the email, it's sent by qiita-cron-job send-emails
+                qdb.util.queue_email(self.user.email, msg["subject"], msg["message"])
                 # send email to our sys-admin if error from admin
                 if self.user.level in {"admin", "wet-lab admin"}:
                     if value == "error":
-                        qdb.util.send_email(
+                        qdb.util.queue_email(
                             qiita_config.sysadmin_email, msg["subject"], msg["message"]
                         )
 
@@ -947,6 +2099,7 @@ class ProcessingJob(qdb.base.QiitaObject):
                      WHERE processing_job_id = %s"""
             qdb.sql_connection.TRN.add(sql, [new_status, self.id])
             qdb.sql_connection.TRN.execute()
+            self._publish_event(value)
 
     @property
     def external_id(self):
@@ -1039,7 +2192,6 @@ class ProcessingJob(qdb.base.QiitaObject):
         job_dir = join(qdb.util.get_work_base_dir(), self.id)
         command = self.command
         software = command.software
-        cname = command.name
         plugin_start_script = software.start_script
         plugin_env_script = software.environment_script
 
@@ -1050,16 +2202,8 @@ class ProcessingJob(qdb.base.QiitaObject):
         # if the word ENVIRONMENT is in the plugin_env_script we have a special
         # case where we are going to execute some command and then wait for the
         # plugin to return their own id (first implemented for
-        # fast-bowtie2+woltka)
-        #
-        # This is the hardcoded lines described in issue:
-        # https://github.com/qiita-spots/qiita/issues/3340
-        # the idea is that in the future we shouldn't check specific command
-        # names to know if it should be executed differently and the
-        # plugin should let Qiita know that a specific command should be ran
-        # as job array or not
-        cnames_to_skip = {"Calculate Cell Counts", "Calculate RNA Copy Counts"}
-        if "ENVIRONMENT" in plugin_env_script and cname not in cnames_to_skip:
+        # fast-bowtie2+woltka), see _submitted_by_plugin
+        if _submitted_by_plugin(command):
             # the job has to be in running state so the plugin can change its`
             # status
             with qdb.sql_connection.TRN:
@@ -1081,7 +2225,19 @@ class ProcessingJob(qdb.base.QiitaObject):
         # requires metadata from a late-defined and time-sensitive source.
         elif qiita_config.plugin_launcher in ProcessingJob._launch_map:
             launcher = ProcessingJob._launch_map[qiita_config.plugin_launcher]
+            priority = None
             if launcher["execute_in_process"]:
+                priority = _admission_priority(self)
+            if priority is not None:
+                # queue the job, and the dependent jobs after it, so it is
+                # submitted when the user, command and Qiita are under their
+                # limits; note that the queue is also dispatched periodically
+                # by the master server
+                queue_admissions([self] + (dependent_jobs_list or []), priority)
+                dispatch_admissions()
+                # the external id is set when the job is submitted
+                job_id = None
+            elif launcher["execute_in_process"]:
                 # run this launcher function within this process.
                 # usually this is done if the launcher spawns other processes
                 # before returning immediately, usually with a job ID that can
@@ -1132,51 +2288,13 @@ class ProcessingJob(qdb.base.QiitaObject):
                     )
 
             elif not launcher["execute_in_process"]:
-                # run this launcher function as a new process.
-                # usually this is done if the launcher performs work that takes
-                # an especially long time, or waits for children who perform
-                # such work.
-                p = Process(
-                    target=launcher["function"],
-                    args=(
-                        plugin_env_script,
-                        plugin_start_script,
-                        url,
-                        self.id,
-                        job_dir,
-                    ),
-                )
-
-                p.start()
-
-                job_id = p.pid
-
-                if dependent_jobs_list:
-                    # for now, treat dependents as independent when
-                    # running locally. This means they will not be
-                    # organized into n 'queues' or 'chains', and
-                    # will all run simultaneously.
-                    for dependent in dependent_jobs_list:
-                        # register dependent job as queued to make qiita
-                        # aware of this child process
-                        dependent._set_status("queued")
-
-                        dep_software = dependent.command.software
-                        dep_job_dir = join(qdb.util.get_work_base_dir(), dependent.id)
-                        p = Process(
-                            target=launcher["function"],
-                            args=(
-                                dep_software.environment_script,
-                                dep_software.start_script,
-                                url,
-                                dependent.id,
-                                dep_job_dir,
-                            ),
-                        )
-                        p.start()
-                        # assign the child process ID as external id to
-                        # the dependent
-                        dependent.external_id = p.pid
+                # queue the job, and the dependent jobs after it, so they are
+                # started by a bounded number of processes; note that the
+                # queue is also dispatched periodically by the master server
+                queue_local_jobs([self] + (dependent_jobs_list or []))
+                dispatch_local_jobs()
+                # the external id is set when the job is started
+                job_id = None
             else:
                 error = (
                     "execute_in_process must be defined",
@@ -1194,6 +2312,65 @@ class ProcessingJob(qdb.base.QiitaObject):
         if job_id is not None:
             self.external_id = job_id
 
+    @classmethod
+    def submit_array(cls, jobs):
+        """Submits jobs to the job scheduler as job arrays
+
+        Parameters
+        ----------
+        jobs : list of ProcessingJob
+            The jobs to submit
+
+        Raises
+        ------
+        QiitaDBOperationNotPermittedError
+            If any of the jobs is not in 'waiting' or 'in_construction'
+            status
+
+        Notes
+        -----
+        The jobs with the same resource allocation are submitted as a single
+        job array, and the external id of each job is the id of its task in
+        the array (<array id>_<index>). The jobs that need to be executed
+        by their plugin (ENVIRONMENT in the environment script) are
+        submitted on their own
+        """
+        with qdb.sql_connection.TRN:
+            for job in jobs:
+                status = job.status
+                if status not in {"in_construction", "waiting"}:
+                    raise qdb.exceptions.QiitaDBOperationNotPermittedError(
+                        "Can't submit job, not in 'in_construction' or "
+                        "'waiting' status. Current status: %s" % status
+                    )
+
+        url = "%s%s" % (qiita_config.base_url, qiita_config.portal_dir)
+        arrays = defaultdict(list)
+        for job in jobs:
+            if _submitted_by_plugin(job.command):
+                job.submit()
+                continue
+            with qdb.sql_connection.TRN:
+                job._set_status("queued")
+                # the job scheduler needs to see the status change
+                qdb.sql_connection.TRN.commit()
+            try:
+                arrays[job.resource_allocation_info].append(job)
+            except qdb.exceptions.QiitaDBUnknownIDError as e:
+                job._set_error(str(e))
+
+        for resource_params, array_jobs in arrays.items():
+            try:
+                array_id = launch_job_scheduler_array(array_jobs, url, resource_params)
+            except AssertionError as e:
+                # the jobs are not left queued without an external id, so
+                # the job waiting for them (release_validators) can finish
+                for job in array_jobs:
+                    job._set_error(str(e))
+                continue
+            for i, job in enumerate(array_jobs):
+                job.external_id = "%s_%d" % (array_id, i)
+
     def release(self):
         """Releases the job from the waiting status and creates the artifact
 
@@ -1599,25 +2776,30 @@ class ProcessingJob(qdb.base.QiitaObject):
             # Link all the validator jobs with the current job
             self._set_validator_jobs(validator_jobs)
 
-            # Submit m validator jobs as n lists of jobs
-            n = qiita_config.job_scheduler_dependency_q_cnt
-            if n is None:
-                n = 2
-
-            # taken from:
-            # https://www.geeksforgeeks.org/break-list-chunks-size-n-python/
-            lists = [
-                validator_jobs[i * n : (i + 1) * n]
-                for i in range((len(validator_jobs) + n - 1) // n)
-            ]
+            if qiita_config.plugin_launcher == "qiita-plugin-launcher-slurm":
+                # Submit the validator jobs as job arrays, so there is a
+                # single sbatch per resource allocation
+                ProcessingJob.submit_array(validator_jobs)
+            else:
+                # Submit m validator jobs as n lists of jobs
+                n = qiita_config.job_scheduler_dependency_q_cnt
+                if n is None:
+                    n = 2
+
+                # taken from:
+                # https://www.geeksforgeeks.org/break-list-chunks-size-n-python/
+                lists = [
+                    validator_jobs[i * n : (i + 1) * n]
+                    for i in range((len(validator_jobs) + n - 1) // n)
+                ]
 
-            for sub_list in lists:
-                # each sub_list will always have at least a lead_job
-                lead_job = sub_list.pop(0)
-                if not sub_list:
-                    # sub_list is now empty
-                    sub_list = None
-                lead_job.submit(dependent_jobs_list=sub_list)
+                for sub_list in lists:
+                    # each sub_list will always have at least a lead_job
+                    lead_job = sub_list.pop(0)
+                    if not sub_list:
+                        # sub_list is now empty
+                        sub_list = None
+                    lead_job.submit(dependent_jobs_list=sub_list)
 
             # Submit the job that will release all the validators
             plugin = qdb.software.Software.from_name_and_version("Qiita", "alpha")
@@ -1685,6 +2867,27 @@ class ProcessingJob(qdb.base.QiitaObject):
             else:
                 self._set_error(error)
 
+    def _complete_from_payload(self, payload):
+        """Completes the job with the completion posted by the plugin
+
+        Parameters
+        ----------
+        payload : dict
+            The completion posted by the plugin, with the keys 'success',
+            'artifacts' and 'error'
+        """
+        with qdb.sql_connection.TRN:
+            if payload["success"]:
+                artifacts = payload["artifacts"]
+                error = None
+            else:
+                artifacts = None
+                error = payload["error"]
+            try:
+                self.complete(payload["success"], artifacts, error)
+            except Exception:
+                self._set_error(format_exception(*exc_info()))
+
     @property
     def log(self):
         """The log entry attached to the job if it failed
@@ -1811,14 +3014,17 @@ class ProcessingJob(qdb.base.QiitaObject):
         qiita_db.exceptions.QiitaDBOperationNotPermittedError
             If the status of the job is not 'running'
         """
-        if self.status != "running":
-            raise qdb.exceptions.QiitaDBOperationNotPermittedError(
-                "Cannot change the step of a job whose status is not 'running'"
-            )
-        sql = """UPDATE qiita.processing_job
-                 SET step = %s
-                 WHERE processing_job_id = %s"""
-        qdb.sql_connection.perform_as_transaction(sql, [value, self.id])
+        with qdb.sql_connection.TRN:
+            if self.status != "running":
+                raise qdb.exceptions.QiitaDBOperationNotPermittedError(
+                    "Cannot change the step of a job whose status is not 'running'"
+                )
+            sql = """UPDATE qiita.processing_job
+                     SET step = %s
+                     WHERE processing_job_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [value, self.id])
+            qdb.sql_connection.TRN.execute()
+            self._publish_event("running", value)
 
     @property
     def children(self):
@@ -2079,14 +3285,7 @@ class ProcessingJob(qdb.base.QiitaObject):
             sanalysis = qdb.analysis.Analysis(parameters["analysis"]).samples
             samples = sum([len(sams) for sams in sanalysis.values()])
             # only count the biom files
-            input_size = sum(
-                [
-                    fp["fp_size"]
-                    for aid in sanalysis
-                    for fp in qdb.artifact.Artifact(aid).filepaths
-                    if fp["fp_type"] == "biom"
-                ]
-            )
+            input_size = qdb.util.get_artifacts_filepath_sizes(sanalysis).get("biom", 0)
             columns = self.parameters.values["categories"]
             if columns is not None:
                 columns = len(columns)
@@ -2124,19 +3323,13 @@ class ProcessingJob(qdb.base.QiitaObject):
                 samples = stemp
         elif self.input_artifacts:
             artifact = self.input_artifacts[0]
+            sizes = qdb.util.get_artifacts_filepath_sizes(
+                [a.id for a in self.input_artifacts]
+            )
             if artifact.artifact_type == "BIOM":
-                input_size = sum(
-                    [
-                        fp["fp_size"]
-                        for a in self.input_artifacts
-                        for fp in a.filepaths
-                        if fp["fp_type"] == "biom"
-                    ]
-                )
+                input_size = sizes.get("biom", 0)
             else:
-                input_size = sum(
-                    [fp["fp_size"] for a in self.input_artifacts for fp in a.filepaths]
-                )
+                input_size = sum(sizes.values())
 
         # if there is an artifact, then we need to get the study_id/analysis_id
         if artifact is not None:
@@ -2149,34 +3342,20 @@ class ProcessingJob(qdb.base.QiitaObject):
 
         # now retrieve the sample/columns based on study_id/analysis_id
         if study_id is not None:
-            try:
-                st = qdb.study.Study(study_id).sample_template
-            except QUIDError:
-                pass
-            else:
-                if prep_info is not None:
-                    samples = len(prep_info)
-                    columns = len(prep_info.categories) + len(st.categories)
-                elif st is not None:
-                    samples = len(st)
-                    columns = len(st.categories)
+            prep_id = prep_info.id if prep_info is not None else None
+            stats = _shape_statistics(prep_id=prep_id, study_id=study_id)
+            st = stats.get("sample")
+            if prep_id is not None:
+                samples, columns = stats["prep"]
+                if st is not None:
+                    columns += st[1]
+            elif st is not None:
+                samples, columns = st
         elif analysis_id is not None:
-            try:
-                analysis = qdb.analysis.Analysis(analysis_id)
-            except qdb.exceptions.QiitaDBUnknownIDError:
-                pass
-            else:
-                mfp = qdb.util.get_filepath_information(analysis.mapping_file)[
-                    "fullpath"
-                ]
-                samples, columns = pd.read_csv(mfp, sep="\t", dtype=str).shape
-                input_size = sum(
-                    [
-                        fp["fp_size"]
-                        for aid in analysis.samples
-                        for fp in qdb.artifact.Artifact(aid).filepaths
-                    ]
-                )
+            stats = _shape_statistics(analysis_id=analysis_id).get("analysis")
+            if stats is not None:
+                samples, columns, sizes = stats
+                input_size = sum(sizes.values())
 
         return samples, columns, input_size
 
@@ -2683,9 +3862,33 @@ class ProcessingWorkflow(qdb.base.QiitaObject):
 
             qdb.sql_connection.TRN.execute()
 
-    def submit(self):
+    @property
+    def bulk(self):
+        """Whether the workflow was submitted as bulk processing
+
+        Returns
+        -------
+        bool
+            True if the jobs of the workflow are submitted after the rest of
+            the jobs in the admission queue of the job scheduler
+        """
+        with qdb.sql_connection.TRN:
+            sql = """SELECT bulk
+                     FROM qiita.processing_job_workflow
+                     WHERE processing_job_workflow_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [self.id])
+            return qdb.sql_connection.TRN.execute_fetchlast()
+
+    def submit(self, bulk=False):
         """Submits the workflow to execution
 
+        Parameters
+        ----------
+        bulk : bool, optional
+            Whether the workflow is part of a bulk processing (e.g. one of
+            many preparations processed automatically), so its jobs are
+            submitted to the job scheduler after the rest. Default: False
+
         Raises
         ------
         qiita_db.exceptions.QiitaDBOperationNotPermittedError
@@ -2694,6 +3897,10 @@ class ProcessingWorkflow(qdb.base.QiitaObject):
         with qdb.sql_connection.TRN:
             self._raise_if_not_in_construction()
 
+            sql = """UPDATE qiita.processing_job_workflow SET bulk = %s
+                     WHERE processing_job_workflow_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [bulk, self.id])
+
             g = self.graph
             # In order to avoid potential race conditions, we are going to set
             # all the children in 'waiting' status before submitting
@@ -258,6 +258,36 @@ class Transaction(object):
                     )
             self._queries.append((sql, args))
 
+    @_checker
+    def add_copy(self, table, columns, data):
+        """Add a COPY of CSV data to a table to the transaction
+
+        Parameters
+        ----------
+        table : str
+            The schema qualified table to copy the data to
+        columns : list of str
+            The columns of the table, in the same order than in `data`
+        data : file-like object
+            The data to copy in CSV format, without header
+
+        Raises
+        ------
+        RuntimeError
+            If invoked outside a context
+
+        Notes
+        -----
+        All the rows are streamed to the database in a single command, which
+        is much faster than adding an INSERT with `many=True` when there are
+        many rows
+        """
+        sql = "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (
+            table,
+            ", ".join(columns),
+        )
+        self._queries.append((sql, data))
+
     def _execute(self):
         """Internal function that actually executes the transaction
         The `execute` function exposed in the API wraps this one to make sure
@@ -268,7 +298,11 @@ class Transaction(object):
             for sql, sql_args in self._queries:
                 # Execute the current SQL command
                 try:
-                    cur.execute(sql, sql_args)
+                    if hasattr(sql_args, "read"):
+                        # added with add_copy
+                        cur.copy_expert(sql, sql_args)
+                    else:
+                        cur.execute(sql, sql_args)
                 except Exception as e:
                     # We catch any exception as we want to make sure that we
                     # rollback every time that something went wrong
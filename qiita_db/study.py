@@ -35,10 +35,13 @@ import warnings
 from collections import defaultdict
 from copy import deepcopy
 from itertools import chain
+from json import dumps, loads
 
 import qiita_db as qdb
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
-from qiita_core.qiita_settings import qiita_config
+from qiita_core.qiita_settings import qiita_config, r_client
+
+PREP_SAMPLES_MEMBERSHIP_KEY_FORMAT = "study_%s_prep_samples_membership"
 
 
 class Study(qdb.base.QiitaObject):
@@ -1153,6 +1156,70 @@ class Study(qdb.base.QiitaObject):
                 for ptid in qdb.sql_connection.TRN.execute_fetchflatten()
             ]
 
+    def prep_samples_membership(self):
+        """Which of the study samples are present in each of its preps
+
+        Returns
+        -------
+        list of str
+            The sample ids of the study, sorted
+        dict of {int: str}
+            The bitmap of each prep: a string with the same length as the list
+            of samples with '1' if the sample is in the prep and '0' if not
+
+        Notes
+        -----
+        The result is cached in redis until the samples of the study or any
+        of its preps change, see clear_prep_samples_membership
+        """
+        key = PREP_SAMPLES_MEMBERSHIP_KEY_FORMAT % self._id
+        cached = r_client.get(key)
+        if cached is not None:
+            cached = loads(cached)
+            return cached["samples"], {int(k): v for k, v in cached["preps"].items()}
+
+        with qdb.sql_connection.TRN:
+            sql = """SELECT sample_id
+                     FROM qiita.study_sample
+                     WHERE study_id = %s
+                     ORDER BY sample_id"""
+            qdb.sql_connection.TRN.add(sql, [self._id])
+            samples = qdb.sql_connection.TRN.execute_fetchflatten()
+
+            sql = """SELECT prep_template_id, array_agg(sample_id)
+                     FROM qiita.study_prep_template
+                        JOIN qiita.prep_template_sample
+                            USING (prep_template_id)
+                     WHERE study_id = %s
+                     GROUP BY prep_template_id"""
+            qdb.sql_connection.TRN.add(sql, [self._id])
+            results = qdb.sql_connection.TRN.execute_fetchindex()
+
+        positions = {s: i for i, s in enumerate(samples)}
+        preps = {}
+        for prep_id, prep_samples in results:
+            bitmap = bytearray(b"0" * len(samples))
+            for s in prep_samples:
+                if s in positions:
+                    bitmap[positions[s]] = ord("1")
+            preps[prep_id] = bitmap.decode("ascii")
+
+        r_client.set(key, dumps({"samples": samples, "preps": preps}))
+        return samples, preps
+
+    def clear_prep_samples_membership(self):
+        """Removes the cached prep_samples_membership of the study
+
+        Notes
+        -----
+        The cache is cleared right away and, if in a transaction, again after
+        it is committed so no other process can cache the old values
+        """
+        key = PREP_SAMPLES_MEMBERSHIP_KEY_FORMAT % self._id
+        r_client.delete(key)
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add_post_commit_func(r_client.delete, key)
+
     def analyses(self):
         """Get all analyses where samples from this study have been used
 
@@ -0,0 +1,34 @@
+-- Oct 18, 2026
+-- ProcessingJob.create looks for jobs with the same parameters with one
+-- command_parameters->>key ILIKE value predicate per parameter, which can't
+-- use an index so all the jobs of the command are scanned. This stores a
+-- fingerprint of the parameters of each job and indexes it, so the lookup
+-- is a single index search.
+-- The fingerprint is the md5 of the parameters with the values as lower case
+-- text (lists keep their order); this keeps the case insensitive matching of
+-- the ILIKE, so for example false, "false" and "False" are the same value.
+
+CREATE FUNCTION qiita.processing_job_parameters_fingerprint(parameters JSONB)
+RETURNS VARCHAR AS $$
+    SELECT md5(COALESCE(jsonb_object_agg(
+        p.key,
+        CASE jsonb_typeof(p.value)
+            WHEN 'array' THEN COALESCE(
+                (SELECT jsonb_agg(lower(e.value #>> '{}') ORDER BY e.ordinality)
+                 FROM jsonb_array_elements(p.value) WITH ORDINALITY e),
+                '[]'::jsonb)
+            ELSE to_jsonb(lower(p.value #>> '{}'))
+        END), '{}'::jsonb)::text)
+    FROM jsonb_each(parameters) p
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- The column is generated so it is computed for the existing jobs and kept
+-- up to date when the parameters of a job change, for example when the
+-- pending input artifacts of a job in a workflow are set
+ALTER TABLE qiita.processing_job
+    ADD COLUMN parameters_fingerprint VARCHAR GENERATED ALWAYS AS (
+        qiita.processing_job_parameters_fingerprint(command_parameters))
+    STORED;
+
+CREATE INDEX idx_processing_job_parameters_fingerprint
+    ON qiita.processing_job (command_id, parameters_fingerprint);
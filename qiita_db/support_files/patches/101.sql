@@ -0,0 +1,18 @@
+-- Oct 18, 2026
+-- The emails of the processing jobs were sent while changing the status of
+-- the job, so the transaction (and its locks) waited for the smtp server.
+-- Now the emails are added to this outbox in the same transaction and are
+-- sent by:
+--     qiita-cron-job send-emails
+-- which sends all the emails of a user as a single one and keeps the emails
+-- that failed to retry them later.
+
+CREATE TABLE qiita.notification_outbox (
+    notification_id BIGSERIAL PRIMARY KEY,
+    email           VARCHAR NOT NULL,
+    subject         VARCHAR NOT NULL,
+    message         VARCHAR NOT NULL,
+    created         TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    last_error      VARCHAR
+);
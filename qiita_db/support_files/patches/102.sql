@@ -0,0 +1,31 @@
+-- Oct 18, 2026
+-- The local qiita-plugin-launcher started a new process per submitted job
+-- without any limit. The submitted jobs are now added to this queue and are
+-- started when there are free workers (JOB_SCHEDULER_LOCAL_WORKERS in the
+-- [job_scheduler] section of the configuration) and the job they depend on
+-- finished successfully. As the queue is in the database, the jobs that
+-- haven't started yet survive a restart of the server.
+-- When the job finishes its exit status and the resources it used (cpu time
+-- in seconds and max memory in bytes) are also kept here.
+
+CREATE TABLE qiita.local_job_queue (
+    processing_job_id   UUID NOT NULL,
+    depends_on          UUID,
+    queued              TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    started             TIMESTAMP,
+    finished            TIMESTAMP,
+    pid                 INTEGER,
+    exit_status         INTEGER,
+    cpu_time            FLOAT,
+    memory_used         BIGINT,
+    CONSTRAINT pk_local_job_queue PRIMARY KEY ( processing_job_id ),
+    CONSTRAINT fk_local_job_queue_job FOREIGN KEY ( processing_job_id )
+        REFERENCES qiita.processing_job ( processing_job_id )
+        ON DELETE CASCADE,
+    CONSTRAINT fk_local_job_queue_depends_on FOREIGN KEY ( depends_on )
+        REFERENCES qiita.processing_job ( processing_job_id )
+        ON DELETE CASCADE
+);
+
+CREATE INDEX idx_local_job_queue_pending ON qiita.local_job_queue ( queued )
+    WHERE finished IS NULL;
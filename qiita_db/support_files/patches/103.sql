@@ -0,0 +1,31 @@
+-- Oct 18, 2026
+-- Each plugin completion created a complete_job private job that was
+-- submitted to the scheduler, so the completion of a job waited in the queue
+-- of the scheduler. The completions are now added to this queue and processed
+-- by the Qiita server (see JOB_SCHEDULER_COMPLETION_WORKERS in the
+-- [job_scheduler] section of the configuration); only the completions with
+-- large files, which need to be moved and checksummed, are escalated to a
+-- complete_job, which is stored in complete_job_id.
+-- As the queue is in the database, a completion is processed only once even
+-- if the plugin retries it, and the completions that were not finished when
+-- the server stopped are processed again when it restarts.
+
+CREATE TABLE qiita.completion_queue (
+    processing_job_id   UUID NOT NULL,
+    payload             TEXT NOT NULL,
+    queued              TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    started             TIMESTAMP,
+    finished            TIMESTAMP,
+    pid                 INTEGER,
+    complete_job_id     UUID,
+    CONSTRAINT pk_completion_queue PRIMARY KEY ( processing_job_id ),
+    CONSTRAINT fk_completion_queue_job FOREIGN KEY ( processing_job_id )
+        REFERENCES qiita.processing_job ( processing_job_id )
+        ON DELETE CASCADE,
+    CONSTRAINT fk_completion_queue_complete_job FOREIGN KEY ( complete_job_id )
+        REFERENCES qiita.processing_job ( processing_job_id )
+        ON DELETE SET NULL
+);
+
+CREATE INDEX idx_completion_queue_pending ON qiita.completion_queue ( queued )
+    WHERE finished IS NULL;
@@ -0,0 +1,28 @@
+-- Oct 18, 2026
+-- The memory and time models fitted to the resources used by the jobs of
+-- each command (qiita.slurm_resource_allocations), see
+-- qiita_db.util.update_resource_allocation_models. When a command has a model
+-- the memory and time requested for its jobs are the ones predicted by the
+-- model multiplied by margin, instead of the ones in
+-- qiita.processing_job_resource_allocation.
+-- The expression of the equation is copied from qiita.allocation_equations
+-- as the parameters (k, a, b) are only valid for the expression they were
+-- fitted with. The margin is kept when the model is fitted again, so it can
+-- be tuned per command.
+
+CREATE TABLE qiita.resource_allocation_model (
+    command_id          BIGINT NOT NULL,
+    memory_equation     VARCHAR NOT NULL,
+    memory_expression   VARCHAR NOT NULL,
+    memory_parameters   FLOAT[] NOT NULL,
+    time_equation       VARCHAR NOT NULL,
+    time_expression     VARCHAR NOT NULL,
+    time_parameters     FLOAT[] NOT NULL,
+    jobs                INTEGER NOT NULL,
+    margin              FLOAT NOT NULL DEFAULT 1.2,
+    fitted              TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT pk_resource_allocation_model PRIMARY KEY ( command_id ),
+    CONSTRAINT fk_resource_allocation_model_command FOREIGN KEY ( command_id )
+        REFERENCES qiita.software_command ( command_id )
+        ON DELETE CASCADE
+);
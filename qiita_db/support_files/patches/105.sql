@@ -0,0 +1,35 @@
+-- Oct 18, 2026
+-- ProcessingJob.shape, used to calculate the resource allocation of every
+-- submitted job, counted the samples and columns of the templates and read
+-- the mapping file of the analyses to get their size. These tables keep those
+-- sizes: the templates update them every time they change and the analyses
+-- when their mapping file is built; the ones that don't exist yet (the
+-- templates and analyses created before this patch) are added the first time
+-- they are needed.
+-- template_type is 'sample' (template_id is the study id) or 'prep'; the
+-- rows of the deleted templates are removed by their delete.
+-- The filepath_sizes of an analysis are the total bytes of the files of its
+-- artifacts by filepath type, e.g. {"biom": 1024, "plain_text": 256}.
+
+CREATE TABLE qiita.template_statistics (
+    template_type   VARCHAR NOT NULL,
+    template_id     BIGINT NOT NULL,
+    samples         INTEGER NOT NULL,
+    columns         INTEGER NOT NULL,
+    updated         TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT pk_template_statistics PRIMARY KEY ( template_type, template_id ),
+    CONSTRAINT chk_template_statistics_type
+        CHECK ( template_type IN ('sample', 'prep') )
+);
+
+CREATE TABLE qiita.analysis_statistics (
+    analysis_id     BIGINT NOT NULL,
+    samples         INTEGER NOT NULL,
+    columns         INTEGER NOT NULL,
+    filepath_sizes  JSONB NOT NULL,
+    updated         TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT pk_analysis_statistics PRIMARY KEY ( analysis_id ),
+    CONSTRAINT fk_analysis_statistics_analysis FOREIGN KEY ( analysis_id )
+        REFERENCES qiita.analysis ( analysis_id )
+        ON DELETE CASCADE
+);
@@ -0,0 +1,39 @@
+-- Oct 18, 2026
+-- With qiita-plugin-launcher-slurm every submitted job was sent to sbatch
+-- right away, so a single user submitting the default workflow of hundreds of
+-- preparations could take all the allocation of the qiita account. When any
+-- of JOB_SCHEDULER_MAX_JOBS, JOB_SCHEDULER_MAX_USER_JOBS or
+-- JOB_SCHEDULER_MAX_COMMAND_JOBS is set (see the [job_scheduler] section of
+-- the configuration) the submitted jobs are added to this queue and sent to
+-- sbatch as the jobs already submitted finish, see
+-- qiita_db.processing_job.dispatch_admissions.
+-- priority is the class of the job: 1 for processing and 2 for bulk
+-- processing, the jobs of the workflows submitted with bulk set to true (e.g.
+-- the default workflows added by the plugins and qiita-auto-processing); the
+-- private and validator jobs are not queued. depends_on is the job that has
+-- to finish successfully before the job can be submitted.
+-- submitted is when the job was sent to sbatch and finished when Qiita
+-- noticed that it is not queued or running anymore.
+
+ALTER TABLE qiita.processing_job_workflow
+    ADD COLUMN bulk BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE qiita.admission_queue (
+    processing_job_id   UUID NOT NULL,
+    depends_on          UUID,
+    priority            INTEGER NOT NULL,
+    queued              TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    submitted           TIMESTAMP,
+    finished            TIMESTAMP,
+    CONSTRAINT pk_admission_queue PRIMARY KEY ( processing_job_id ),
+    CONSTRAINT fk_admission_queue_job FOREIGN KEY ( processing_job_id )
+        REFERENCES qiita.processing_job ( processing_job_id )
+        ON DELETE CASCADE,
+    CONSTRAINT fk_admission_queue_depends_on FOREIGN KEY ( depends_on )
+        REFERENCES qiita.processing_job ( processing_job_id )
+        ON DELETE CASCADE
+);
+
+CREATE INDEX idx_admission_queue_pending
+    ON qiita.admission_queue ( priority, queued )
+    WHERE finished IS NULL;
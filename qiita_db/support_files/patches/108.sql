@@ -0,0 +1,9 @@
+-- Oct 18, 2026
+-- The emails of the outbox are now also sent by the master server, so more
+-- than one process can send them at the same time. Each process claims the
+-- emails it is going to send, so the other processes skip them; a claim
+-- older than an hour is from a process that was lost and the email can be
+-- claimed again. The emails that failed too many times are removed from the
+-- outbox and added to the logs, see qiita_db.util.send_queued_emails.
+
+ALTER TABLE qiita.notification_outbox ADD COLUMN claimed TIMESTAMP;
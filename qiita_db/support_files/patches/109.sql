@@ -0,0 +1,14 @@
+-- Oct 18, 2026
+-- The process processing a completion was checked with its pid, but the
+-- completions can be dispatched by the Qiita processes of different hosts,
+-- where the pid is a different process. The host where the process was
+-- started is now kept with its pid, so only the processes of the same host
+-- are checked.
+-- A completion whose process is lost is queued again; attempts keeps how many
+-- times it was started so a completion that keeps killing its process (e.g.
+-- running out of memory) sets the job as error instead of being retried
+-- forever.
+
+ALTER TABLE qiita.completion_queue
+    ADD COLUMN host VARCHAR,
+    ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
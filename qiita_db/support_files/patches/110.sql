@@ -0,0 +1,6 @@
+-- Oct 18, 2026
+-- As in qiita.completion_queue (see 109.sql), the host where the process of
+-- a local job was started is kept with its pid, as the pid can only be
+-- checked in that host.
+
+ALTER TABLE qiita.local_job_queue ADD COLUMN host VARCHAR;
@@ -0,0 +1,18 @@
+-- Oct 18, 2026
+-- The models of qiita.resource_allocation_model were used as soon as they
+-- were fitted. Now update_resource_allocation_models also backtests them
+-- (fitting them to the oldest jobs of the command and testing them with the
+-- newest ones, see qiita_db.util.resource_allocation_backtest) and keeps the
+-- fraction of the test jobs that would have run out of memory or time; only
+-- the models whose failure rates are under the threshold are enabled, and
+-- only the enabled models are used by the jobs.
+-- The largest memory and time used by the jobs the models were fitted to
+-- are kept too: a job never requests less than those (multiplied by the
+-- margin), as the models are only fitted to the jobs that succeeded.
+
+ALTER TABLE qiita.resource_allocation_model
+    ADD COLUMN max_memory_used FLOAT,
+    ADD COLUMN max_time_used FLOAT,
+    ADD COLUMN memory_failure_rate FLOAT,
+    ADD COLUMN time_failure_rate FLOAT,
+    ADD COLUMN enabled BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,9 @@
+-- Oct 18, 2026
+-- The queue of the sample and prep information files generated in the
+-- background is also processed by the master server, so the templates are
+-- claimed before generating their files to not generate them twice when
+-- qiita-cron-job generate-template-files runs at the same time. A claim older
+-- than an hour is from a process that was lost. A new change to the template
+-- releases its claim, so its files are generated again.
+
+ALTER TABLE qiita.metadata_template_file_queue ADD COLUMN claimed TIMESTAMP;
@@ -0,0 +1,39 @@
+-- Oct 18, 2026
+-- Adding a table with the coordinates of the samples so the stats map doesn't
+-- need to read every qiita.sample_X table
+
+CREATE TABLE qiita.sample_coordinate (
+    sample_id VARCHAR NOT NULL PRIMARY KEY,
+    study_id BIGINT NOT NULL,
+    latitude FLOAT8 NOT NULL,
+    longitude FLOAT8 NOT NULL,
+    CONSTRAINT fk_sample_coordinate_sample FOREIGN KEY (sample_id) REFERENCES qiita.study_sample (sample_id) ON UPDATE CASCADE ON DELETE CASCADE,
+    CONSTRAINT fk_sample_coordinate_study FOREIGN KEY (study_id) REFERENCES qiita.study (study_id)
+);
+CREATE INDEX idx_sample_coordinate_study ON qiita.sample_coordinate (study_id);
+
+-- populating the table with the existing sample information
+DO $do$
+DECLARE
+    sid BIGINT;
+BEGIN
+    FOR sid IN
+        SELECT DISTINCT study_id
+        FROM qiita.study_sample
+    LOOP
+        CONTINUE WHEN to_regclass('qiita.sample_' || sid) IS NULL;
+        EXECUTE format(
+            'INSERT INTO qiita.sample_coordinate
+                (sample_id, study_id, latitude, longitude)
+             SELECT sample_id, %s,
+                    CAST(sample_values->>''latitude'' AS FLOAT),
+                    CAST(sample_values->>''longitude'' AS FLOAT)
+             FROM qiita.%I
+             WHERE sample_id != ''qiita_sample_column_names'' AND
+                   sample_values->>''latitude'' != ''NaN'' AND
+                   sample_values->>''longitude'' != ''NaN'' AND
+                   isnumeric(sample_values->>''latitude'') AND
+                   isnumeric(sample_values->>''longitude'')',
+            sid, 'sample_' || sid);
+    END LOOP;
+END $do$;
@@ -0,0 +1,79 @@
+-- Oct 18, 2026
+-- Searching samples by their metadata required scanning the JSONB of every
+-- qiita.sample_<id> and qiita.prep_<id> table. This creates a single
+-- (sample, column, value) projection of all the information files that is
+-- kept in sync by the metadata template write paths and indexed for
+-- equality, range (numeric values) and contains (trigram) searches.
+
+-- Note: for this to work you need to have created as admin the extension
+-- CREATE EXTENSION pg_trgm;
+CREATE EXTENSION IF NOT EXISTS "pg_trgm" WITH SCHEMA public;
+
+CREATE TABLE qiita.metadata_search_value (
+    sample_id           VARCHAR NOT NULL,
+    study_id            BIGINT NOT NULL,
+    -- NULL for the sample information
+    prep_template_id    BIGINT,
+    column_name         VARCHAR NOT NULL,
+    value               VARCHAR,
+    numeric_value       FLOAT8,
+    CONSTRAINT fk_metadata_search_value_sample FOREIGN KEY ( sample_id )
+        REFERENCES qiita.study_sample( sample_id )
+        ON UPDATE CASCADE ON DELETE CASCADE,
+    CONSTRAINT fk_metadata_search_value_study FOREIGN KEY ( study_id )
+        REFERENCES qiita.study( study_id ),
+    CONSTRAINT fk_metadata_search_value_prep FOREIGN KEY ( prep_template_id )
+        REFERENCES qiita.prep_template( prep_template_id ) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_metadata_search_value_sample_info
+    ON qiita.metadata_search_value ( study_id, sample_id )
+    WHERE prep_template_id IS NULL;
+CREATE INDEX idx_metadata_search_value_prep_info
+    ON qiita.metadata_search_value ( prep_template_id, sample_id );
+CREATE INDEX idx_metadata_search_value_value
+    ON qiita.metadata_search_value ( column_name, value );
+CREATE INDEX idx_metadata_search_value_numeric
+    ON qiita.metadata_search_value ( column_name, numeric_value )
+    WHERE numeric_value IS NOT NULL;
+CREATE INDEX idx_metadata_search_value_trgm
+    ON qiita.metadata_search_value USING GIN ( value gin_trgm_ops );
+
+-- populating the projection with the existing information files
+DO $do$
+DECLARE
+    sid BIGINT;
+    pid BIGINT;
+BEGIN
+    FOR sid IN
+        SELECT study_id FROM qiita.study
+    LOOP
+        CONTINUE WHEN to_regclass('qiita.sample_' || sid) IS NULL;
+        EXECUTE format(
+            'INSERT INTO qiita.metadata_search_value (
+                sample_id, study_id, prep_template_id, column_name, value,
+                numeric_value)
+             SELECT sample_id, %s, NULL, key, value,
+                    CASE WHEN value NOT IN (''NaN'', ''Infinity'', ''-Infinity'')
+                         AND isnumeric(value) THEN CAST(value AS FLOAT8) END
+             FROM qiita.%I, jsonb_each_text(sample_values)
+             WHERE sample_id != ''qiita_sample_column_names''',
+            sid, 'sample_' || sid);
+    END LOOP;
+
+    FOR sid, pid IN
+        SELECT study_id, prep_template_id FROM qiita.study_prep_template
+    LOOP
+        CONTINUE WHEN to_regclass('qiita.prep_' || pid) IS NULL;
+        EXECUTE format(
+            'INSERT INTO qiita.metadata_search_value (
+                sample_id, study_id, prep_template_id, column_name, value,
+                numeric_value)
+             SELECT sample_id, %s, %s, key, value,
+                    CASE WHEN value NOT IN (''NaN'', ''Infinity'', ''-Infinity'')
+                         AND isnumeric(value) THEN CAST(value AS FLOAT8) END
+             FROM qiita.%I, jsonb_each_text(sample_values)
+             WHERE sample_id != ''qiita_sample_column_names''',
+            sid, pid, 'prep_' || pid);
+    END LOOP;
+END $do$;
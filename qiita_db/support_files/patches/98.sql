@@ -0,0 +1,154 @@
+-- Oct 18, 2026
+-- Optional consolidated storage for the sample and prep information files.
+-- Each information file is stored in its own qiita.sample_<study_id> or
+-- qiita.prep_<prep_template_id> table, so large deployments have tens of
+-- thousands of tiny tables in the catalogue. This patch adds a single table,
+-- partitioned by template type and hashed by template id, that can hold all
+-- the rows instead. When a template is consolidated its table is replaced by a
+-- view with the same name and columns, so the existing SQL keeps working.
+--
+-- Nothing is moved by this patch; the migration is opt-in and incremental
+-- (each template is moved in its own transaction) via:
+--     qiita-env consolidate-templates
+-- which also makes the new templates use the consolidated storage.
+--
+-- To compare both storages run on a copy of the database, before and after
+-- the migration:
+--   - catalogue size:
+--       SELECT COUNT(*) FROM pg_class;
+--       SELECT pg_size_pretty(pg_total_relation_size('pg_attribute'));
+--   - to_dataframe of a large template, from python:
+--       %timeit PrepTemplate(<id>).to_dataframe()
+--   - cross-study queries, for example:
+--       EXPLAIN ANALYZE SELECT template_id, COUNT(*)
+--           FROM qiita.metadata_template_values
+--           WHERE template_type = 'prep' GROUP BY template_id;
+--     vs. the same count over every qiita.prep_<id> table
+
+CREATE TABLE qiita.metadata_template_settings (
+    consolidated_storage BOOLEAN NOT NULL DEFAULT FALSE
+);
+INSERT INTO qiita.metadata_template_settings (consolidated_storage)
+    VALUES (FALSE);
+
+CREATE TABLE qiita.metadata_template_values (
+    template_type   VARCHAR NOT NULL,
+    template_id     BIGINT NOT NULL,
+    sample_id       VARCHAR NOT NULL,
+    sample_values   JSONB NOT NULL,
+    CONSTRAINT pk_metadata_template_values
+        PRIMARY KEY ( template_type, template_id, sample_id )
+) PARTITION BY LIST ( template_type );
+
+CREATE TABLE qiita.metadata_template_values_sample
+    PARTITION OF qiita.metadata_template_values FOR VALUES IN ('sample')
+    PARTITION BY HASH ( template_id );
+CREATE TABLE qiita.metadata_template_values_prep
+    PARTITION OF qiita.metadata_template_values FOR VALUES IN ('prep')
+    PARTITION BY HASH ( template_id );
+
+DO $do$
+BEGIN
+    FOR i IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE qiita.%I PARTITION OF
+                qiita.metadata_template_values_sample
+                FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+            'metadata_template_values_sample_' || i, i);
+        EXECUTE format(
+            'CREATE TABLE qiita.%I PARTITION OF
+                qiita.metadata_template_values_prep
+                FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+            'metadata_template_values_prep_' || i, i);
+    END LOOP;
+END $do$;
+
+-- the views of the consolidated templates are automatically updatable for
+-- UPDATE and DELETE, but INSERT needs to add the template type and id
+CREATE FUNCTION qiita.metadata_template_view_insert() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO qiita.metadata_template_values (
+        template_type, template_id, sample_id, sample_values)
+    VALUES (TG_ARGV[0], TG_ARGV[1]::BIGINT, NEW.sample_id, NEW.sample_values);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION qiita.create_metadata_template_view(
+        ttype VARCHAR, tid BIGINT) RETURNS VOID AS $$
+DECLARE
+    tname VARCHAR := ttype || '_' || tid;
+BEGIN
+    EXECUTE format(
+        'CREATE VIEW qiita.%I AS
+            SELECT sample_id, sample_values
+            FROM qiita.metadata_template_values
+            WHERE template_type = %L AND template_id = %s',
+        tname, ttype, tid);
+    EXECUTE format(
+        'CREATE TRIGGER %I INSTEAD OF INSERT ON qiita.%I
+            FOR EACH ROW EXECUTE PROCEDURE
+            qiita.metadata_template_view_insert(%L, %L)',
+        'insert_' || tname, tname, ttype, tid);
+END;
+$$ LANGUAGE plpgsql;
+
+-- creates the storage of a new template, used by
+-- MetadataTemplate._common_creation_steps
+CREATE FUNCTION qiita.create_metadata_template_storage(
+        ttype VARCHAR, tid BIGINT) RETURNS VOID AS $$
+BEGIN
+    IF (SELECT consolidated_storage FROM qiita.metadata_template_settings) THEN
+        PERFORM qiita.create_metadata_template_view(ttype, tid);
+    ELSE
+        EXECUTE format(
+            'CREATE TABLE qiita.%I (
+                sample_id VARCHAR NOT NULL PRIMARY KEY,
+                sample_values JSONB NOT NULL)',
+            ttype || '_' || tid);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- drops the storage of a template, used by SampleTemplate.delete and
+-- PrepTemplate.delete
+CREATE FUNCTION qiita.drop_metadata_template_storage(
+        ttype VARCHAR, tid BIGINT) RETURNS VOID AS $$
+DECLARE
+    tname VARCHAR := ttype || '_' || tid;
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.views
+               WHERE table_schema = 'qiita' AND table_name = tname) THEN
+        EXECUTE format('DROP VIEW qiita.%I', tname);
+        DELETE FROM qiita.metadata_template_values
+            WHERE template_type = ttype AND template_id = tid;
+    ELSE
+        EXECUTE format('DROP TABLE qiita.%I', tname);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- moves the rows of a template table to the consolidated storage; returns
+-- false if there is nothing to move
+CREATE FUNCTION qiita.consolidate_metadata_template(
+        ttype VARCHAR, tid BIGINT) RETURNS BOOLEAN AS $$
+DECLARE
+    tname VARCHAR := ttype || '_' || tid;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.tables
+                   WHERE table_schema = 'qiita' AND table_name = tname
+                        AND table_type = 'BASE TABLE') THEN
+        RETURN FALSE;
+    END IF;
+
+    EXECUTE format(
+        'INSERT INTO qiita.metadata_template_values (
+            template_type, template_id, sample_id, sample_values)
+         SELECT %L, %s, sample_id, sample_values FROM qiita.%I',
+        ttype, tid, tname);
+    EXECUTE format('DROP TABLE qiita.%I', tname);
+    PERFORM qiita.create_metadata_template_view(ttype, tid);
+
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,20 @@
+-- Oct 18, 2026
+-- Every change to a sample or prep information file regenerates its full
+-- text file synchronously. This adds a queue so the files can instead be
+-- generated in the background; the queue has a single row per information
+-- file so a burst of edits only generates the file of the latest one.
+-- The background generation is opt-in via:
+--     qiita-env template-files --background
+-- and the queue is processed by:
+--     qiita-cron-job generate-template-files
+
+ALTER TABLE qiita.metadata_template_settings
+    ADD COLUMN background_file_generation BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE qiita.metadata_template_file_queue (
+    template_type   VARCHAR NOT NULL,
+    template_id     BIGINT NOT NULL,
+    requested       TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    CONSTRAINT pk_metadata_template_file_queue
+        PRIMARY KEY ( template_type, template_id )
+);
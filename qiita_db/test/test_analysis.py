@@ -6,6 +6,7 @@ from shutil import move
 from unittest import TestCase, main
 
 from biom import load_table
+from pandas import read_csv
 from pandas.testing import assert_frame_equal
 
 import qiita_db as qdb
@@ -486,6 +487,20 @@ class TestAnalysis(TestCase):
         exp = {6: {"1.SKB7.640196", "1.SKB8.640193", "1.SKM4.640180", "1.SKM9.640192"}}
         self.assertCountEqual(analysis.samples, exp)
 
+    def test_add_samples_duplicated(self):
+        analysis = qdb.user.User("shared@foo.bar").default_analysis
+        analysis.add_samples({4: ["1.SKD8.640184", "1.SKB7.640196"]})
+        # already selected and repeated samples are ignored, and the artifact
+        # ids can come as strings from the websocket messages
+        analysis.add_samples(
+            {"4": ["1.SKD8.640184", "1.SKD8.640184", "1.SKM9.640192"], 5: []}
+        )
+        obs = analysis.samples
+        self.assertCountEqual(list(obs.keys()), [4])
+        self.assertCountEqual(
+            obs[4], ["1.SKD8.640184", "1.SKB7.640196", "1.SKM9.640192"]
+        )
+
     def test_share_unshare(self):
         analysis = self._create_analyses_with_samples()
         user = qdb.user.User("admin@foo.bar")
@@ -523,6 +538,24 @@ class TestAnalysis(TestCase):
 
         assert_frame_equal(obs, exp, check_like=True)
 
+        # the sizes used by ProcessingJob.shape are stored
+        mfp = qdb.util.get_filepath_information(analysis.mapping_file)["fullpath"]
+        with qdb.sql_connection.TRN:
+            sql = """SELECT samples, columns, filepath_sizes
+                     FROM qiita.analysis_statistics
+                     WHERE analysis_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [analysis.id])
+            obs = qdb.sql_connection.TRN.execute_fetchindex()
+        self.assertEqual(
+            obs,
+            [
+                [
+                    *read_csv(mfp, sep="\t", dtype=str).shape,
+                    qdb.util.get_artifacts_filepath_sizes(analysis.samples),
+                ]
+            ],
+        )
+
         # testing categories
         analysis._build_mapping_file(
             samples, categories=set(["env_package", "experiment_design_description"])
@@ -206,6 +206,147 @@ class MetaUtilTests(TestCase):
         obs = qdb.meta_util.get_lat_longs()
         self.assertCountEqual(obs, exp)
 
+        # clustering the samples
+        # the grid is made coarser until the points fit, keeping one point
+        # per cell, so the isolated samples are not dropped: at 100 degrees
+        # there is a cell in each quadrant
+        obs = qdb.meta_util.get_lat_longs(max_points=10, precision=0)
+        self.assertEqual(len(obs), 4)
+        self.assertEqual({o[0] for o in obs}, {1})
+        self.assertEqual(
+            {(lat >= 50, lng >= 50) for _, lat, lng in exp},
+            {(lat >= 50, lng >= 50) for _, lat, lng in obs},
+        )
+        obs = qdb.meta_util.get_lat_longs(max_points=3, precision=0)
+        self.assertEqual(len(obs), 3)
+        obs = qdb.meta_util.get_lat_longs(max_points=100, precision=5)
+        self.assertCountEqual(
+            [[s, round(lat, 5), round(lng, 5)] for s, lat, lng in obs],
+            [[s, round(lat, 5), round(lng, 5)] for s, lat, lng in exp],
+        )
+
+        # updating the coordinates of a sample
+        st = qdb.study.Study(1).sample_template
+        st.update_category("latitude", {"1.SKB8.640193": "10.0"})
+        obs = qdb.meta_util.get_lat_longs()
+        self.assertIn([1, 10.0, 65.3283470202], obs)
+        self.assertNotIn([1, 74.0894932572, 65.3283470202], obs)
+        st.update_category("latitude", {"1.SKB8.640193": "74.0894932572"})
+
+        for k, v in old_visibility.items():
+            k.artifact.visibility = v
+
+    def test_search_metadata(self):
+        search = qdb.meta_util.search_metadata
+
+        obs = search([("anonymized_name", "=", "SKB8")], study_ids=[1])
+        self.assertEqual(obs, {1: ["1.SKB8.640193"]})
+
+        obs = search(
+            [("ph", ">", "6.9"), ("description_duplicate", "contains", "BURMESE R")],
+            study_ids=[1],
+        )
+        self.assertEqual(obs, {1: ["1.SKB7.640196", "1.SKB8.640193"]})
+
+        obs = search([("ph", "<=", 6.8), ("ph", ">=", 6.8)], study_ids=[1])
+        self.assertEqual(len(obs[1]), 9)
+
+        # center_name is only part of the preparation information
+        obs = search([("center_name", "=", "ANL")], study_ids=[1])
+        self.assertEqual(len(obs[1]), 27)
+        obs = search([("center_name", "=", "ANL")], "sample", study_ids=[1])
+        self.assertEqual(obs, {})
+        obs = search([("center_name", "=", "ANL")], "prep", study_ids=[1])
+        self.assertEqual(len(obs[1]), 27)
+
+        # study 1 is not public
+        self.assertEqual(search([("anonymized_name", "=", "SKB8")]), {})
+
+        # in a public study only the values of the preparations with public
+        # artifacts are searched: prep 2 (artifact 7) is public and prep 1
+        # is still private
+        qdb.metadata_template.prep_template.PrepTemplate(1).update_category(
+            "center_name", {"1.SKB8.640193": "PRIVATE"}
+        )
+        sql = """UPDATE qiita.artifact
+                 SET visibility_id = %s
+                 WHERE artifact_id = 7"""
+        qdb.sql_connection.perform_as_transaction(
+            sql, [qdb.util.convert_to_id("public", "visibility")]
+        )
+        obs = search([("anonymized_name", "=", "SKB8")])
+        self.assertEqual(obs, {1: ["1.SKB8.640193"]})
+        self.assertEqual(search([("center_name", "=", "PRIVATE")]), {})
+        obs = search([("center_name", "=", "PRIVATE")], study_ids=[1])
+        self.assertEqual(obs, {1: ["1.SKB8.640193"]})
+
+        # the values are updated with the template
+        st = qdb.study.Study(1).sample_template
+        st.update_category("anonymized_name", {"1.SKB8.640193": "NEW"})
+        obs = search([("anonymized_name", "=", "SKB8")], study_ids=[1])
+        self.assertEqual(obs, {})
+        obs = search([("anonymized_name", "=", "NEW")], study_ids=[1])
+        self.assertEqual(obs, {1: ["1.SKB8.640193"]})
+        st.update_category("anonymized_name", {"1.SKB8.640193": "SKB8"})
+
+        with self.assertRaises(ValueError):
+            search([])
+        with self.assertRaises(ValueError):
+            search([("ph", "~", "6")], study_ids=[1])
+        with self.assertRaises(ValueError):
+            search([("ph", ">", "high")], study_ids=[1])
+        with self.assertRaises(ValueError):
+            search([("ph", ">", "6")], "artifact", study_ids=[1])
+
+    def test_consolidated_storage(self):
+        search = qdb.meta_util.search_metadata
+        queries = [
+            ([("anonymized_name", "=", "SKB8")], None),
+            (
+                [
+                    ("ph", ">", "6.9"),
+                    ("description_duplicate", "contains", "BURMESE R"),
+                ],
+                None,
+            ),
+            ([("ph", "<=", 6.8), ("ph", ">=", 6.8)], None),
+            ([("center_name", "=", "ANL")], None),
+            ([("center_name", "=", "ANL")], "sample"),
+            ([("center_name", "!=", "ANL")], "prep"),
+        ]
+        exp_search = [search(c, t, study_ids=[1]) for c, t in queries]
+
+        old_visibility = {}
+        for pt in qdb.study.Study(1).prep_templates():
+            old_visibility[pt] = pt.artifact.visibility
+            pt.artifact.visibility = "public"
+        exp_lat_longs = qdb.meta_util.get_lat_longs()
+        exp_clusters = qdb.meta_util.get_lat_longs(max_points=10, precision=0)
+        self.assertNotEqual(exp_lat_longs, [])
+        exp_search_values = qdb.util.get_count("qiita.metadata_search_value")
+        exp_coordinates = qdb.util.get_count("qiita.sample_coordinate")
+
+        qdb.environment_manager.consolidate_metadata_templates()
+        # the projections are kept for the consolidated templates
+        self.assertEqual(
+            qdb.util.get_count("qiita.metadata_search_value"), exp_search_values
+        )
+        self.assertEqual(qdb.util.get_count("qiita.sample_coordinate"), exp_coordinates)
+        obs = [search(c, t, study_ids=[1]) for c, t in queries]
+        self.assertEqual(obs, exp_search)
+        self.assertCountEqual(qdb.meta_util.get_lat_longs(), exp_lat_longs)
+        obs = qdb.meta_util.get_lat_longs(max_points=10, precision=0)
+        self.assertCountEqual(obs, exp_clusters)
+
+        # the projections are updated through the views
+        st = qdb.study.Study(1).sample_template
+        st.update_category("anonymized_name", {"1.SKB8.640193": "NEW"})
+        st.update_category("latitude", {"1.SKB8.640193": "10.0"})
+        obs = search([("anonymized_name", "=", "NEW")], study_ids=[1])
+        self.assertEqual(obs, {1: ["1.SKB8.640193"]})
+        self.assertIn([1, 10.0, 65.3283470202], qdb.meta_util.get_lat_longs())
+        self.assertEqual(qdb.util.get_count("qiita.sample_coordinate"), exp_coordinates)
+
         for k, v in old_visibility.items():
             k.artifact.visibility = v
 
@@ -8,16 +8,22 @@
 
 from datetime import datetime
 from json import dumps, loads
-from os import close
-from tempfile import mkstemp
+from os import chmod, close, environ, getpid
+from os.path import join
+from queue import Queue
+from shutil import rmtree
+from socket import gethostname
+from tempfile import mkdtemp, mkstemp
 from time import sleep
 from unittest import TestCase, main
+from unittest.mock import PropertyMock, patch
 
 import networkx as nx
 import pandas as pd
 
 import qiita_db as qdb
-from qiita_core.qiita_settings import qiita_config
+from qiita_core.qiita_settings import qiita_config, r_client
+from qiita_core.testing import wait_for_processing_job
 from qiita_core.util import qiita_test_checker
 
 
@@ -292,12 +298,364 @@ class ProcessingJobTest(TestCase):
         with self.assertRaises(qdb.exceptions.QiitaDBStatusError):
             job._set_status("running")
 
+    def test_job_event_channels(self):
+        self.assertEqual(
+            self.tester1._job_event_channels(),
+            {"job_events:study:1", "job_events:command:1"},
+        )
+        job = _create_job()
+        self.assertEqual(
+            job._job_event_channels(),
+            {"job_events:study:1", "job_events:command:%d" % job.command.id},
+        )
+        # a deleted prep template only leaves the command channel
+        cmd = qdb.software.Software.from_name_and_version("Qiita", "alpha").get_command(
+            "update_prep_template"
+        )
+        job = qdb.processing_job.ProcessingJob.create(
+            qdb.user.User("test@foo.bar"),
+            qdb.software.Parameters.load(
+                cmd, values_dict={"prep_template": 1000, "template_fp": "/tmp/a"}
+            ),
+            True,
+        )
+        self.assertEqual(
+            job._job_event_channels(),
+            {"job_events:command:%d" % job.command.id},
+        )
+
+    def test_set_status_publishes_event(self):
+        job = _create_job()
+        pubsub = r_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe("job_events:study:1")
+        # consume the subscription confirmation
+        pubsub.get_message(timeout=1)
+        job._set_status("running")
+        job.step = "demultiplexing"
+        obs = [loads(pubsub.get_message(timeout=1)["data"]) for _ in range(2)]
+        pubsub.close()
+        exp = [
+            {"job_id": job.id, "status": "running", "step": None},
+            {"job_id": job.id, "status": "running", "step": "demultiplexing"},
+        ]
+        self.assertEqual(obs, exp)
+
     def test_submit_error(self):
         job = _create_job()
         job._set_status("queued")
         with self.assertRaises(qdb.exceptions.QiitaDBOperationNotPermittedError):
             job.submit()
 
+    def test_queue_and_dispatch_local_jobs(self):
+        jobs = [_create_job() for _ in range(3)]
+        qdb.processing_job.queue_local_jobs(jobs)
+        self.assertEqual([j.status for j in jobs], ["queued"] * 3)
+
+        sql = """SELECT processing_job_id, depends_on, exit_status
+                 FROM qiita.local_job_queue
+                 WHERE processing_job_id IN %s
+                 ORDER BY queued"""
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, [tuple(j.id for j in jobs)])
+            obs = qdb.sql_connection.TRN.execute_fetchindex()
+        exp = [
+            [jobs[0].id, None, None],
+            [jobs[1].id, jobs[0].id, None],
+            [jobs[2].id, jobs[1].id, None],
+        ]
+        self.assertEqual(obs, exp)
+
+        # if the first job fails, the jobs that depend on it are not started
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                """UPDATE qiita.local_job_queue
+                   SET started = NOW(), finished = NOW(), exit_status = 1
+                   WHERE processing_job_id = %s""",
+                [jobs[0].id],
+            )
+            qdb.sql_connection.TRN.execute()
+        with patch.object(qiita_config, "job_scheduler_local_workers", 0):
+            self.assertEqual(qdb.processing_job.dispatch_local_jobs(), [])
+        self.assertEqual([j.status for j in jobs[1:]], ["error"] * 2)
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, [tuple(j.id for j in jobs)])
+            obs = [r[2] for r in qdb.sql_connection.TRN.execute_fetchindex()]
+        self.assertEqual(obs, [1, -1, -1])
+
+        # a job whose process was lost before its pid was set is not running
+        job = _create_job()
+        qdb.processing_job.queue_local_jobs([job])
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                """UPDATE qiita.local_job_queue
+                   SET started = NOW() - interval '2 minutes'
+                   WHERE processing_job_id = %s""",
+                [job.id],
+            )
+            qdb.sql_connection.TRN.execute()
+        with patch.object(qiita_config, "job_scheduler_local_workers", 0):
+            self.assertEqual(qdb.processing_job.dispatch_local_jobs(), [])
+        self.assertEqual(job.status, "error")
+        self.assertEqual(job.log.msg, "The process running the job was lost")
+
+    def test_queue_and_dispatch_completions(self):
+        job = _create_job()
+        job._set_status("running")
+        payload = dumps({"success": False, "error": "Job failure"})
+        with patch.object(qiita_config, "job_scheduler_completion_workers", 0):
+            # without workers the completion is escalated to a complete_job
+            c_job = qdb.processing_job.queue_completion(job, payload)
+            self.assertEqual(c_job.command.name, "complete_job")
+            self.assertEqual(c_job.parameters.values["job_id"], job.id)
+            self.assertEqual(job.complete_processing_job, c_job)
+
+        job = _create_job()
+        job._set_status("running")
+        sql = """SELECT queued, started, finished, complete_job_id
+                 FROM qiita.completion_queue
+                 WHERE processing_job_id = %s"""
+        self.assertIsNone(qdb.processing_job.queue_completion(job, payload))
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, [job.id])
+            exp = qdb.sql_connection.TRN.execute_fetchindex()
+        self.assertEqual(exp[0][1:], [None, None, None])
+
+        # the completion is only queued once
+        self.assertIsNone(qdb.processing_job.queue_completion(job, payload))
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, [job.id])
+            self.assertEqual(qdb.sql_connection.TRN.execute_fetchindex(), exp)
+
+        # a completion whose process was lost is queued again
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                """UPDATE qiita.completion_queue
+                   SET started = NOW() - interval '2 minutes'
+                   WHERE processing_job_id = %s""",
+                [job.id],
+            )
+            qdb.sql_connection.TRN.execute()
+        with patch.object(qiita_config, "job_scheduler_completion_workers", 0):
+            self.assertEqual(qdb.processing_job.dispatch_completions(), [])
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, [job.id])
+            self.assertEqual(qdb.sql_connection.TRN.execute_fetchindex(), exp)
+
+        self.assertIn(job.id, qdb.processing_job.dispatch_completions())
+        wait_for_processing_job(job.id)
+        self.assertEqual(job.status, "error")
+        self.assertEqual(job.log.msg, "Job failure")
+        self.assertIsNone(job.complete_processing_job)
+
+        # a completion that keeps losing its process sets the job as error
+        job = _create_job()
+        job._set_status("running")
+        self.assertIsNone(qdb.processing_job.queue_completion(job, payload))
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                """UPDATE qiita.completion_queue
+                   SET started = NOW() - interval '2 minutes', attempts = 3
+                   WHERE processing_job_id = %s""",
+                [job.id],
+            )
+            qdb.sql_connection.TRN.execute()
+        with patch.object(qiita_config, "job_scheduler_completion_workers", 0):
+            self.assertEqual(qdb.processing_job.dispatch_completions(), [])
+        self.assertEqual(job.status, "error")
+        self.assertEqual(job.log.msg, "The completion of the job was lost 3 times")
+
+    def test_process_lost(self):
+        self.assertFalse(qdb.processing_job._process_lost(gethostname(), getpid()))
+        self.assertFalse(qdb.processing_job._process_lost(None, getpid()))
+        self.assertTrue(qdb.processing_job._process_lost(gethostname(), 2**30))
+        # the processes of other hosts can't be checked
+        self.assertFalse(qdb.processing_job._process_lost("qiita-test-host", 2**30))
+
+    def test_queue_and_dispatch_admissions(self):
+        # without limits the jobs are submitted right away
+        self.assertIsNone(qdb.processing_job._admission_priority(_create_job()))
+
+        def _user_job(email):
+            job = _create_job()
+            sql = """UPDATE qiita.processing_job SET email = %s
+                     WHERE processing_job_id = %s"""
+            qdb.sql_connection.perform_as_transaction(sql, [email, job.id])
+            return job
+
+        PRIORITIES = qdb.processing_job.ADMISSION_PRIORITIES
+        bulk = [_user_job("test@foo.bar") for _ in range(3)]
+        for job in bulk:
+            qdb.processing_job.queue_admissions([job], PRIORITIES["bulk"])
+        job_a = _user_job("test@foo.bar")
+        qdb.processing_job.queue_admissions([job_a], PRIORITIES["processing"])
+        jobs_b = [_user_job("shared@foo.bar") for _ in range(2)]
+        for job in jobs_b:
+            qdb.processing_job.queue_admissions([job], PRIORITIES["processing"])
+        self.assertEqual([j.status for j in bulk + [job_a] + jobs_b], ["queued"] * 6)
+
+        slurm = "qiita-plugin-launcher-slurm"
+        launcher = patch.dict(
+            qdb.processing_job.ProcessingJob._launch_map[slurm],
+            {"function": lambda *args: "slurm-%s" % args[3]},
+        )
+        limits = patch.multiple(
+            qiita_config,
+            plugin_launcher=slurm,
+            job_scheduler_max_jobs=3,
+            job_scheduler_max_user_jobs=2,
+        )
+        with launcher, limits:
+            self.assertEqual(
+                qdb.processing_job._admission_priority(job_a),
+                PRIORITIES["processing"],
+            )
+            # the processing jobs go first, and the user with fewer jobs
+            # submitted goes first within them
+            obs = qdb.processing_job.dispatch_admissions()
+            self.assertEqual(obs, [job_a.id] + [j.id for j in jobs_b])
+            self.assertEqual(job_a.external_id, "slurm-%s" % job_a.id)
+
+            obs = qdb.processing_job.admission_queue_stats()
+            self.assertEqual(obs.loc["processing", "submitted"], 3)
+            self.assertEqual(obs.loc["bulk", "queued"], 3)
+            self.assertEqual(obs.loc["bulk", "users"], 1)
+            self.assertEqual(qdb.processing_job.dispatch_admissions(), [])
+
+            # a finished job frees its slot, but the user limit still applies
+            jobs_b[0]._set_error("Setting to error for testing")
+            # the claims are committed before the jobs are submitted, so a
+            # rollback of the caller doesn't submit them again
+            with qdb.sql_connection.TRN:
+                self.assertEqual(qdb.processing_job.dispatch_admissions(), [bulk[0].id])
+                qdb.sql_connection.TRN.rollback()
+            self.assertEqual(qdb.processing_job.dispatch_admissions(), [])
+
+        # the jobs that depend on a failed job are not submitted
+        chain = [_user_job("shared@foo.bar") for _ in range(2)]
+        qdb.processing_job.queue_admissions(chain, PRIORITIES["processing"])
+        limits = patch.multiple(
+            qiita_config, plugin_launcher=slurm, job_scheduler_max_command_jobs=100
+        )
+        with launcher, limits:
+            self.assertEqual(
+                qdb.processing_job.dispatch_admissions(),
+                [chain[0].id, bulk[1].id, bulk[2].id],
+            )
+            chain[0]._set_error("Setting to error for testing")
+            self.assertEqual(qdb.processing_job.dispatch_admissions(), [])
+        self.assertEqual(chain[1].status, "error")
+        self.assertIn(chain[0].id, chain[1].log.msg)
+
+    def test_load_environment(self):
+        obs = qdb.processing_job._load_environment("export QIITA_TEST_ENV=1")
+        self.assertEqual(obs["QIITA_TEST_ENV"], "1")
+
+        # a failing script doesn't return an environment, even if it updated
+        # the environment before failing
+        self.assertIsNone(
+            qdb.processing_job._load_environment("export QIITA_TEST_ENV=1; false")
+        )
+        self.assertIsNone(
+            qdb.processing_job._load_environment("qiita_not_a_command_for_testing")
+        )
+
+    def test_plugin_environment(self):
+        software = qdb.software.Software(1)
+        key = (software.name, software.version)
+        environment = {"QIITA_TEST_ENV": "1"}
+        # the environments are sent by the launched processes, using a queue
+        # of this process so they can be read right away
+        updates = Queue()
+
+        with patch.object(qdb.processing_job, "_PLUGIN_ENVIRONMENT_UPDATES", updates):
+            # disabled by default
+            updates.put((key, environment))
+            self.assertIsNone(qdb.processing_job._plugin_environment(software))
+
+            with patch.object(qiita_config, "job_scheduler_local_env_reuse", 2):
+                obs = qdb.processing_job._plugin_environment(software)
+                self.assertIs(obs, environment)
+                self.assertIs(qdb.processing_job._plugin_environment(software), obs)
+                # after 2 jobs the environment is loaded again by the next
+                # launched process
+                self.assertIsNone(qdb.processing_job._plugin_environment(software))
+                self.assertIsNone(qdb.processing_job._plugin_environment(software))
+
+        qdb.processing_job._PLUGIN_ENVIRONMENTS.clear()
+
+    def test_submit_array(self):
+        # a stand-in of sbatch that keeps its arguments
+        bin_dir = mkdtemp()
+        sbatch = join(bin_dir, "sbatch")
+        with open(sbatch, "w") as f:
+            f.write(
+                "#!/bin/bash\n"
+                f'echo "$@" > {bin_dir}/args\n'
+                'echo "Submitted batch job 1234"\n'
+            )
+        chmod(sbatch, 0o755)
+
+        jobs = [_create_job() for _ in range(3)]
+        with patch.dict(environ, {"PATH": "%s:%s" % (bin_dir, environ["PATH"])}):
+            qdb.processing_job.ProcessingJob.submit_array(jobs)
+
+        # the jobs have the same allocation so a single array is submitted
+        with open(join(bin_dir, "args")) as f:
+            script = f.read().split()[-1]
+        with open(script) as f:
+            obs = f.read()
+        rmtree(bin_dir)
+        self._clean_up_files.append(script)
+        self.assertIn("#SBATCH --array 0-2", obs)
+        for i, job in enumerate(jobs):
+            self.assertIn(f"    {i})", obs)
+            self.assertIn(f" {job.id} ", obs)
+            self.assertEqual(job.status, "queued")
+            self.assertEqual(job.external_id, "1234_%d" % i)
+
+        with self.assertRaises(qdb.exceptions.QiitaDBOperationNotPermittedError):
+            qdb.processing_job.ProcessingJob.submit_array(jobs)
+
+    def test_submit_array_error(self):
+        # a stand-in of sbatch that fails
+        bin_dir = mkdtemp()
+        sbatch = join(bin_dir, "sbatch")
+        with open(sbatch, "w") as f:
+            f.write("#!/bin/bash\necho 'sbatch: error' >&2\nexit 1\n")
+        chmod(sbatch, 0o755)
+
+        jobs = [_create_job() for _ in range(2)]
+        with patch.dict(environ, {"PATH": "%s:%s" % (bin_dir, environ["PATH"])}):
+            qdb.processing_job.ProcessingJob.submit_array(jobs)
+        rmtree(bin_dir)
+
+        # the jobs are not left queued without an external id
+        for job in jobs:
+            self.assertEqual(job.status, "error")
+            self.assertIn("Error submitting job array", job.log.msg)
+            self.assertIn("sbatch: error", job.log.msg)
+
+    def test_submitted_by_plugin(self):
+        job = _create_job()
+        software = job.command.software
+        current = software.environment_script
+
+        self.assertFalse(qdb.processing_job._submitted_by_plugin(job.command))
+        with qdb.sql_connection.TRN:
+            sql = """UPDATE qiita.software SET environment_script = %s
+                     WHERE software_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [f"{current} ENVIRONMENT", software.id])
+            self.assertTrue(qdb.processing_job._submitted_by_plugin(job.command))
+            # the commands run as job arrays are not submitted by the plugin
+            with patch.object(
+                qdb.software.Command,
+                "name",
+                new_callable=PropertyMock,
+                return_value="Calculate Cell Counts",
+            ):
+                self.assertFalse(qdb.processing_job._submitted_by_plugin(job.command))
+            qdb.sql_connection.TRN.rollback()
+
     def test_submit_environment(self):
         job = _create_job()
         software = job.command.software
@@ -841,6 +1199,20 @@ class ProcessingJobTest(TestCase):
             job = qdb.processing_job.ProcessingJob(jid)
             self.assertEqual(job.shape, shape)
 
+        # the sizes are stored the first time they are needed, and then used
+        with qdb.sql_connection.TRN:
+            sql = """SELECT samples, columns
+                     FROM qiita.template_statistics
+                     WHERE template_type = 'sample' AND template_id = 1"""
+            qdb.sql_connection.TRN.add(sql)
+            self.assertEqual(qdb.sql_connection.TRN.execute_fetchindex(), [[27, 31]])
+            sql = """UPDATE qiita.template_statistics SET samples = 1
+                     WHERE template_type = 'prep'"""
+            qdb.sql_connection.TRN.add(sql)
+            qdb.sql_connection.TRN.execute()
+        job = qdb.processing_job.ProcessingJob("bcc7ebcd-39c1-43e4-af2d-822e3589f14d")
+        self.assertEqual(job.shape, (1, 53, 116))
+
     def test_shape_special_cases(self):
         # get any given job/command/allocation and make sure nothing changed
         pj = qdb.processing_job.ProcessingJob("6d368e16-2242-4cf8-87b4-a5dc40bb890b")
@@ -988,6 +1360,71 @@ class ProcessingJobTest(TestCase):
         )
         qdb.sql_connection.perform_as_transaction(sql)
 
+    def test_learned_resource_allocation(self):
+        job = qdb.processing_job.ProcessingJob("6d368e16-2242-4cf8-87b4-a5dc40bb890b")
+        # samples * columns = 27 * 53 = 1431, so the memory is 1431 * 1e8 ~ 133G
+        # and the time 1431 * 10 = 14310 seconds
+        sql = """INSERT INTO qiita.resource_allocation_model (
+                    command_id, memory_equation, memory_expression,
+                    memory_parameters, max_memory_used, time_equation,
+                    time_expression, time_parameters, max_time_used, jobs,
+                    margin, enabled)
+                 VALUES (%s, 'mem_model', 'k * x', '{1e8, 0, 0}', 1e10,
+                         'time_model', 'k * x + a', '{10, 0, 0}', 3600, 100,
+                         1, %s)"""
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(sql, [job.command.id, False])
+            qdb.sql_connection.TRN.execute()
+        # the models that are not enabled are not used
+        self.assertEqual(
+            job.resource_allocation_info,
+            "-p qiita -N 1 -n 1 --mem 120gb --time 80:00:00 --nice=10000",
+        )
+
+        # the predictions replace the allocation, even if they are smaller
+        sql = "UPDATE qiita.resource_allocation_model SET enabled = true"
+        qdb.sql_connection.perform_as_transaction(sql)
+        self.assertEqual(
+            job.resource_allocation_info,
+            "-p qiita -N 1 -n 1 --mem 133G --time 3:58:30 --nice=10000",
+        )
+
+        # but the job never requests less than the largest resources used
+        sql = "UPDATE qiita.resource_allocation_model SET max_time_used = 172800"
+        qdb.sql_connection.perform_as_transaction(sql)
+        self.assertEqual(
+            job.resource_allocation_info,
+            "-p qiita -N 1 -n 1 --mem 133G --time 2-0:00:00 --nice=10000",
+        )
+
+        # the memory per cpu is the prediction divided by the tasks, and
+        # --mem is not added
+        sql = """UPDATE qiita.processing_job_resource_allocation
+                 SET allocation = %s WHERE name = 'Split libraries FASTQ'"""
+        qdb.sql_connection.perform_as_transaction(
+            sql, ["-p qiita -N 1 -n 5 --mem-per-cpu 8gb --time 168:00:00"]
+        )
+        self.assertEqual(
+            job.resource_allocation_info,
+            "-p qiita -N 1 -n 5 --mem-per-cpu 27G --time 2-0:00:00 --nice=10000",
+        )
+        qdb.sql_connection.perform_as_transaction(
+            sql, ["-p qiita -N 1 -n 1 --mem 120gb --time 80:00:00"]
+        )
+
+        # a model that can't predict the resources of the job is not used
+        sql = """UPDATE qiita.resource_allocation_model
+                 SET time_parameters = '{-10, 0, 0}'"""
+        qdb.sql_connection.perform_as_transaction(sql)
+        self.assertEqual(
+            job.resource_allocation_info,
+            "-p qiita -N 1 -n 1 --mem 120gb --time 80:00:00 --nice=10000",
+        )
+
+        qdb.sql_connection.perform_as_transaction(
+            "DELETE FROM qiita.resource_allocation_model"
+        )
+
     def test_notification_mail_generation(self):
         # Almost all processing-jobs in testing are owned by test@foo.bar
         # and are of type 'Split libraries FASTQ'.
@@ -1117,6 +1554,9 @@ class ProcessingWorkflowTests(TestCase):
             qdb.processing_job.ProcessingWorkflow(1).name, "Testing processing workflow"
         )
 
+    def test_bulk(self):
+        self.assertFalse(qdb.processing_job.ProcessingWorkflow(1).bulk)
+
     def test_user(self):
         self.assertEqual(
             qdb.processing_job.ProcessingWorkflow(1).user,
@@ -1442,6 +1882,31 @@ class ProcessingJobDuplicated(TestCase):
                 qdb.processing_job.ProcessingJob(jid)._set_status("error")
         _create_job(False)
 
+    def test_by_parameters(self):
+        job = _create_job()
+        obs = qdb.processing_job.ProcessingJob.by_parameters(job.parameters)
+        self.assertIn(job, obs)
+        obs = qdb.processing_job.ProcessingJob.by_parameters(
+            job.parameters, status=["success"]
+        )
+        self.assertNotIn(job, obs)
+
+        # the values are compared as case insensitive text
+        params = qdb.software.Parameters.load(
+            job.command,
+            values_dict={
+                k: str(v).upper() if isinstance(v, bool) else v
+                for k, v in job.parameters.values.items()
+            },
+        )
+        self.assertIn(job, qdb.processing_job.ProcessingJob.by_parameters(params))
+
+        # and all the values have to match
+        values = job.parameters.values.copy()
+        values["min_seq_len"] = 101
+        params = qdb.software.Parameters.load(job.command, values_dict=values)
+        self.assertNotIn(job, qdb.processing_job.ProcessingJob.by_parameters(params))
+
 
 if __name__ == "__main__":
     main()
@@ -6,6 +6,7 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 
+from io import StringIO
 from os import close, remove
 from os.path import exists
 from tempfile import mkstemp
@@ -138,6 +139,22 @@ class TestTransaction(TestBase):
             with self.assertRaises(TypeError):
                 qdb.sql_connection.TRN.add("SELECT 42", [1, 1], many=True)
 
+    def test_add_copy(self):
+        with qdb.sql_connection.TRN:
+            data = StringIO('copy1,10\n"copy,2",20\n')
+            qdb.sql_connection.TRN.add_copy(
+                "qiita.test_table", ["str_column", "int_column"], data
+            )
+            sql = """UPDATE qiita.test_table
+                     SET bool_column = %s
+                     WHERE str_column = %s"""
+            qdb.sql_connection.TRN.add(sql, [False, "copy1"])
+            obs = qdb.sql_connection.TRN.execute()
+            self.assertEqual(obs, [None, None])
+            self._assert_sql_equal([])
+
+        self._assert_sql_equal([("copy,2", True, 20), ("copy1", False, 10)])
+
     def test_execute(self):
         with qdb.sql_connection.TRN:
             sql = """INSERT INTO qiita.test_table (str_column, int_column)
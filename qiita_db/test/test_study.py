@@ -3,7 +3,7 @@ from unittest import TestCase, main
 
 import qiita_db as qdb
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
-from qiita_core.qiita_settings import qiita_config
+from qiita_core.qiita_settings import qiita_config, r_client
 from qiita_core.util import qiita_test_checker
 
 # -----------------------------------------------------------------------------
@@ -885,6 +885,23 @@ class TestStudy(TestCase):
             ],
         )
 
+    def test_prep_samples_membership(self):
+        self.study.clear_prep_samples_membership()
+        samples, preps = self.study.prep_samples_membership()
+        self.assertEqual(samples, sorted(self.study.sample_template.keys()))
+        self.assertCountEqual(preps.keys(), [1, 2])
+        pt = qdb.metadata_template.prep_template.PrepTemplate(1)
+        exp = "".join("1" if s in pt else "0" for s in samples)
+        self.assertEqual(preps[1], exp)
+
+        # the second call is served from the cache
+        key = qdb.study.PREP_SAMPLES_MEMBERSHIP_KEY_FORMAT % 1
+        self.assertIsNotNone(r_client.get(key))
+        self.assertEqual(self.study.prep_samples_membership(), (samples, preps))
+
+        self.study.clear_prep_samples_membership()
+        self.assertIsNone(r_client.get(key))
+
     def test_retrieve_prep_templates_none(self):
         new = qdb.study.Study.create(
             qdb.user.User("test@foo.bar"),
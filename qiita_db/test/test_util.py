@@ -7,13 +7,17 @@
 # -----------------------------------------------------------------------------
 
 from datetime import datetime
+from email import message_from_string
 from functools import partial
+from math import log
 from os import close, mkdir, remove
 from os.path import basename, exists, join
 from shutil import rmtree
+from smtplib import SMTPException
 from string import punctuation
 from tempfile import NamedTemporaryFile, TemporaryFile, mkdtemp, mkstemp
 from unittest import TestCase, main
+from unittest.mock import patch
 
 import h5py
 import matplotlib.pyplot as plt
@@ -26,6 +30,21 @@ import qiita_db as qdb
 from qiita_core.util import qiita_test_checker
 
 
+class SMTPStandIn(object):
+    """Local stand-in of smtplib.SMTP that keeps the emails sent"""
+
+    sent = []
+
+    def __getattr__(self, name):
+        # connect, starttls, login, close...
+        return lambda *args, **kwargs: None
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if to_addrs.startswith("fail"):
+            raise SMTPException("Recipient refused")
+        self.sent.append((to_addrs, message_from_string(msg)))
+
+
 @qiita_test_checker()
 class DBUtilTestsBase(TestCase):
     def setUp(self):
@@ -139,6 +158,48 @@ class DBUtilTests(DBUtilTestsBase):
         )
         self.assertEqual(qdb.util.convert_to_id("EMP", "portal_type", "portal"), 2)
 
+    def test_lookup_tables_cache(self):
+        qdb.util.clear_lookup_tables_cache()
+        self.assertEqual(qdb.util.get_data_types()["16S"], 1)
+        # the value is cached, a change done without invalidating the cache
+        # is not seen
+        qdb.sql_connection.perform_as_transaction(
+            "UPDATE qiita.data_type SET data_type = '16S-new' WHERE data_type_id = 1"
+        )
+        self.assertIn("16S", qdb.util.get_data_types())
+        # callers can't modify the cached values
+        qdb.util.get_data_types().pop("16S")
+        self.assertIn("16S", qdb.util.get_data_types())
+
+        qdb.util.clear_lookup_tables_cache()
+        obs = qdb.util.get_data_types()
+        self.assertNotIn("16S", obs)
+        self.assertEqual(obs["16S-new"], 1)
+
+        # other processes invalidating the cache
+        qdb.sql_connection.perform_as_transaction(
+            "UPDATE qiita.data_type SET data_type = '16S' WHERE data_type_id = 1"
+        )
+        self.assertIn("16S-new", qdb.util.get_data_types())
+        qdb.util.r_client.set(qdb.util.LOOKUP_TABLES_GENERATION_KEY, "other")
+        qdb.util._lookup_tables_cache["checked"] = 0
+        self.assertIn("16S", qdb.util.get_data_types())
+
+        # only the lookup tables are cached by convert_to_id/convert_from_id
+        self.assertEqual(qdb.util.convert_to_id("16S", "data_type"), 1)
+        ena = qdb.util.convert_to_id("ENA", "ontology")
+        qdb.sql_connection.perform_as_transaction(
+            "UPDATE qiita.data_type SET data_type = '16S-new' WHERE data_type_id = 1"
+        )
+        qdb.sql_connection.perform_as_transaction(
+            "UPDATE qiita.ontology SET ontology = 'ENA-new' WHERE ontology_id = %s",
+            [ena],
+        )
+        self.assertEqual(qdb.util.convert_to_id("16S", "data_type"), 1)
+        self.assertEqual(qdb.util.convert_from_id(ena, "ontology"), "ENA-new")
+        with self.assertRaises(qdb.exceptions.QiitaDBLookupError):
+            qdb.util.convert_to_id("ENA", "ontology")
+
     def test_convert_to_id_bad_value(self):
         """Tests that ids are returned correctly"""
         with self.assertRaises(qdb.exceptions.QiitaDBLookupError):
@@ -389,6 +450,17 @@ class DBUtilTests(DBUtilTestsBase):
         ]
         self.assertEqual(obs, exp)
 
+    def test_get_artifacts_filepath_sizes(self):
+        obs = qdb.util.get_artifacts_filepath_sizes([1])
+        self.assertEqual(obs, {"raw_forward_seqs": 58, "raw_barcodes": 58})
+        obs = qdb.util.get_artifacts_filepath_sizes([1, 2])
+        exp = {}
+        for aid in [1, 2]:
+            for fp in qdb.artifact.Artifact(aid).filepaths:
+                exp[fp["fp_type"]] = exp.get(fp["fp_type"], 0) + fp["fp_size"]
+        self.assertEqual(obs, exp)
+        self.assertEqual(qdb.util.get_artifacts_filepath_sizes([]), {})
+
     def test_retrieve_filepaths_sort(self):
         obs = qdb.util.retrieve_filepaths(
             "artifact_filepath", "artifact_id", 1, sort="descending"
@@ -599,6 +671,7 @@ class DBUtilTests(DBUtilTestsBase):
                  VALUES ('analysis', 'analysis_tmp', true, true),
                         ('raw_data', 'raw_data_tmp', true, false)"""
         qdb.sql_connection.perform_as_transaction(sql)
+        qdb.util.clear_lookup_tables_cache()
 
         # this should have been updated
         exp = [(count + 1, join(qdb.util.get_db_files_base_dir(), "analysis_tmp"))]
@@ -656,6 +729,7 @@ class DBUtilTests(DBUtilTestsBase):
                  VALUES ('analysis', 'analysis_tmp', true, true),
                         ('raw_data', 'raw_data_tmp', true, false)"""
         qdb.sql_connection.perform_as_transaction(sql)
+        qdb.util.clear_lookup_tables_cache()
 
         # this should have been updated
         exp = join(qdb.util.get_db_files_base_dir(), "analysis_tmp")
@@ -828,6 +902,69 @@ class DBUtilTests(DBUtilTestsBase):
         exp = [[count, "TEST MESSAGE"]]
         self.assertEqual(obs, exp)
 
+    def test_queue_email(self):
+        count = qdb.util.get_count("qiita.notification_outbox")
+        qdb.util.queue_email("new@test.bar", "Subject", "Body")
+        self.assertEqual(qdb.util.get_count("qiita.notification_outbox"), count + 1)
+
+    @patch("qiita_db.util.SMTP", SMTPStandIn)
+    def test_send_queued_emails(self):
+        SMTPStandIn.sent = []
+        qdb.util.queue_email("a@test.bar", "Job 1: success", "Message 1")
+        qdb.util.queue_email("b@test.bar", "Job 2: error", "Message 2")
+        qdb.util.queue_email("a@test.bar", "Job 3: success", "Message 3")
+        qdb.util.queue_email("fail@test.bar", "Job 4: error", "Message 4")
+
+        # the emails claimed by another call are skipped
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                """UPDATE qiita.notification_outbox SET claimed = NOW()
+                   WHERE email = 'b@test.bar'"""
+            )
+            qdb.sql_connection.TRN.execute()
+        obs = qdb.util.send_queued_emails()
+        self.assertEqual(obs, {"sent": 2, "failed": 1, "dropped": 0})
+        # the emails of a@test.bar are sent together
+        self.assertEqual([to for to, _ in SMTPStandIn.sent], ["a@test.bar"])
+        digest = SMTPStandIn.sent[0][1]
+        self.assertEqual(digest["Subject"], "Qiita: 2 notifications")
+        body = digest.get_payload()[0].get_payload()
+        self.assertLess(body.index("Message 1"), body.index("Message 3"))
+
+        # the claims of the calls that were lost expire
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                """UPDATE qiita.notification_outbox
+                   SET claimed = NOW() - interval '2 hours'
+                   WHERE email = 'b@test.bar'"""
+            )
+            qdb.sql_connection.TRN.execute()
+        obs = qdb.util.send_queued_emails()
+        self.assertEqual(obs, {"sent": 1, "failed": 1, "dropped": 0})
+        self.assertEqual(SMTPStandIn.sent[1][1]["Subject"], "Job 2: error")
+
+        # only the failed email is retried, until max_attempts
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                """SELECT email, attempts, last_error, claimed
+                   FROM qiita.notification_outbox"""
+            )
+            obs = qdb.sql_connection.TRN.execute_fetchindex()
+        self.assertEqual(obs, [["fail@test.bar", 2, "Recipient refused", None]])
+        self.assertEqual(
+            qdb.util.send_queued_emails(max_attempts=3),
+            {"sent": 0, "failed": 1, "dropped": 0},
+        )
+        # and then it is dropped and logged
+        log_count = qdb.util.get_count("qiita.logging")
+        self.assertEqual(
+            qdb.util.send_queued_emails(max_attempts=3),
+            {"sent": 0, "failed": 0, "dropped": 1},
+        )
+        self.assertEqual(qdb.util.get_count("qiita.notification_outbox"), 0)
+        self.assertEqual(qdb.util.get_count("qiita.logging"), log_count + 1)
+        self.assertEqual(len(SMTPStandIn.sent), 2)
+
     def test_add_system_message(self):
         count = qdb.util.get_count("qiita.message") + 1
         qdb.util.add_system_message("SYS MESSAGE", datetime(2015, 8, 5, 19, 41))
@@ -912,6 +1049,33 @@ class DBUtilTests(DBUtilTestsBase):
 
         self.assertEqual(qdb.util.generate_analysis_list([1, 2, 3, 5], True), [])
 
+    def test_generate_analysis_list_page(self):
+        self.assertEqual(qdb.util.generate_analysis_list_page([]), (0, 0, []))
+
+        exp = qdb.util.generate_analysis_list([1, 2, 3, 5])
+        obs = qdb.util.generate_analysis_list_page([1, 2, 3, 5])
+        self.assertEqual(obs, (2, 2, exp))
+
+        obs = qdb.util.generate_analysis_list_page([1, 2, 3, 5], ascending=False)
+        self.assertEqual(obs, (2, 2, exp[::-1]))
+
+        obs = qdb.util.generate_analysis_list_page(
+            [1, 2, 3, 5], order_by="name", ascending=False, start=1, length=1
+        )
+        self.assertEqual(obs, (2, 2, [exp[0]]))
+
+        obs = qdb.util.generate_analysis_list_page([1, 2, 3, 5], search="second")
+        self.assertEqual(obs, (2, 1, [exp[1]]))
+
+        obs = qdb.util.generate_analysis_list_page([1, 2, 3, 5], search="50%")
+        self.assertEqual(obs, (2, 0, []))
+
+        obs = qdb.util.generate_analysis_list_page([1, 2, 3, 5], True)
+        self.assertEqual(obs, (0, 0, []))
+
+        with self.assertRaises(ValueError):
+            qdb.util.generate_analysis_list_page([1, 2], order_by="artifacts")
+
 
 @qiita_test_checker()
 class UtilTests(TestCase):
@@ -1105,6 +1269,38 @@ class UtilTests(TestCase):
         with self.assertRaises(ValueError):
             qdb.util.generate_study_list(qdb.user.User("test@foo.bar"), "bad")
 
+    def test_generate_study_list_page(self):
+        user = qdb.user.User("admin@foo.bar")
+        exp = qdb.util.generate_study_list(user, "user")
+
+        obs = qdb.util.generate_study_list_page(user, "user")
+        self.assertEqual(obs, (len(exp), len(exp), exp))
+
+        obs = qdb.util.generate_study_list_page(user, "user", start=len(exp))
+        self.assertEqual(obs, (len(exp), len(exp), []))
+
+        obs = qdb.util.generate_study_list_page(
+            user, "user", order_by="number_samples_collected", ascending=False
+        )
+        self.assertEqual(
+            [i["number_samples_collected"] for i in obs[2]],
+            sorted([i["number_samples_collected"] for i in exp], reverse=True),
+        )
+
+        obs = qdb.util.generate_study_list_page(user, "user", length=1, search="SOILS")
+        self.assertEqual(obs[1:], (1, [exp[0]]))
+
+        obs = qdb.util.generate_study_list_page(user, "user", search="not_a_study")
+        self.assertEqual(obs, (len(exp), 0, []))
+
+        obs = qdb.util.generate_study_list_page(user, "user", tags=["not_a_tag"])
+        self.assertEqual(obs, (len(exp), 0, []))
+
+        with self.assertRaises(ValueError):
+            qdb.util.generate_study_list_page(user, "bad")
+        with self.assertRaises(ValueError):
+            qdb.util.generate_study_list_page(user, "user", order_by="pubs")
+
     def test_generate_study_list_without_artifacts(self):
         # creating a new study to make sure that empty studies are also
         # returned
@@ -1646,6 +1842,94 @@ class ResourceAllocationPlotTests(TestCase):
                 self.assertTrue(id in updated_ids_set)
                 self.assertFalse(id in previous_ids_set)
 
+    def test_compile_formula(self):
+        variables = ("samples", "columns", "input_size")
+        values = {"samples": 27, "columns": 53, "input_size": 116}
+        tests = [
+            ("samples*1000", 27000),
+            ("((samples+columns)*1000000)+4000000", 84000000),
+            ("input_size+(2*1e+9)", 2000000116.0),
+            ("nlog(samples)*100", log(27) * 100),
+            ("columns*1631 if columns*1631 < 86400 else 86400", 86400),
+            ("max(samples, columns) // 2 + (1 < columns <= 53)", 27),
+            ("input_size or 2e9", 116),
+            ("input_size - 116 or 2e9", 2e9),
+            ("samples and columns * 2", 106),
+            # the operands after the one that decides are not evaluated
+            ("columns < 10 and 1 / 0", False),
+        ]
+        for formula, exp in tests:
+            f = qdb.util.compile_formula(formula, variables)
+            self.assertAlmostEqual(f(**values), exp)
+        # the compiled formulas are cached
+        self.assertIs(
+            qdb.util.compile_formula("samples*1000", variables),
+            qdb.util.compile_formula("samples*1000", variables),
+        )
+
+        for formula in [
+            "__import__('os').getcwd()",
+            "samples.__class__",
+            "open('file')",
+            "'a' * 3",
+            "unknown * 2",
+            "samples +",
+            "[samples]",
+        ]:
+            with self.assertRaises(ValueError):
+                qdb.util.compile_formula(formula, variables)
+
+    def test_update_resource_allocation_models(self):
+        self.addCleanup(
+            qdb.sql_connection.perform_as_transaction,
+            "DELETE FROM qiita.resource_allocation_model",
+        )
+        cid = qdb.software.Software.from_name_and_version(self.sname, self.version)
+        cid = cid.get_command(self.cname).id
+        self.assertIn(cid, qdb.util.update_resource_allocation_models())
+
+        mem_models, time_models = qdb.util._resource_allocation_models()
+        with qdb.sql_connection.TRN:
+            sql = """SELECT memory_equation, memory_expression, time_equation,
+                            time_expression, jobs, margin,
+                            memory_failure_rate, time_failure_rate, enabled,
+                            max_memory_used, max_time_used
+                     FROM qiita.resource_allocation_model
+                     WHERE command_id = %s"""
+            qdb.sql_connection.TRN.add(sql, [cid])
+            obs = qdb.sql_connection.TRN.execute_fetchindex()[0]
+        self.assertIn(obs[0], mem_models)
+        self.assertEqual(obs[1], mem_models[obs[0]]["equation_name"])
+        self.assertIn(obs[2], time_models)
+        self.assertEqual(obs[3], time_models[obs[2]]["equation_name"])
+        self.assertGreaterEqual(obs[4], 10)
+        self.assertEqual(obs[5], 1.2)
+        # the models are only enabled if they pass the backtest
+        self.assertEqual(obs[8], max(obs[6], obs[7]) <= 0.05)
+        # the largest resources used are kept as the minimum to request
+        self.assertGreater(obs[9], 0)
+        self.assertGreater(obs[10], 0)
+
+        # the models above the threshold, or that can't be backtested, are
+        # not enabled
+        sql = """SELECT enabled FROM qiita.resource_allocation_model
+                 WHERE command_id = %s"""
+        for kwargs in ({"max_failure_rate": -1}, {"train_fraction": 0}):
+            qdb.util.update_resource_allocation_models(**kwargs)
+            with qdb.sql_connection.TRN:
+                qdb.sql_connection.TRN.add(sql, [cid])
+                self.assertFalse(qdb.sql_connection.TRN.execute_fetchlast())
+
+    def test_resource_allocation_backtest(self):
+        obs = qdb.util.resource_allocation_backtest()
+        self.assertIn(self.cname, obs.cName.tolist())
+        row = obs[obs.cName == self.cname].iloc[0]
+        self.assertGreater(row.test_jobs, 0)
+        for key in ("memory", "time"):
+            self.assertGreaterEqual(row[f"{key}_failure_rate"], 0)
+            self.assertLessEqual(row[f"{key}_failure_rate"], 1)
+            self.assertGreaterEqual(row[f"{key}_over_allocation"], 0)
+
 
 STUDY_INFO = {
     "study_id": 1,
@@ -22,19 +22,27 @@ Methods
     filepath_id_to_object_id
     get_mountpoint
     insert_filepaths
+    get_artifacts_filepath_sizes
     check_table_cols
     check_required_columns
     convert_from_id
     convert_to_id
+    clear_lookup_tables_cache
     get_environmental_packages
     get_visibilities
     purge_filepaths
     move_filepaths_to_upload_folder
     move_upload_files_to_trash
     add_message
+    queue_email
+    send_queued_emails
     get_pubmed_ids_from_dois
     generate_analysis_list
+    generate_analysis_list_page
     human_merging_scheme
+    compile_formula
+    update_resource_allocation_models
+    resource_allocation_backtest
 """
 
 # -----------------------------------------------------------------------------
@@ -44,15 +52,19 @@ Methods
 #
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
+import ast
 import hashlib
+import operator
 from binascii import crc32
+from collections import defaultdict
 from contextlib import contextmanager
+from copy import copy
 from csv import writer as csv_writer
 from datetime import datetime, timedelta
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from errno import EEXIST
-from functools import partial
+from functools import lru_cache, partial, wraps
 from glob import glob
 from io import StringIO
 from itertools import chain
@@ -67,6 +79,7 @@ from string import ascii_letters, digits, punctuation
 from subprocess import check_output
 from tempfile import mkstemp
 from time import time as now
+from uuid import uuid4
 
 import h5py
 import matplotlib.pyplot as plt
@@ -80,7 +93,81 @@ from scipy.optimize import minimize
 
 import qiita_db as qdb
 from qiita_core.exceptions import IncompetentQiitaDeveloperError
-from qiita_core.qiita_settings import qiita_config
+from qiita_core.qiita_settings import qiita_config, r_client
+
+# The small lookup tables (data types, artifact types, mountpoints, ...) are
+# cached in memory by each process. Any process changing them stores a new
+# random generation in this redis key, which makes the other processes drop
+# their cache; the key is checked at most every LOOKUP_TABLES_CHECK_INTERVAL
+# seconds
+LOOKUP_TABLES_GENERATION_KEY = "qiita_lookup_tables_generation"
+LOOKUP_TABLES_CHECK_INTERVAL = 1
+# the tables cached by convert_to_id and convert_from_id; they are only
+# changed by the functions calling clear_lookup_tables_cache or by the
+# patches, the other tables are always queried
+LOOKUP_TABLES = {
+    "artifact_type",
+    "data_type",
+    "filepath_type",
+    "portal_type",
+    "processing_job_status",
+    "severity",
+    "software_type",
+    "user_level",
+    "visibility",
+}
+_lookup_tables_cache = {"generation": None, "checked": 0, "values": {}}
+
+
+def _lookup_table_cached(func):
+    """Caches the results of a lookup table function in memory
+
+    Notes
+    -----
+    Exceptions are not cached, and a shallow copy of the cached value is
+    returned so callers can modify it
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = _lookup_tables_cache
+        current = now()
+        if current - cache["checked"] > LOOKUP_TABLES_CHECK_INTERVAL:
+            generation = r_client.get(LOOKUP_TABLES_GENERATION_KEY)
+            if generation != cache["generation"]:
+                cache["values"].clear()
+                cache["generation"] = generation
+            cache["checked"] = current
+
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in cache["values"]:
+            cache["values"][key] = func(*args, **kwargs)
+        return copy(cache["values"][key])
+
+    return wrapper
+
+
+def clear_lookup_tables_cache():
+    """Invalidates the lookup tables cache of all the Qiita processes
+
+    Notes
+    -----
+    Must be called by any code modifying the data_type, artifact_type,
+    filepath_type, portal_type, data_directory, etc tables. If called within
+    a transaction, the cache is invalidated again once the transaction is
+    committed or rolled back, so values read while the transaction was open
+    are not kept.
+    """
+
+    def _clear():
+        r_client.set(LOOKUP_TABLES_GENERATION_KEY, uuid4().hex)
+        _lookup_tables_cache["values"].clear()
+        _lookup_tables_cache["checked"] = 0
+
+    _clear()
+    with qdb.sql_connection.TRN:
+        qdb.sql_connection.TRN.add_post_commit_func(_clear)
+        qdb.sql_connection.TRN.add_post_rollback_func(_clear)
 
 
 def scrub_data(s):
@@ -145,6 +232,7 @@ def convert_type(obj):
     return item
 
 
+@_lookup_table_cached
 def get_artifact_types(key_by_id=False):
     """Gets the list of possible artifact types
 
@@ -172,6 +260,7 @@ def get_artifact_types(key_by_id=False):
         return dict(qdb.sql_connection.TRN.execute_fetchindex())
 
 
+@_lookup_table_cached
 def get_filepath_types(key="filepath_type"):
     """Gets the list of possible filepath types from the filetype table
 
@@ -203,6 +292,7 @@ def get_filepath_types(key="filepath_type"):
         return dict(qdb.sql_connection.TRN.execute_fetchindex())
 
 
+@_lookup_table_cached
 def get_data_types(key="data_type"):
     """Gets the list of possible data types from the data_type table
 
@@ -552,6 +642,7 @@ def move_upload_files_to_trash(study_id, files_to_move):
             move(fullpath, new_fullpath)
 
 
+@_lookup_table_cached
 def get_mountpoint(mount_type, retrieve_all=False, retrieve_subdir=False):
     r"""Returns the most recent values from data directory for the given type
 
@@ -589,6 +680,7 @@ def get_mountpoint(mount_type, retrieve_all=False, retrieve_subdir=False):
         return result
 
 
+@_lookup_table_cached
 def get_mountpoint_path_by_id(mount_id):
     r"""Returns the mountpoint path for the mountpoint with id = mount_id
 
@@ -797,6 +889,37 @@ def retrieve_filepaths(obj_fp_table, obj_id_column, obj_id, sort=None, fp_type=N
         ]
 
 
+def get_artifacts_filepath_sizes(artifact_ids):
+    """Returns the total size of the files of the artifacts by filepath type
+
+    Parameters
+    ----------
+    artifact_ids : iterable of int
+        The artifact ids
+
+    Returns
+    -------
+    dict of {str: int}
+        The total size in bytes of the files of the artifacts, keyed by
+        filepath type
+    """
+    artifact_ids = tuple(artifact_ids)
+    if not artifact_ids:
+        return {}
+    with qdb.sql_connection.TRN:
+        sql = """SELECT filepath_type, SUM(fp_size)
+                 FROM qiita.artifact_filepath
+                    JOIN qiita.filepath USING (filepath_id)
+                    JOIN qiita.filepath_type USING (filepath_type_id)
+                 WHERE artifact_id IN %s
+                 GROUP BY filepath_type"""
+        qdb.sql_connection.TRN.add(sql, [artifact_ids])
+        return {
+            fp_type: int(size or 0)
+            for fp_type, size in qdb.sql_connection.TRN.execute_fetchindex()
+        }
+
+
 def _rm_files(TRN, fp):
     # Remove the data
     if exists(fp):
@@ -1250,7 +1373,18 @@ def convert_to_id(value, table, text_col=None):
     ------
     QiitaDBLookupError
         The passed string has no associated id
+
+    Notes
+    -----
+    The values of the tables in LOOKUP_TABLES are cached in memory
     """
+    if table in LOOKUP_TABLES:
+        return _convert_to_id_cached(value, table, text_col)
+    return _convert_to_id(value, table, text_col)
+
+
+def _convert_to_id(value, table, text_col):
+    """Queries the id of `value` in `table`, see convert_to_id"""
     text_col = table if text_col is None else text_col
     with qdb.sql_connection.TRN:
         sql = "SELECT {0}_id FROM qiita.{0} WHERE {1} = %s".format(table, text_col)
@@ -1265,6 +1399,9 @@ def convert_to_id(value, table, text_col=None):
         return _id[0][0]
 
 
+_convert_to_id_cached = _lookup_table_cached(_convert_to_id)
+
+
 def convert_from_id(value, table):
     """Converts an id value to its corresponding string value
 
@@ -1284,7 +1421,18 @@ def convert_from_id(value, table):
     ------
     QiitaDBLookupError
         The passed id has no associated string
+
+    Notes
+    -----
+    The values of the tables in LOOKUP_TABLES are cached in memory
     """
+    if table in LOOKUP_TABLES:
+        return _convert_from_id_cached(value, table)
+    return _convert_from_id(value, table)
+
+
+def _convert_from_id(value, table):
+    """Queries the string of the id `value` in `table`, see convert_from_id"""
     with qdb.sql_connection.TRN:
         sql = "SELECT {0} FROM qiita.{0} WHERE {0}_id = %s".format(table)
         qdb.sql_connection.TRN.add(sql, [value])
@@ -1298,6 +1446,9 @@ def convert_from_id(value, table):
         return string[0][0]
 
 
+_convert_from_id_cached = _lookup_table_cached(_convert_from_id)
+
+
 def get_count(table):
     """Counts the number of rows in a table
 
@@ -1450,10 +1601,10 @@ def add_message(message, users):
                  RETURNING message_id"""
         qdb.sql_connection.TRN.add(sql, [message])
         msg_id = qdb.sql_connection.TRN.execute_fetchlast()
+        # a single insert for all the users
         sql = """INSERT INTO qiita.message_user (email, message_id)
-                 VALUES (%s, %s)"""
-        sql_args = [[user.id, msg_id] for user in users]
-        qdb.sql_connection.TRN.add(sql, sql_args, many=True)
+                 SELECT email, %s FROM unnest(%s::varchar[]) AS email"""
+        qdb.sql_connection.TRN.add(sql, [msg_id, [user.id for user in users]])
         qdb.sql_connection.TRN.execute()
 
 
@@ -1578,6 +1729,30 @@ def generate_study_list(user, visibility):
                 WHERE email=qiita.study.email) AS owner
     """
 
+    sids, visibility_sql = _study_list_ids(user, visibility)
+    return _study_list_info(sids, visibility_sql)
+
+
+def _study_list_ids(user, visibility):
+    """Get the study ids a user can list with the given visibility
+
+    Parameters
+    ----------
+    user : qiita_db.user.User
+        The user of which we are requesting studies from
+    visibility : string
+        The visibility to get studies {'public', 'user'}
+
+    Returns
+    -------
+    set of int, str
+        The study ids and the SQL filter to apply to the preparations
+
+    Raises
+    ------
+    ValueError
+        If the visibility is not valid
+    """
     visibility_sql = ""
     sids = set(s.id for s in user.user_studies.union(user.shared_studies))
     if visibility == "user":
@@ -1594,6 +1769,24 @@ def generate_study_list(user, visibility):
     else:
         raise ValueError("Not a valid visibility: %s" % visibility)
 
+    return sids, visibility_sql
+
+
+def _study_list_info(sids, visibility_sql):
+    """Get the general information of the given studies
+
+    Parameters
+    ----------
+    sids : iterable of int
+        The study ids
+    visibility_sql : str
+        The SQL filter to apply to the preparations
+
+    Returns
+    -------
+    list of dict
+        The list of studies and their information, sorted by study id
+    """
     sql = """
         SELECT metadata_complete, study_abstract, study_id, study_alias,
             study_title, ebi_study_accession, autoloaded,
@@ -1733,6 +1926,131 @@ def generate_study_list(user, visibility):
     return infolist
 
 
+def _like_pattern(text):
+    """Builds an ILIKE pattern that matches text anywhere in a value"""
+    for c in ("\\", "%", "_"):
+        text = text.replace(c, "\\" + c)
+    return "%%%s%%" % text
+
+
+# The columns the study listing can be sorted by and their SQL expressions
+STUDY_LIST_ORDER_COLUMNS = {
+    "study_id": "study_id",
+    "study_title": "study_title",
+    "study_alias": "study_alias",
+    "number_samples_collected": """(SELECT COUNT(sample_id)
+                                   FROM qiita.study_sample ss
+                                   WHERE ss.study_id = qiita.study.study_id)""",
+    "pi": "qiita.study_person.name",
+    "ebi_info": "ebi_study_accession",
+}
+
+
+def generate_study_list_page(
+    user,
+    visibility,
+    start=0,
+    length=None,
+    order_by="study_id",
+    ascending=True,
+    search=None,
+    tags=None,
+):
+    """Get general study information for a single page of the listing
+
+    Parameters
+    ----------
+    user : qiita_db.user.User
+        The user of which we are requesting studies from
+    visibility : string
+        The visibility to get studies {'public', 'user'}
+    start : int, optional
+        The offset of the first study to return. Default: 0
+    length : int, optional
+        The maximum number of studies to return. Default: all of them
+    order_by : str, optional
+        The column to sort by, one of STUDY_LIST_ORDER_COLUMNS.
+        Default: study_id
+    ascending : bool, optional
+        Whether to sort ascending or descending. Default: True
+    search : str, optional
+        Only return studies whose id, title, alias, abstract, PI or EBI
+        accession contain this text (case insensitive). Default: no filter
+    tags : list of str, optional
+        Only return studies that have all these tags. Default: no filter
+
+    Returns
+    -------
+    int, int, list of dict
+        The number of studies the user can list, the number of those studies
+        that match the filters, and the studies of the requested page as
+        returned by generate_study_list
+
+    Raises
+    ------
+    ValueError
+        If the visibility or the order_by column are not valid
+
+    Notes
+    -----
+    The filtering, sorting and paging are done in the database so only the
+    studies in the requested page are fully retrieved.
+    """
+    if order_by not in STUDY_LIST_ORDER_COLUMNS:
+        raise ValueError("Not a valid column to sort by: %s" % order_by)
+
+    sids, visibility_sql = _study_list_ids(user, visibility)
+    if not sids:
+        return 0, 0, []
+
+    sql_where = ["study_id IN %s"]
+    args = [tuple(sids)]
+    if search:
+        sql_where.append(
+            """(CAST(study_id AS VARCHAR) ILIKE %s OR study_title ILIKE %s
+                OR study_alias ILIKE %s OR study_abstract ILIKE %s
+                OR qiita.study_person.name ILIKE %s
+                OR ebi_study_accession ILIKE %s)"""
+        )
+        args.extend([_like_pattern(search)] * 6)
+    if tags:
+        tags = list(set(tags))
+        sql_where.append(
+            """(SELECT COUNT(DISTINCT study_tag)
+                FROM qiita.per_study_tags pst
+                WHERE pst.study_id = qiita.study.study_id
+                    AND study_tag = ANY(%s)) = %s"""
+        )
+        args.extend([tags, len(tags)])
+
+    sql_from = """FROM qiita.study
+                  LEFT JOIN qiita.study_person ON (
+                      study_person_id = principal_investigator_id)
+                  WHERE {0}""".format(" AND ".join(sql_where))
+    sql_order = "{0} {1} NULLS LAST, study_id {1}".format(
+        STUDY_LIST_ORDER_COLUMNS[order_by], "ASC" if ascending else "DESC"
+    )
+    sql_limit = "OFFSET %s" if length is None else "LIMIT %s OFFSET %s"
+
+    with qdb.sql_connection.TRN:
+        qdb.sql_connection.TRN.add("SELECT COUNT(*) %s" % sql_from, args)
+        filtered = qdb.sql_connection.TRN.execute_fetchlast()
+
+        sql = "SELECT study_id {0} ORDER BY {1} {2}".format(
+            sql_from, sql_order, sql_limit
+        )
+        page_args = args + ([start] if length is None else [length, start])
+        qdb.sql_connection.TRN.add(sql, page_args)
+        page = qdb.sql_connection.TRN.execute_fetchflatten()
+
+        infolist = _study_list_info(page, visibility_sql) if page else []
+
+    position = {sid: i for i, sid in enumerate(page)}
+    infolist.sort(key=lambda info: position[info["study_id"]])
+
+    return len(sids), filtered, infolist
+
+
 def generate_study_list_without_artifacts(study_ids, portal=None):
     """Get general study information without artifacts
 
@@ -1916,7 +2234,24 @@ def get_artifacts_information(artifact_ids, only_biom=True):
         qdb.sql_connection.TRN.add(
             sql, [tuple(artifact_ids), qdb.util.artifact_visibilities_to_skip()]
         )
-        for row in qdb.sql_connection.TRN.execute_fetchindex():
+        rows = qdb.sql_connection.TRN.execute_fetchindex()
+
+        # retrieving the platform and target gene of all the prep info files
+        # in a single query
+        prep_values = PT.get_categories(
+            ["platform", "target_gene"],
+            templates=[row[-1] for row in rows if row[-1] is not None],
+        )
+        for ptid, values in prep_values.items():
+            platform = set(v for v in values["platform"] if v is not None)
+            target_gene = set(v for v in values["target_gene"] if v is not None)
+            ps[ptid] = [
+                len(values["sample_id"]),
+                ", ".join(platform) if platform else "not provided",
+                ", ".join(target_gene) if target_gene else "not provided",
+            ]
+
+        for row in rows:
             (
                 aid,
                 name,
@@ -1990,18 +2325,6 @@ def get_artifacts_information(artifact_ids, only_biom=True):
             platform = "not provided"
             target_gene = "not provided"
             if prep_template_id is not None:
-                if prep_template_id not in ps:
-                    pt = PT(prep_template_id)
-                    categories = pt.categories
-                    if "platform" in categories:
-                        platform = ", ".join(set(pt.get_category("platform").values()))
-                    if "target_gene" in categories:
-                        target_gene = ", ".join(
-                            set(pt.get_category("target_gene").values())
-                        )
-
-                    ps[prep_template_id] = [len(list(pt.keys())), platform, target_gene]
-
                 prep_samples, platform, target_gene = ps[prep_template_id]
 
             results.append(
@@ -2115,6 +2438,7 @@ def open_file(filepath_or, *args, **kwargs):
             fh.close()
 
 
+@_lookup_table_cached
 def artifact_visibilities_to_skip():
     return tuple([qdb.util.convert_to_id("archived", "visibility")])
 
@@ -2195,6 +2519,119 @@ def generate_analysis_list(analysis_ids, public_only=False):
     return results
 
 
+# The columns the analysis listing can be sorted by and their SQL expressions
+ANALYSIS_LIST_ORDER_COLUMNS = {
+    "analysis_id": "analysis_id",
+    "name": "name",
+    "owner": "email",
+    "timestamp": "timestamp",
+}
+
+
+def generate_analysis_list_page(
+    analysis_ids,
+    public_only=False,
+    start=0,
+    length=None,
+    order_by="analysis_id",
+    ascending=True,
+    search=None,
+):
+    """Get general analysis information for a single page of the listing
+
+    Parameters
+    ----------
+    analysis_ids : list of ints
+        The analysis ids to look for. Non-existing ids will be ignored
+    public_only : bool, optional
+        If true, return only public analyses. Default: false.
+    start : int, optional
+        The offset of the first analysis to return. Default: 0
+    length : int, optional
+        The maximum number of analyses to return. Default: all of them
+    order_by : str, optional
+        The column to sort by, one of ANALYSIS_LIST_ORDER_COLUMNS.
+        Default: analysis_id
+    ascending : bool, optional
+        Whether to sort ascending or descending. Default: True
+    search : str, optional
+        Only return analyses whose id, name, description or owner contain
+        this text (case insensitive). Default: no filter
+
+    Returns
+    -------
+    int, int, list of dict
+        The number of analyses that can be listed, the number of those that
+        match the search, and the analyses of the requested page as returned
+        by generate_analysis_list
+
+    Raises
+    ------
+    ValueError
+        If the order_by column is not valid
+    """
+    if order_by not in ANALYSIS_LIST_ORDER_COLUMNS:
+        raise ValueError("Not a valid column to sort by: %s" % order_by)
+
+    if not analysis_ids:
+        return 0, 0, []
+
+    # an analysis is public only if all its artifacts are public, which
+    # matches how generate_analysis_list computes the visibility
+    sql_public = ""
+    if public_only:
+        sql_public = """AND analysis_id IN (
+            SELECT analysis_id
+            FROM qiita.analysis_artifact
+            LEFT JOIN qiita.artifact USING (artifact_id)
+            LEFT JOIN qiita.visibility USING (visibility_id)
+            WHERE analysis_id IN %s
+            GROUP BY analysis_id
+            HAVING bool_and(COALESCE(visibility = 'public', false)))"""
+    sql_base = """FROM qiita.analysis
+                  WHERE dflt = false AND analysis_id IN %s {0}""".format(sql_public)
+    args = [tuple(analysis_ids)]
+    if public_only:
+        args.append(tuple(analysis_ids))
+
+    sql_search = ""
+    search_args = []
+    if search:
+        sql_search = """AND (CAST(analysis_id AS VARCHAR) ILIKE %s
+                             OR name ILIKE %s OR description ILIKE %s
+                             OR email ILIKE %s)"""
+        search_args = [_like_pattern(search)] * 4
+
+    sql_order = "{0} {1}, analysis_id {1}".format(
+        ANALYSIS_LIST_ORDER_COLUMNS[order_by], "ASC" if ascending else "DESC"
+    )
+    sql_limit = "OFFSET %s" if length is None else "LIMIT %s OFFSET %s"
+
+    with qdb.sql_connection.TRN:
+        qdb.sql_connection.TRN.add("SELECT COUNT(*) %s" % sql_base, args)
+        total = qdb.sql_connection.TRN.execute_fetchlast()
+
+        args.extend(search_args)
+        qdb.sql_connection.TRN.add(
+            "SELECT COUNT(*) {0} {1}".format(sql_base, sql_search), args
+        )
+        filtered = qdb.sql_connection.TRN.execute_fetchlast()
+
+        sql = "SELECT analysis_id {0} {1} ORDER BY {2} {3}".format(
+            sql_base, sql_search, sql_order, sql_limit
+        )
+        args.extend([start] if length is None else [length, start])
+        qdb.sql_connection.TRN.add(sql, args)
+        page = qdb.sql_connection.TRN.execute_fetchflatten()
+
+        results = generate_analysis_list(page, public_only)
+
+    position = {aid: i for i, aid in enumerate(page)}
+    results.sort(key=lambda info: position[info["analysis_id"]])
+
+    return total, filtered, results
+
+
 def generate_analyses_list_per_study(study_id):
     """Get study analyses and their preparations
 
@@ -2378,8 +2815,23 @@ def activate_or_update_plugins(update=False):
         print("Ok")
 
 
-def send_email(to, subject, body):
-    # create email
+def _create_email(to, subject, body):
+    """Creates the email to send
+
+    Parameters
+    ----------
+    to : str
+        The email address of the recipient
+    subject : str
+        The subject of the email
+    body : str
+        The body of the email
+
+    Returns
+    -------
+    MIMEMultipart
+        The email
+    """
     msg = MIMEMultipart()
     msg["From"] = qiita_config.smtp_email
     msg["To"] = to
@@ -2388,6 +2840,17 @@ def send_email(to, subject, body):
     msg["Subject"] = subject.replace("\n", "")
     msg.attach(MIMEText(body, "plain"))
 
+    return msg
+
+
+def _smtp_connect():
+    """Connects and logs in to the smtp server
+
+    Returns
+    -------
+    smtplib.SMTP or smtplib.SMTP_SSL
+        The connection to the server, the caller needs to close it
+    """
     # connect to smtp server, using ssl if needed
     if qiita_config.smtp_ssl:
         smtp = SMTP_SSL()
@@ -2405,6 +2868,15 @@ def send_email(to, subject, body):
     if qiita_config.smtp_user:
         smtp.login(qiita_config.smtp_user, qiita_config.smtp_password)
 
+    return smtp
+
+
+def send_email(to, subject, body):
+    # create email
+    msg = _create_email(to, subject, body)
+
+    smtp = _smtp_connect()
+
     # send email
     try:
         smtp.sendmail(qiita_config.smtp_email, to, msg.as_string())
@@ -2414,6 +2886,145 @@ def send_email(to, subject, body):
         smtp.close()
 
 
+def queue_email(to, subject, body):
+    """Adds an email to the outbox, to be sent by send_queued_emails
+
+    Parameters
+    ----------
+    to : str
+        The email address of the recipient
+    subject : str
+        The subject of the email
+    body : str
+        The body of the email
+
+    Notes
+    -----
+    The email is added in the current transaction so it is only sent if the
+    transaction is committed, and the transaction doesn't wait for the smtp
+    server
+    """
+    with qdb.sql_connection.TRN:
+        sql = """INSERT INTO qiita.notification_outbox (email, subject, message)
+                 VALUES (%s, %s, %s)"""
+        qdb.sql_connection.TRN.add(sql, [to, subject, body])
+        qdb.sql_connection.TRN.execute()
+
+
+def send_queued_emails(max_attempts=5):
+    """Sends the emails in the outbox
+
+    Parameters
+    ----------
+    max_attempts : int, optional
+        The emails that failed to be sent this many times are not retried
+
+    Returns
+    -------
+    dict of {str: int}
+        The number of queued emails that were sent, that failed and that were
+        dropped because they failed `max_attempts` times,
+        {'sent': n, 'failed': n, 'dropped': n}
+
+    Notes
+    -----
+    All the emails are sent using the same connection, and all the queued
+    emails of a recipient are sent as a single email (a digest). The emails
+    that are sent are removed from the outbox, the ones that fail stay to be
+    retried in the next call, and the ones that failed `max_attempts` times
+    are removed from the outbox and added to the logs.
+    The emails are claimed before they are sent (without waiting for the
+    smtp server in a transaction), so the emails claimed by another call
+    running at the same time are skipped.
+    """
+    with qdb.sql_connection.TRN:
+        sql = """DELETE FROM qiita.notification_outbox
+                 WHERE attempts >= %s
+                 RETURNING email, subject, last_error"""
+        qdb.sql_connection.TRN.add(sql, [max_attempts])
+        dropped = qdb.sql_connection.TRN.execute_fetchindex()
+        if dropped:
+            qdb.logger.LogEntry.create(
+                "Runtime",
+                "These emails failed to be sent %d times and were dropped:\n%s"
+                % (
+                    max_attempts,
+                    "\n".join("%s, %s: %s" % tuple(d) for d in dropped),
+                ),
+            )
+
+        # a claim older than an hour is from a call that was lost
+        sql = """UPDATE qiita.notification_outbox
+                 SET claimed = clock_timestamp()
+                 WHERE notification_id IN (
+                    SELECT notification_id FROM qiita.notification_outbox
+                    WHERE attempts < %s AND (
+                        claimed IS NULL
+                        OR claimed < clock_timestamp() - interval '1 hour')
+                    FOR UPDATE SKIP LOCKED)
+                 RETURNING notification_id, email, subject, message"""
+        qdb.sql_connection.TRN.add(sql, [max_attempts])
+        claimed = qdb.sql_connection.TRN.execute_fetchindex()
+
+    summary = {"sent": 0, "failed": 0, "dropped": len(dropped)}
+    if not claimed:
+        return summary
+
+    # {email: [[notification_id, subject, message]]}
+    queued = defaultdict(list)
+    for nid, to, subject, message in sorted(claimed):
+        queued[to].append([nid, subject, message])
+
+    sent = []
+    failed = {}
+    try:
+        smtp = _smtp_connect()
+    except Exception as e:
+        smtp = None
+        failed = {nid: str(e) for nid, _, _, _ in claimed}
+
+    if smtp is not None:
+        try:
+            for to in sorted(queued):
+                nids, subjects, messages = zip(*queued[to])
+                if len(nids) == 1:
+                    subject, body = subjects[0], messages[0]
+                else:
+                    subject = "Qiita: %d notifications" % len(nids)
+                    body = "\n\n".join(
+                        "%s\n%s\n%s" % (s, "-" * len(s), m)
+                        for s, m in zip(subjects, messages)
+                    )
+                msg = _create_email(to, subject, body)
+                try:
+                    smtp.sendmail(qiita_config.smtp_email, to, msg.as_string())
+                except Exception as e:
+                    failed.update({nid: str(e) for nid in nids})
+                else:
+                    sent.extend(nids)
+        finally:
+            smtp.close()
+
+    with qdb.sql_connection.TRN:
+        if sent:
+            sql = """DELETE FROM qiita.notification_outbox
+                     WHERE notification_id IN %s"""
+            qdb.sql_connection.TRN.add(sql, [tuple(sent)])
+        if failed:
+            sql = """UPDATE qiita.notification_outbox
+                     SET attempts = attempts + 1, last_error = %s,
+                         claimed = NULL
+                     WHERE notification_id = %s"""
+            qdb.sql_connection.TRN.add(
+                sql, [[error, nid] for nid, error in failed.items()], many=True
+            )
+        qdb.sql_connection.TRN.execute()
+
+    summary["sent"] = len(sent)
+    summary["failed"] = len(failed)
+    return summary
+
+
 def resource_allocation_plot(df, col_name):
     """Builds resource allocation plot for given filename and jobs
 
@@ -2571,40 +3182,13 @@ def _resource_allocation_plot_helper(df, ax, curr, models, col_name):
         object containing constants for the best model (e.g. k, a, b in kx+b*a)
     """
 
-    x_data, y_data = df[col_name], df[curr]
-    # ax.scatter(x_data, y_data, s=2, label="data")
-    d = dict()
-    for index, row in df.iterrows():
-        x_value = row[col_name]
-        y_value = row[curr]
-        if x_value not in d:
-            d[x_value] = []
-        d[x_value].append(y_value)
-
-    for key in d.keys():
-        # save only top point increased by 5% because our graph needs to exceed
-        # the points
-        d[key] = [max(d[key]) * 1.05]
-
-    x_data = []
-    y_data = []
-
-    # Populate the lists with data from the dictionary
-    for x, ys in d.items():
-        for y in ys:
-            x_data.append(x)
-            y_data.append(y)
-
-    x_data = np.array(x_data)
-    y_data = np.array(y_data)
     ax.set_xscale("log")
     ax.set_yscale("log")
     ax.set_ylabel(curr)
     ax.set_xlabel(col_name)
 
-    # 50 - number of maximum iterations, 3 - number of failures we tolerate
-    best_model_name, best_model, options = _resource_allocation_calculate(
-        df, x_data, y_data, models, curr, col_name, 50, 3
+    best_model_name, best_model, options = _resource_allocation_fit(
+        df, curr, models, col_name
     )
     k, a, b = options.x
     x_plot = np.array(sorted(df[col_name].unique()))
@@ -2666,6 +3250,60 @@ def _resource_allocation_plot_helper(df, ax, curr, models, col_name):
     return best_model_name, best_model, options
 
 
+def _resource_allocation_fit(df, curr, models, col_name):
+    """Fits the models to the maximum resources used by the jobs
+
+    Parameters
+    ----------
+    df: pandas dataframe, required
+        The jobs to fit the models to
+    curr: str, required
+        Either MaxRSSRaw or ElapsedRaw
+    models: dictionary, required
+        The models to fit, see _resource_allocation_calculate
+    col_name: str, required
+        The column of df with the x values of the models
+
+    Returns
+    -------
+    best_model_name: string
+        the name of the best model from the table
+    best_model: function
+        best fitting function for the current dictionary models
+    options: object
+        object containing constants for the best model (e.g. k, a, b in kx+b*a)
+    """
+    d = dict()
+    for index, row in df.iterrows():
+        x_value = row[col_name]
+        y_value = row[curr]
+        if x_value not in d:
+            d[x_value] = []
+        d[x_value].append(y_value)
+
+    for key in d.keys():
+        # save only top point increased by 5% because our graph needs to exceed
+        # the points
+        d[key] = [max(d[key]) * 1.05]
+
+    x_data = []
+    y_data = []
+
+    # Populate the lists with data from the dictionary
+    for x, ys in d.items():
+        for y in ys:
+            x_data.append(x)
+            y_data.append(y)
+
+    x_data = np.array(x_data)
+    y_data = np.array(y_data)
+
+    # 50 - number of maximum iterations, 3 - number of failures we tolerate
+    return _resource_allocation_calculate(
+        df, x_data, y_data, models, curr, col_name, 50, 3
+    )
+
+
 def _resource_allocation_calculate(df, x, y, models, type_, col_name, depth, tolerance):
     """Helper function for resource allocation plot. Calculates best_model and
     best_result given the models list and x,y data.
@@ -2890,7 +3528,7 @@ def update_resource_allocation_table(weeks=1, test=None):
     # retrieve the most recent timestamp
     sql_timestamp = """
             SELECT
-                pj.external_job_id,
+                split_part(pj.external_job_id, '_', 1),
                 sra.job_start
             FROM
                 qiita.processing_job pj
@@ -2936,9 +3574,9 @@ def update_resource_allocation_table(weeks=1, test=None):
             WHERE
                 pjs.processing_job_status = 'success'
             AND
-                pj.external_job_id ~ '^[0-9]+$'
+                pj.external_job_id ~ '^[0-9]+(_[0-9]+)?$'
             AND
-                CAST(pj.external_job_id AS INTEGER) > %s
+                CAST(split_part(pj.external_job_id, '_', 1) AS INTEGER) > %s
             AND
                 sra.processing_job_id IS NULL;
         """
@@ -2947,7 +3585,6 @@ def update_resource_allocation_table(weeks=1, test=None):
         qdb.sql_connection.TRN.add(sql_command, sql_args=[slurm_external_id])
         res = qdb.sql_connection.TRN.execute_fetchindex()
         df = pd.DataFrame(res, columns=["processing_job_id", "external_id"])
-        df["external_id"] = df["external_id"].astype(int)
 
     data = []
     sacct = [
@@ -2999,8 +3636,9 @@ def update_resource_allocation_table(weeks=1, test=None):
         tmp["WaitTime"] = wait_time
         return tmp
 
+    # the ids are kept as strings as the tasks of job arrays are <id>_<index>
     slurm_data["external_id"] = slurm_data["JobID"].apply(
-        lambda x: int(x.split(".")[0])
+        lambda x: str(x).split(".")[0]
     )
     slurm_data["external_id"] = slurm_data["external_id"].ffill()
 
@@ -3066,7 +3704,7 @@ def update_resource_allocation_table(weeks=1, test=None):
                     "min_depth and max_depth. (steps)"
                 )
             ]
-        curr = slurm_data[slurm_data["external_id"] == int(eid)].iloc[0]
+        curr = slurm_data[slurm_data["external_id"] == eid].iloc[0]
         barnacle_info = curr["MaxVMSizeNode"]
         if len(barnacle_info) == 0:
             barnacle_info = [None, None]
@@ -3130,6 +3768,497 @@ def update_resource_allocation_table(weeks=1, test=None):
             qdb.sql_connection.TRN.execute()
 
 
+_FORMULA_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+_FORMULA_FUNCTIONS = {
+    "nlog": np.log,
+    "np.log": np.log,
+    "min": min,
+    "max": max,
+    "abs": abs,
+}
+
+
+def _compile_formula_node(node, variables):
+    """Compiles a node of a formula, see compile_formula"""
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Not a number: %r" % value)
+        return lambda values: value
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name not in variables:
+            raise ValueError("Unknown variable: %s" % name)
+        return lambda values: values[name]
+    if isinstance(node, ast.BinOp) and type(node.op) in _FORMULA_OPERATORS:
+        op = _FORMULA_OPERATORS[type(node.op)]
+        left = _compile_formula_node(node.left, variables)
+        right = _compile_formula_node(node.right, variables)
+        return lambda values: op(left(values), right(values))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _FORMULA_OPERATORS:
+        op = _FORMULA_OPERATORS[type(node.op)]
+        operand = _compile_formula_node(node.operand, variables)
+        return lambda values: op(operand(values))
+    if isinstance(node, ast.Compare) and all(
+        type(op) in _FORMULA_OPERATORS for op in node.ops
+    ):
+        left = _compile_formula_node(node.left, variables)
+        comparisons = [
+            (_FORMULA_OPERATORS[type(op)], _compile_formula_node(c, variables))
+            for op, c in zip(node.ops, node.comparators)
+        ]
+
+        def compare(values):
+            current = left(values)
+            for op, comparator in comparisons:
+                other = comparator(values)
+                if not op(current, other):
+                    return False
+                current = other
+            return True
+
+        return compare
+    if isinstance(node, ast.BoolOp):
+        *operands, last = [_compile_formula_node(v, variables) for v in node.values]
+        stop = operator.not_ if isinstance(node.op, ast.And) else operator.truth
+
+        def boolean(values):
+            # as in python, the value is the one of the operand that decides
+            # the result, and the rest of the operands are not evaluated
+            for operand in operands:
+                value = operand(values)
+                if stop(value):
+                    return value
+            return last(values)
+
+        return boolean
+    if isinstance(node, ast.IfExp):
+        test = _compile_formula_node(node.test, variables)
+        body = _compile_formula_node(node.body, variables)
+        orelse = _compile_formula_node(node.orelse, variables)
+        return lambda values: body(values) if test(values) else orelse(values)
+    if isinstance(node, ast.Call) and not node.keywords:
+        name = ast.unparse(node.func)
+        if name not in _FORMULA_FUNCTIONS:
+            raise ValueError("Unknown function: %s" % name)
+        func = _FORMULA_FUNCTIONS[name]
+        args = [_compile_formula_node(a, variables) for a in node.args]
+        return lambda values: func(*[a(values) for a in args])
+    raise ValueError("Not allowed: %s" % ast.unparse(node))
+
+
+@lru_cache(maxsize=1024)
+def compile_formula(formula, variables):
+    """Compiles an arithmetic formula, e.g. a resource allocation formula
+
+    Parameters
+    ----------
+    formula : str
+        The formula, a python expression of `variables` with numbers,
+        arithmetic and comparison operators, conditional expressions (`a if
+        b else c`) and the functions in _FORMULA_FUNCTIONS
+    variables : tuple of str
+        The names of the variables of the formula
+
+    Returns
+    -------
+    function
+        The formula as a function of the variables, passed by name
+
+    Raises
+    ------
+    ValueError
+        If the formula is not valid
+
+    Notes
+    -----
+    The formula is validated and compiled once; the functions are cached by
+    formula so they are compiled again when a formula changes
+    """
+    try:
+        tree = ast.parse(formula.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError("Not valid formula %r: %s" % (formula, e))
+    try:
+        compiled = _compile_formula_node(tree.body, variables)
+    except ValueError as e:
+        raise ValueError("Not valid formula %r: %s" % (formula, e))
+
+    def evaluate(**values):
+        return compiled(values)
+
+    return evaluate
+
+
+def _resource_allocation_equation(expression):
+    """Returns the function of an allocation equation
+
+    Parameters
+    ----------
+    expression : str
+        The expression of the equation in qiita.allocation_equations, a
+        function of x with the parameters k, a and b
+
+    Returns
+    -------
+    function
+        The equation as a function of x, k, a and b
+
+    Raises
+    ------
+    ValueError
+        If the expression is not valid
+    """
+    formula = compile_formula(expression, ("x", "k", "a", "b"))
+
+    def equation(x, k, a, b):
+        return formula(x=x, k=k, a=a, b=b)
+
+    return equation
+
+
+def _resource_allocation_models():
+    """Retrieves the memory and time models that can be fitted
+
+    Returns
+    -------
+    dict, dict
+        The memory and time models, as the ones of retrieve_equations
+
+    Notes
+    -----
+    Unlike retrieve_equations, each model evaluates its own expression, and
+    the expressions that can't be evaluated are not returned
+    """
+    with qdb.sql_connection.TRN:
+        sql = "SELECT equation_name, expression FROM qiita.allocation_equations"
+        qdb.sql_connection.TRN.add(sql)
+        res = qdb.sql_connection.TRN.execute_fetchindex()
+
+    memory_models = {}
+    time_models = {}
+    for name, expression in res:
+        try:
+            equation = _resource_allocation_equation(expression)
+            equation(np.array([1, 10]), 1, 1, 1)
+        except Exception:
+            continue
+        models = memory_models if "mem" in name else time_models
+        models[name] = {"equation_name": expression, "equation": equation}
+    return memory_models, time_models
+
+
+def _resource_allocation_jobs():
+    """Retrieves the resources used by the jobs with known samples and columns
+
+    Returns
+    -------
+    pd.DataFrame
+        The jobs sorted by their start time
+    """
+    with qdb.sql_connection.TRN:
+        sql = """SELECT sc.command_id, s.name, s.version, sc.name,
+                        sra.samples, sra.columns, sra.memory_used,
+                        sra.walltime_used, sra.job_start
+                 FROM qiita.slurm_resource_allocations sra
+                 JOIN qiita.processing_job USING (processing_job_id)
+                 JOIN qiita.software_command sc USING (command_id)
+                 JOIN qiita.software s USING (software_id)
+                 WHERE sra.samples > 0 AND sra.columns > 0
+                    AND sra.memory_used > 0 AND sra.walltime_used > 0
+                 ORDER BY sra.job_start"""
+        qdb.sql_connection.TRN.add(sql)
+        res = qdb.sql_connection.TRN.execute_fetchindex()
+    df = pd.DataFrame(
+        res,
+        columns=[
+            "cID",
+            "sName",
+            "sVersion",
+            "cName",
+            "samples",
+            "columns",
+            "MaxRSSRaw",
+            "ElapsedRaw",
+            "Start",
+        ],
+    )
+    df["samples * columns"] = df.samples * df["columns"]
+    return df
+
+
+def _fit_resource_allocation_models(df, memory_models, time_models):
+    """Fits the memory and time models to the resources used by the jobs
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The jobs, as returned by _resource_allocation_jobs
+    memory_models, time_models : dict
+        The models, as returned by _resource_allocation_models
+
+    Returns
+    -------
+    dict or None
+        {'memory': (name, expression, [k, a, b], max used), 'time': ...} with
+        the best memory and time models and the largest memory and time used
+        by the jobs, or None if one of them couldn't be fitted
+    """
+    fitted = {}
+    for key, curr, models in (
+        ("memory", "MaxRSSRaw", memory_models),
+        ("time", "ElapsedRaw", time_models),
+    ):
+        name, _, options = _resource_allocation_fit(
+            df.copy(), curr, models, "samples * columns"
+        )
+        if name is None:
+            return None
+        # options is the initial [k, a, b] if no fit improved on it
+        params = [float(p) for p in getattr(options, "x", options)]
+        fitted[key] = (
+            name,
+            models[name]["equation_name"],
+            params,
+            float(df[curr].max()),
+        )
+    return fitted
+
+
+def _backtest_resource_allocation_models(
+    df, memory_models, time_models, train_fraction, margin, min_jobs
+):
+    """Fits the models to the oldest jobs and tests them with the newest ones
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The jobs of a command, as returned by _resource_allocation_jobs
+    memory_models, time_models : dict
+        The models, as returned by _resource_allocation_models
+    train_fraction : float
+        The fraction of the jobs used to fit the models
+    margin : float
+        The margin applied to the predictions
+    min_jobs : int
+        The minimum number of jobs to fit the models
+
+    Returns
+    -------
+    dict or None
+        {'train_jobs': n, 'test_jobs': n, 'memory': (name, failure rate,
+        over allocation), 'time': ...}, see resource_allocation_backtest, or
+        None if there are not enough jobs or the models couldn't be fitted
+
+    Notes
+    -----
+    The test jobs request what ProcessingJob.resource_allocation_info would
+    request: the prediction or the largest resources used by the oldest jobs,
+    whichever is larger, multiplied by margin
+    """
+    ntrain = int(len(df) * train_fraction)
+    train, test = df.iloc[:ntrain], df.iloc[ntrain:]
+    if ntrain < min_jobs or test.empty:
+        return None
+    models = _fit_resource_allocation_models(train, memory_models, time_models)
+    if models is None:
+        return None
+    results = {"train_jobs": len(train), "test_jobs": len(test)}
+    x = np.array(test["samples * columns"], dtype=float)
+    for key, curr in (("memory", "MaxRSSRaw"), ("time", "ElapsedRaw")):
+        name, expression, (k, a, b), max_used = models[key]
+        used = np.array(test[curr], dtype=float)
+        predicted = _resource_allocation_equation(expression)(x, k, a, b)
+        requested = np.maximum(predicted, max_used) * margin
+        failed = used > requested
+        ok = ~failed
+        over = (requested[ok] - used[ok]).sum() / used[ok].sum() if ok.any() else np.nan
+        results[key] = (name, float(failed.mean()), over)
+    return results
+
+
+def update_resource_allocation_models(
+    min_jobs=10, train_fraction=0.8, max_failure_rate=0.05
+):
+    """Fits the memory and time models of the commands to the resources used
+    by their jobs
+
+    Parameters
+    ----------
+    min_jobs : int, optional
+        The minimum number of jobs of a command to fit its models
+    train_fraction : float, optional
+        The fraction of the jobs of each command used to fit the models when
+        they are backtested
+    max_failure_rate : float, optional
+        The maximum fraction of jobs that would have run out of memory or
+        time in the backtest for the models of a command to be enabled
+
+    Returns
+    -------
+    list of int
+        The ids of the commands whose models were fitted
+
+    Notes
+    -----
+    The models are stored in qiita.resource_allocation_model, where the
+    enabled ones are used by ProcessingJob.resource_allocation_info. The
+    models are fitted to all the jobs of the command, and backtested (see
+    resource_allocation_backtest) with the margin of the command to decide
+    if they are enabled. Note that only the jobs that succeeded are in
+    qiita.slurm_resource_allocations, so the failure rates don't include the
+    jobs that ran out of the resources they requested.
+    """
+    df = _resource_allocation_jobs()
+    memory_models, time_models = _resource_allocation_models()
+
+    with qdb.sql_connection.TRN:
+        sql = "SELECT command_id, margin FROM qiita.resource_allocation_model"
+        qdb.sql_connection.TRN.add(sql)
+        margins = dict(qdb.sql_connection.TRN.execute_fetchindex())
+
+    sql = """INSERT INTO qiita.resource_allocation_model (
+                command_id, memory_equation, memory_expression,
+                memory_parameters, max_memory_used, time_equation,
+                time_expression, time_parameters, max_time_used, jobs,
+                memory_failure_rate, time_failure_rate, enabled)
+             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+             ON CONFLICT (command_id) DO UPDATE
+             SET memory_equation = EXCLUDED.memory_equation,
+                 memory_expression = EXCLUDED.memory_expression,
+                 memory_parameters = EXCLUDED.memory_parameters,
+                 max_memory_used = EXCLUDED.max_memory_used,
+                 time_equation = EXCLUDED.time_equation,
+                 time_expression = EXCLUDED.time_expression,
+                 time_parameters = EXCLUDED.time_parameters,
+                 max_time_used = EXCLUDED.max_time_used,
+                 jobs = EXCLUDED.jobs,
+                 memory_failure_rate = EXCLUDED.memory_failure_rate,
+                 time_failure_rate = EXCLUDED.time_failure_rate,
+                 enabled = EXCLUDED.enabled, fitted = NOW()"""
+    fitted = []
+    for cid, cdf in df.groupby("cID"):
+        if len(cdf) < min_jobs:
+            continue
+        models = _fit_resource_allocation_models(cdf, memory_models, time_models)
+        if models is None:
+            continue
+        # 1.2 is the default margin of qiita.resource_allocation_model
+        backtest = _backtest_resource_allocation_models(
+            cdf,
+            memory_models,
+            time_models,
+            train_fraction,
+            margins.get(int(cid), 1.2),
+            min_jobs,
+        )
+        rates = [None, None]
+        enabled = False
+        if backtest is not None:
+            rates = [backtest["memory"][1], backtest["time"][1]]
+            enabled = max(rates) <= max_failure_rate
+        with qdb.sql_connection.TRN:
+            qdb.sql_connection.TRN.add(
+                sql,
+                [
+                    int(cid),
+                    *models["memory"],
+                    *models["time"],
+                    len(cdf),
+                    *rates,
+                    enabled,
+                ],
+            )
+            qdb.sql_connection.TRN.execute()
+        fitted.append(int(cid))
+    return fitted
+
+
+def resource_allocation_backtest(train_fraction=0.8, margin=1.2, min_jobs=10):
+    """Reports the failures and over-allocation of the fitted models
+
+    For each command, the models are fitted to the oldest jobs and the
+    resources they would have requested (the prediction, or the largest
+    resources used by the oldest jobs if larger, multiplied by margin) are
+    compared with the resources used by the newest jobs.
+
+    Parameters
+    ----------
+    train_fraction : float, optional
+        The fraction of the jobs of each command used to fit the models
+    margin : float, optional
+        The margin applied to the predictions, defaults to the default margin
+        of qiita.resource_allocation_model
+    min_jobs : int, optional
+        The minimum number of jobs to fit the models of a command
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per command with the number of jobs used to fit and test the
+        models; and for memory and time: the best model, the fraction of the
+        test jobs that would have failed (out of memory or out of time) and
+        the resources requested in excess by the rest of the test jobs, as a
+        fraction of the resources they used
+    """
+    df = _resource_allocation_jobs()
+    memory_models, time_models = _resource_allocation_models()
+
+    rows = []
+    for (_, sname, version, cname), cdf in df.groupby(
+        ["cID", "sName", "sVersion", "cName"]
+    ):
+        backtest = _backtest_resource_allocation_models(
+            cdf, memory_models, time_models, train_fraction, margin, min_jobs
+        )
+        if backtest is None:
+            continue
+        rows.append(
+            [
+                sname,
+                version,
+                cname,
+                backtest["train_jobs"],
+                backtest["test_jobs"],
+                *backtest["memory"],
+                *backtest["time"],
+            ]
+        )
+
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "sName",
+            "sVersion",
+            "cName",
+            "train_jobs",
+            "test_jobs",
+            "memory_model",
+            "memory_failure_rate",
+            "memory_over_allocation",
+            "time_model",
+            "time_failure_rate",
+            "time_over_allocation",
+        ],
+    )
+
+
 def merge_overlapping_strings(str1, str2):
     """Helper function to merge 2 overlapping strings
 
@@ -144,8 +144,11 @@ class SampleValidation(AdminProcessingJobBaseClass):
         # Example: 1.SKB1.640202 -> SKB1.640202
         try:
             sample_info = Study(qid).sample_template
-            qsnames = list(sample_info)
-        except TypeError:
+            # retrieving the sample names and their tube_id in a single query
+            values = sample_info.get_categories(["tube_id"], templates=[sample_info])
+            values = values[sample_info.id]
+            qsnames = list(values["sample_id"])
+        except AttributeError:
             error = f"Study {qid} seems to have no sample template"
         except QiitaDBUnknownIDError:
             error = f"Study {qid} does not exist"
@@ -153,14 +156,13 @@ class SampleValidation(AdminProcessingJobBaseClass):
         if error is None:
             # if tube_id is present then this should take precedence in qsnames
             tube_ids = dict()
-            if "tube_id" in sample_info.categories:
-                for k, v in sample_info.get_category("tube_id").items():
-                    # ignoring empty values
-                    if v in (None, "None", ""):
-                        continue
-                    if k.startswith(qid):
-                        k = k.replace(f"{qid}.", "", 1)
-                    tube_ids[k] = v
+            for k, v in zip(values["sample_id"], values["tube_id"]):
+                # ignoring empty values, including samples without tube_id
+                if v in (None, "None", ""):
+                    continue
+                if k.startswith(qid):
+                    k = k.replace(f"{qid}.", "", 1)
+                tube_ids[k] = v
 
             for i, qsname in enumerate(qsnames):
                 if qsname.startswith(qid):
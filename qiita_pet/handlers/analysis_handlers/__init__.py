@@ -16,6 +16,7 @@ from .base_handlers import (
 )
 from .listing_handlers import (
     AnalysisSummaryAJAX,
+    ListAnalysesAJAX,
     ListAnalysesHandler,
     SelectedSamplesHandler,
 )
@@ -27,6 +28,7 @@ __all__ = [
     "AnalysisGraphHandler",
     "AnalysisJobsHandler",
     "ListAnalysesHandler",
+    "ListAnalysesAJAX",
     "AnalysisSummaryAJAX",
     "SelectedSamplesHandler",
     "check_analysis_access",
@@ -10,7 +10,7 @@ from collections import defaultdict
 from functools import partial
 from json import dumps, loads
 
-from tornado.web import authenticated
+from tornado.web import HTTPError, authenticated
 
 from qiita_core.qiita_settings import qiita_config, r_client
 from qiita_core.util import execute_as_transaction
@@ -18,31 +18,34 @@ from qiita_db.analysis import Analysis
 from qiita_db.artifact import Artifact
 from qiita_db.processing_job import ProcessingJob
 from qiita_db.software import Parameters, Software
-from qiita_db.util import generate_analysis_list
+from qiita_db.util import ANALYSIS_LIST_ORDER_COLUMNS, generate_analysis_list_page
 from qiita_pet.handlers.analysis_handlers import check_analysis_access
 from qiita_pet.handlers.base_handlers import BaseHandler
-from qiita_pet.handlers.util import download_link_or_path
+from qiita_pet.handlers.util import (
+    datatables_page_args,
+    download_link_or_path,
+    to_int,
+)
 from qiita_pet.util import is_localhost
 
 
-class ListAnalysesHandler(BaseHandler):
-    @authenticated
-    @execute_as_transaction
-    def get(self):
-        user = self.current_user
-        is_local_request = is_localhost(self.request.headers["host"])
+def _get_analysis_ids(user):
+    """Returns the ids of the user's analyses and of the other public ones"""
+    uanalyses = user.shared_analyses | user.private_analyses
+    user_analysis_ids = set([a.id for a in uanalyses])
 
-        uanalyses = user.shared_analyses | user.private_analyses
-        user_analysis_ids = set([a.id for a in uanalyses])
+    panalyses = Analysis.get_by_status("public")
+    public_analysis_ids = set([a.id for a in panalyses])
+    public_analysis_ids = public_analysis_ids - user_analysis_ids
 
-        panalyses = Analysis.get_by_status("public")
-        public_analysis_ids = set([a.id for a in panalyses])
-        public_analysis_ids = public_analysis_ids - user_analysis_ids
+    return user_analysis_ids, public_analysis_ids
 
-        user_analyses = generate_analysis_list(user_analysis_ids)
-        public_analyses = generate_analysis_list(public_analysis_ids, True)
 
-        dlop = partial(download_link_or_path, is_local_request)
+class ListAnalysesHandler(BaseHandler):
+    @authenticated
+    @execute_as_transaction
+    def get(self):
+        user_analysis_ids, _ = _get_analysis_ids(self.current_user)
 
         messages = {"info": "", "danger": ""}
         for analysis_id in user_analysis_ids:
@@ -66,13 +69,7 @@ class ListAnalysesHandler(BaseHandler):
                         job.log.msg.replace("\n", "<br/>") + "<br/>"
                     )
 
-        self.render(
-            "list_analyses.html",
-            user_analyses=user_analyses,
-            public_analyses=public_analyses,
-            messages=messages,
-            dlop=dlop,
-        )
+        self.render("list_analyses.html", messages=messages)
 
     @authenticated
     @execute_as_transaction
@@ -93,6 +90,44 @@ class ListAnalysesHandler(BaseHandler):
         self.redirect("%s/analysis/list/" % (qiita_config.portal_dir))
 
 
+class ListAnalysesAJAX(BaseHandler):
+    @authenticated
+    @execute_as_transaction
+    def get(self):
+        visibility = self.get_argument("visibility")
+        draw = to_int(self.get_argument("draw"))
+        if visibility not in ["user", "public"]:
+            raise HTTPError(400, reason="Not a valid visibility")
+
+        user_analysis_ids, public_analysis_ids = _get_analysis_ids(self.current_user)
+        if visibility == "user":
+            analysis_ids, public_only = user_analysis_ids, False
+        else:
+            analysis_ids, public_only = public_analysis_ids, True
+
+        kwargs = datatables_page_args(self, ANALYSIS_LIST_ORDER_COLUMNS, "analysis_id")
+        total, filtered, info = generate_analysis_list_page(
+            analysis_ids, public_only, **kwargs
+        )
+
+        dlop = partial(
+            download_link_or_path, is_localhost(self.request.headers["host"])
+        )
+        for analysis in info:
+            analysis["mapping_files"] = [
+                dlop(fp, fp_id, "mapping file")
+                for fp_id, fp in analysis["mapping_files"]
+            ]
+
+        results = {
+            "draw": draw,
+            "recordsTotal": total,
+            "recordsFiltered": filtered,
+            "data": info,
+        }
+        self.write(dumps(results, separators=(",", ":")))
+
+
 class AnalysisSummaryAJAX(BaseHandler):
     @authenticated
     @execute_as_transaction
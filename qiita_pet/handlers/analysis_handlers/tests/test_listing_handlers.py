@@ -17,6 +17,36 @@ class TestListingHandlers(TestHandlerBase):
         response = self.get("/analysis/list/")
         self.assertEqual(response.code, 200)
 
+    def test_get_list_analyses_ajax(self):
+        args = {
+            "visibility": "user",
+            "draw": 2,
+            "start": 0,
+            "length": 1,
+            "order[0][column]": 1,
+            "order[0][dir]": "asc",
+            "columns[1][data]": "analysis_id",
+        }
+        response = self.get("/analysis/list_analyses/", args)
+        self.assertEqual(response.code, 200)
+        obs = loads(response.body)
+        self.assertEqual(obs["draw"], 2)
+        self.assertEqual(obs["recordsTotal"], obs["recordsFiltered"])
+        self.assertEqual(len(obs["data"]), 1)
+        self.assertEqual(obs["data"][0]["analysis_id"], 1)
+        self.assertEqual(len(obs["data"][0]["mapping_files"]), 1)
+
+        args["visibility"] = "public"
+        response = self.get("/analysis/list_analyses/", args)
+        self.assertEqual(response.code, 200)
+        obs = loads(response.body)
+        self.assertEqual(obs["recordsTotal"], 0)
+        self.assertEqual(obs["data"], [])
+
+        args["visibility"] = "bad"
+        response = self.get("/analysis/list_analyses/", args)
+        self.assertEqual(response.code, 400)
+
     def test_get_analysis_summary_ajax(self):
         response = self.get("/analysis/dflt/sumary/")
         self.assertEqual(response.code, 200)
@@ -6,12 +6,15 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 
+from re import compile as re_compile
+
 from tornado.gen import coroutine
 from tornado.web import HTTPError
 
 from qiita_core.util import execute_as_transaction
 from qiita_db.artifact import Artifact
 from qiita_db.exceptions import QiitaDBUnknownIDError
+from qiita_db.meta_util import search_metadata
 from qiita_db.study import Study
 from qiita_db.util import get_artifacts_information
 from qiita_pet.handlers.util import doi_linkifier, pubmed_linkifier
@@ -19,6 +22,10 @@ from qiita_pet.util import EBI_LINKIFIER
 
 from .base_handlers import BaseHandler
 
+# column, operator and value of a metadata search condition, like ph>=7 or
+# env_biome~forest; ~ is the "contains" operator
+METADATA_CONDITION_RE = re_compile(r"^([^<>=!~]+)(<=|>=|!=|<|>|=|~)(.*)$")
+
 
 class PublicHandler(BaseHandler):
     @coroutine
@@ -101,3 +108,32 @@ class PublicHandler(BaseHandler):
             study_info=study_info,
             artifacts_info=get_artifacts_information(artifact_ids, False),
         )
+
+
+class MetadataSearchHandler(BaseHandler):
+    @execute_as_transaction
+    def get(self):
+        """Searches the public samples by their metadata
+
+        Each `query` argument is a condition the samples must match, with
+        the format column[=|!=|<|<=|>|>=|~]value. `template` limits the search
+        to the sample or prep information.
+        """
+        conditions = []
+        for query in self.get_arguments("query"):
+            match = METADATA_CONDITION_RE.match(query)
+            if match is None:
+                raise HTTPError(422, reason="Not a valid condition: %s" % query)
+            column, operator, value = match.groups()
+            if operator == "~":
+                operator = "contains"
+            conditions.append((column.strip(), operator, value.strip()))
+
+        try:
+            results = search_metadata(
+                conditions, template=self.get_argument("template", None)
+            )
+        except ValueError as e:
+            raise HTTPError(422, reason=str(e))
+
+        self.write({"status": "success", "message": "", "data": results})
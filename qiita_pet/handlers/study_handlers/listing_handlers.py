@@ -16,14 +16,21 @@ from qiita_core.util import execute_as_transaction
 from qiita_db.artifact import Artifact
 from qiita_db.study import Study
 from qiita_db.user import User
-from qiita_db.util import add_message, generate_study_list
+from qiita_db.util import (
+    STUDY_LIST_ORDER_COLUMNS,
+    add_message,
+    generate_study_list,
+    generate_study_list_page,
+)
 from qiita_pet.handlers.base_handlers import BaseHandler
 from qiita_pet.handlers.util import (
     check_access,
+    datatables_page_args,
     doi_linkifier,
     get_shared_links,
     pubmed_linkifier,
     study_person_linkifier,
+    to_int,
 )
 from qiita_pet.util import EBI_LINKIFIER
 
@@ -124,17 +131,29 @@ class ListStudiesAJAX(BaseHandler):
     def get(self, ignore):
         user = self.get_argument("user")
         visibility = self.get_argument("visibility")
-        echo = int(self.get_argument("sEcho"))
+        # DataTables sends draw when using server-side processing, the
+        # legacy full listing is requested with sEcho
+        draw = self.get_argument("draw", None)
 
         if user != self.current_user.id:
             raise HTTPError(403, reason="Unauthorized search!")
         if visibility not in ["user", "public"]:
             raise HTTPError(400, reason="Not a valid visibility")
 
-        info = generate_study_list(self.current_user, visibility)
+        if draw is None:
+            echo = int(self.get_argument("sEcho"))
+            info = generate_study_list(self.current_user, visibility)
+            total = filtered = len(info)
+        else:
+            draw = to_int(draw)
+            kwargs = datatables_page_args(self, STUDY_LIST_ORDER_COLUMNS, "study_id")
+            tags = self.get_arguments("tags[]")
+            total, filtered, info = generate_study_list_page(
+                self.current_user, visibility, tags=tags, **kwargs
+            )
+
         # linkifying data
-        len_info = len(info)
-        for i in range(len_info):
+        for i in range(len(info)):
             info[i]["shared"] = ", ".join(
                 [study_person_linkifier(element) for element in info[i]["shared"]]
             )
@@ -155,12 +174,20 @@ class ListStudiesAJAX(BaseHandler):
                 )
 
         # build the table json
-        results = {
-            "sEcho": echo,
-            "iTotalRecords": len_info,
-            "iTotalDisplayRecords": len_info,
-            "aaData": info,
-        }
+        if draw is None:
+            results = {
+                "sEcho": echo,
+                "iTotalRecords": total,
+                "iTotalDisplayRecords": filtered,
+                "aaData": info,
+            }
+        else:
+            results = {
+                "draw": draw,
+                "recordsTotal": total,
+                "recordsFiltered": filtered,
+                "data": info,
+            }
 
         # return the json in compact form to save transmit size
         self.write(dumps(results, separators=(",", ":")))
@@ -25,7 +25,6 @@ from qiita_pet.handlers.api_proxy import (
     check_fp,
     data_types_get_req,
     get_sample_template_processing_status,
-    prep_template_samples_get_req,
     sample_template_category_get_req,
     sample_template_meta_cats_get_req,
     sample_template_samples_get_req,
@@ -506,8 +505,10 @@ def _build_sample_summary(study_id, user_id):
         s: {"sample": s}
         for s in sample_template_samples_get_req(study_id, user_id)["samples"]
     }
-    samples = rows.keys()
-    # Add one column per prep template highlighting what samples exist
+    # Add one column per prep template highlighting what samples exist. The
+    # membership of all the preps is retrieved at once as a bitmap per prep
+    all_samples, membership = Study(study_id).prep_samples_membership()
+    positions = [(i, s) for i, s in enumerate(all_samples) if s in rows]
     preps = study_prep_get_req(study_id, user_id)["info"]
     columns = {}
     for preptype in preps:
@@ -515,9 +516,13 @@ def _build_sample_summary(study_id, user_id):
             field = "prep%d" % prep["id"]
             name = "%s (%d)" % (prep["name"], prep["id"])
             columns[field] = name
-            prep_samples = prep_template_samples_get_req(prep["id"], user_id)["samples"]
-            for s in samples:
-                rows[s][field] = "X" if s in prep_samples else ""
+            bitmap = membership.get(prep["id"])
+            for s in rows:
+                rows[s][field] = ""
+            if bitmap is not None:
+                for i, s in positions:
+                    if bitmap[i] == "1":
+                        rows[s][field] = "X"
 
     return columns, rows
 
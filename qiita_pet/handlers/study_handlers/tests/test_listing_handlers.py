@@ -205,6 +205,37 @@ class TestListStudiesAJAX(TestHandlerBase):
         super(TestListStudiesAJAX, self).tearDown()
         qiita_config.portal = self.portal
 
+    def test_get_server_side(self):
+        args = {
+            "user": "test@foo.bar",
+            "visibility": "user",
+            "draw": 3,
+            "start": 0,
+            "length": 10,
+            "order[0][column]": 1,
+            "order[0][dir]": "desc",
+            "columns[1][data]": "study_title",
+            "search[value]": "cannabis",
+        }
+        response = self.get("/study/list_studies/", args)
+        self.assertEqual(response.code, 200)
+        obs = loads(response.body)
+        self.assertEqual(obs["draw"], 3)
+        self.assertEqual(obs["recordsFiltered"], 1)
+        self.assertEqual([i["study_id"] for i in obs["data"]], [1])
+        self.assertEqual(obs["data"][0]["pi"], self.json["aaData"][0]["pi"])
+
+        args["search[value]"] = "not_a_study"
+        response = self.get("/study/list_studies/", args)
+        self.assertEqual(response.code, 200)
+        obs = loads(response.body)
+        self.assertEqual(obs["recordsFiltered"], 0)
+        self.assertEqual(obs["data"], [])
+
+        args["start"] = "bad"
+        response = self.get("/study/list_studies/", args)
+        self.assertEqual(response.code, 400)
+
 
 if __name__ == "__main__":
     main()
@@ -112,6 +112,45 @@ def to_int(value, reason=None):
     return res
 
 
+def datatables_page_args(handler, order_columns, default_order):
+    """Parses the DataTables server-side processing parameters of a request
+
+    Parameters
+    ----------
+    handler : BaseHandler
+        The handler serving the request
+    order_columns : iterable of str
+        The column names the listing can be sorted by
+    default_order : str
+        The column to sort by if the requested one is not sortable
+
+    Returns
+    -------
+    dict
+        The start, length, order_by, ascending and search keyword arguments
+        of the paginated listing functions
+
+    Raises
+    ------
+    HTTPError
+        If the start, length or order column are not integers
+    """
+    start = max(to_int(handler.get_argument("start", 0)), 0)
+    length = to_int(handler.get_argument("length", -1))
+    column = to_int(handler.get_argument("order[0][column]", 0))
+    order_by = handler.get_argument("columns[%d][data]" % column, None)
+    search = handler.get_argument("search[value]", "").strip()
+
+    return {
+        "start": start,
+        # DataTables uses -1 to request all the rows
+        "length": length if length >= 0 else None,
+        "order_by": order_by if order_by in order_columns else default_order,
+        "ascending": handler.get_argument("order[0][dir]", "asc") != "desc",
+        "search": search or None,
+    }
+
+
 @execute_as_transaction
 def get_shared_links(obj):
     """Creates email links for the users obj is shared with
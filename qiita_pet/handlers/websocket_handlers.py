@@ -8,32 +8,190 @@
 
 # adapted from
 # https://github.com/leporo/tornado-redis/blob/master/demos/websockets
+from collections import defaultdict, deque
+from functools import partial
 from itertools import chain
 from json import dumps, loads
 
 import toredis
-from tornado.gen import Task, engine
+from tornado.gen import coroutine
+from tornado.ioloop import IOLoop
 from tornado.web import authenticated
-from tornado.websocket import WebSocketHandler
+from tornado.websocket import WebSocketClosedError, WebSocketHandler
 
 from qiita_core.qiita_settings import r_client
 from qiita_core.util import execute_as_transaction
+from qiita_db.analysis import Analysis
 from qiita_db.artifact import Artifact
+from qiita_db.metadata_template.prep_template import PrepTemplate
+from qiita_db.processing_job import (
+    JOB_EVENTS_ANALYSIS_CHANNEL,
+    JOB_EVENTS_COMMAND_CHANNEL,
+    JOB_EVENTS_STUDY_CHANNEL,
+)
+from qiita_db.study import Study
 from qiita_pet.handlers.base_handlers import BaseHandler
 
 
+def _to_str(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+class ChannelMultiplexer(object):
+    """Shares a single redis subscriber among all the websockets of a worker
+
+    Parameters
+    ----------
+    max_pending : int, optional
+        The maximum number of messages queued per websocket. If a client
+        doesn't keep up, the oldest messages are dropped. Default 100.
+    reconnect_delay : float, optional
+        The seconds to wait before connecting again to redis when the
+        connection is lost. Default 1.
+
+    Notes
+    -----
+    Messages are written to a websocket one batch at a time: while a write is
+    in flight, new messages accumulate in the socket queue and they are sent
+    together, as a JSON list, when the previous write finishes.
+    If the connection to redis is lost, the multiplexer connects again and
+    subscribes to the channels that still have websockets listening; the
+    messages published while disconnected are lost.
+    """
+
+    def __init__(self, max_pending=100, reconnect_delay=1):
+        self.max_pending = max_pending
+        self.reconnect_delay = reconnect_delay
+        self._client = None
+        # channel -> set of websockets listening to it
+        self._sockets = defaultdict(set)
+        # websocket -> deque of pending payloads
+        self._queues = {}
+        self._flushing = set()
+
+    @property
+    def client(self):
+        """The toredis client, connected the first time it is needed"""
+        if self._client is None:
+            self._connect()
+        return self._client
+
+    def _connect(self):
+        client = toredis.Client()
+        client.on_disconnect = partial(self._on_disconnect, client)
+        client.connect()
+        self._client = client
+        # subscribe again to the channels of a lost connection
+        if self._sockets:
+            client.subscribe(sorted(self._sockets), callback=self._callback)
+
+    def _on_disconnect(self, client):
+        if client is not self._client:
+            return
+        self._client = None
+        IOLoop.current().call_later(self.reconnect_delay, self._reconnect)
+
+    def _reconnect(self):
+        # only connect if there are websockets listening and no one else
+        # connected in the meantime (e.g. a new subscription)
+        if self._client is None and self._sockets:
+            self._connect()
+
+    def subscribe(self, channel, socket):
+        """Starts delivering the messages of channel to socket
+
+        Parameters
+        ----------
+        channel : str
+            The redis channel
+        socket : tornado.websocket.WebSocketHandler
+            The websocket that will receive the messages
+        """
+        if socket not in self._queues:
+            self._queues[socket] = deque(maxlen=self.max_pending)
+        if channel not in self._sockets:
+            self.client.subscribe(channel, callback=self._callback)
+        self._sockets[channel].add(socket)
+
+        # Potential race-condition where a separate process may have placed
+        # messages into the queue before we've been able to attach listen.
+        for message in r_client.lrange("%s:messages" % channel, 0, -1):
+            self._enqueue(socket, message)
+
+    def unsubscribe(self, channel, socket):
+        """Stops delivering the messages of channel to socket
+
+        Parameters
+        ----------
+        channel : str
+            The redis channel
+        socket : tornado.websocket.WebSocketHandler
+            The websocket that was receiving the messages
+        """
+        self._queues.pop(socket, None)
+        sockets = self._sockets.get(channel)
+        if sockets is None:
+            return
+        sockets.discard(socket)
+        if not sockets:
+            # this was the last websocket listening to the channel
+            del self._sockets[channel]
+            if self._client is not None:
+                self._client.unsubscribe(channel)
+            r_client.delete("%s:messages" % channel)
+
+    def _callback(self, msg):
+        # toredis calls the callback with None when the connection is lost,
+        # which is handled by _on_disconnect
+        if msg is None:
+            return
+        message_type, channel, payload = [_to_str(m) for m in msg]
+
+        # if a compute process wrote to the Redis channel that we are
+        # listening too, and if it is actually a message, send the payload to
+        # the javascript clients via their websockets
+        if message_type == "message":
+            for socket in self._sockets.get(channel, ()):
+                self._enqueue(socket, payload)
+
+    def _enqueue(self, socket, payload):
+        queue = self._queues.get(socket)
+        if queue is None:
+            return
+        queue.append(_to_str(payload))
+        if socket not in self._flushing:
+            self._flushing.add(socket)
+            IOLoop.current().add_callback(self._flush, socket)
+
+    @coroutine
+    def _flush(self, socket):
+        try:
+            while self._queues.get(socket):
+                queue = self._queues[socket]
+                batch = list(queue)
+                queue.clear()
+                if len(batch) == 1:
+                    message = batch[0]
+                else:
+                    message = "[%s]" % ", ".join(batch)
+                try:
+                    yield socket.write_message(message)
+                except WebSocketClosedError:
+                    self._queues.pop(socket, None)
+        finally:
+            self._flushing.discard(socket)
+
+
+# One multiplexer per tornado worker
+multiplexer = ChannelMultiplexer()
+
+
 class MessageHandler(WebSocketHandler):
     def __init__(self, *args, **kwargs):
         super(MessageHandler, self).__init__(*args, **kwargs)
-        # The redis server
-        self.r_client = r_client
-
-        # The toredis server that allows event-based message handling
-        self.toredis = toredis.Client()
-        self.toredis.connect()
-
         self.channel = None
-        self.channel_messages = None
 
     def get_current_user(self):
         user = self.get_secure_cookie("user")
@@ -56,38 +214,67 @@ class MessageHandler(WebSocketHandler):
 
         # Determine which Redis communication channel the server needs to
         # listen on
-        self.channel = msginfo.get("user", None)
+        channel = msginfo.get("user", None)
 
+        if channel is not None and channel != self.channel:
+            if self.channel is not None:
+                multiplexer.unsubscribe(self.channel, self)
+            self.channel = channel
+            multiplexer.subscribe(self.channel, self)
+
+    def on_close(self):
         if self.channel is not None:
-            self.channel_messages = "%s:messages" % self.channel
-            self.listen()
+            multiplexer.unsubscribe(self.channel, self)
 
-    def listen(self):
-        # Attach a callback on the channel to listen too. This callback is
-        # executed when anything is placed onto the channel.
-        self.toredis.subscribe(self.channel, callback=self.callback)
 
-        # Potential race-condition where a separate process may have placed
-        # messages into the queue before we've been able to attach listen.
-        oldmessages = self.r_client.lrange(self.channel_messages, 0, -1)
-        if oldmessages is not None:
-            for message in oldmessages:
-                self.write_message(message)
+class JobEventsHandler(WebSocketHandler, BaseHandler):
+    """Websocket streaming the job status changes of a study, an analysis or,
+    for the admins, a command"""
 
-    def callback(self, msg):
-        message_type, channel, payload = msg
+    def initialize(self):
+        self.channel = None
 
-        # if a compute process wrote to the Redis channel that we are
-        # listening too, and if it is actually a message, send the payload to
-        # the javascript client via the websocket
-        if channel == self.channel and message_type == "message":
-            self.write_message(payload)
+    @authenticated
+    @execute_as_transaction
+    def on_message(self, msg):
+        """Subscribes the websocket to the job events of a study, analysis
+        or command
+
+        Parameters
+        ----------
+        msg : JSON str
+            Message in the form {'study': study_id}, {'prep': prep_id},
+            {'analysis': analysis_id} or {'command': command_id}; the latter
+            is only available to the admins
+        """
+        msginfo = loads(msg)
+        if "command" in msginfo:
+            if self.current_user.level not in {"admin", "wet-lab admin"}:
+                return
+            channel = JOB_EVENTS_COMMAND_CHANNEL % int(msginfo["command"])
+        elif "analysis" in msginfo:
+            analysis = Analysis(int(msginfo["analysis"]))
+            if not analysis.has_access(self.current_user):
+                return
+            channel = JOB_EVENTS_ANALYSIS_CHANNEL % analysis.id
+        else:
+            if "prep" in msginfo:
+                study_id = PrepTemplate(int(msginfo["prep"])).study_id
+            else:
+                study_id = int(msginfo["study"])
+            if not Study(study_id).has_access(self.current_user):
+                return
+            channel = JOB_EVENTS_STUDY_CHANNEL % study_id
+
+        if channel != self.channel:
+            if self.channel is not None:
+                multiplexer.unsubscribe(self.channel, self)
+            self.channel = channel
+            multiplexer.subscribe(self.channel, self)
 
-    @engine
     def on_close(self):
-        yield Task(self.toredis.unsubscribe, self.channel)
-        self.r_client.delete("%s:messages" % self.channel)
-        self.redis.disconnect()
+        if self.channel is not None:
+            multiplexer.unsubscribe(self.channel, self)
 
 
 class SelectedSocketHandler(WebSocketHandler, BaseHandler):
@@ -132,11 +132,51 @@ Vue.component('processing-graph', {
     destroy: function() {
       let vm = this;
       clearInterval(vm.interval);
+      if (vm.jobsSocket !== undefined && vm.jobsSocket !== null) {
+        vm.jobsSocket.onclose = null;
+        vm.jobsSocket.close();
+        vm.jobsSocket = null;
+      }
       if (vm.network !== undefined) {
         vm.network.destroy();
       }
     },
 
+    /**
+     *
+     * Opens a websocket where the server pushes the status changes of the
+     * jobs of this study/analysis. While it is open, the jobs are only
+     * checked when an event arrives instead of on every countdown.
+     *
+     **/
+    connectJobEvents: function() {
+      let vm = this;
+      vm.jobsSocket = null;
+      vm.jobEventsConnected = false;
+      vm.jobEventsPending = false;
+      if (!window.WebSocket) {
+        return;
+      }
+      var socket_protocol = window.location.protocol == "https:" ? 'wss://' : 'ws://';
+      var socket = new WebSocket(socket_protocol + window.location.host + vm.portal + '/consumer/jobs/');
+      socket.onopen = function() {
+        var msg = {};
+        msg[vm.isAnalysisPipeline ? 'analysis' : 'prep'] = vm.elementId;
+        socket.send(JSON.stringify(msg));
+        vm.jobEventsConnected = true;
+      };
+      socket.onmessage = function(evt) {
+        // refresh on the next tick of the countdown
+        vm.jobEventsPending = true;
+        vm.countdownPoll = Math.min(vm.countdownPoll, 1);
+      };
+      socket.onclose = function() {
+        // go back to polling
+        vm.jobEventsConnected = false;
+      };
+      vm.jobsSocket = socket;
+    },
+
     /**
      *
      * Updates the status of those jobs in a non-terminal state
@@ -1206,6 +1246,7 @@ Vue.component('processing-graph', {
     // This call to udpate graph will take care of updating the jobs
     // if the graph is not available
     vm.updateGraph();
+    vm.connectJobEvents();
     vm.interval = setInterval(function() {
       vm.countdownPoll -= 1;
       $('#countdown-span').html(vm.countdownPoll);
@@ -1213,6 +1254,13 @@ Vue.component('processing-graph', {
         // Reset the counter for every 15 seconds
         vm.countdownPoll = 15;
 
+        // If the server is pushing the job events, only check the jobs
+        // when something changed
+        if (vm.jobEventsConnected && !vm.jobEventsPending) {
+          return;
+        }
+        vm.jobEventsPending = false;
+
         // Check for the initial poll - it only happens if a graph doesn't exist yet
         if (vm.initialPoll) {
           vm.updateGraph();
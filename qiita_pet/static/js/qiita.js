@@ -133,7 +133,7 @@ function send_samples_to_analysis(button, aids, samples = null) {
     $.get('/artifact/samples/', {ids:aids})
       .done(function ( data ) {
         if (data['status']=='success') {
-          qiita_websocket.send('sel', data['data']);
+          qiita_websocket.send_batched('sel', data['data']);
           button.value = 'Added';
           $(button).removeClass("btn-info");
         } else {
@@ -147,7 +147,7 @@ function send_samples_to_analysis(button, aids, samples = null) {
     $.each(aids, function(i, aid) {
       var to_send = {};
       to_send[aid] = samples.split(',');
-      qiita_websocket.send('sel', to_send);
+      qiita_websocket.send_batched('sel', to_send);
     });
     button.value = 'Added';
     $(button).removeClass("btn-info");
@@ -208,6 +208,12 @@ var qiita_websocket = new function () {
       /* registered callbacks */
       callbacks = {},
 
+      /* selections waiting to be sent, and the timer that sends them */
+      pending = {},
+      pending_timer = null,
+      /* milliseconds to wait for more selections before sending */
+      batch_delay = 250,
+
       /* the encode and decode methods used for communication */
       encode = JSON.stringify,
       decode = JSON.parse;
@@ -237,6 +243,38 @@ var qiita_websocket = new function () {
         ws.send(encode(to_send));
     };
 
+    /**
+     *
+     * Merges the data with the other selections sent during the last
+     * batch_delay milliseconds and sends them as a single message. Useful
+     * to avoid one server round trip per click when selecting many samples.
+     *
+     * @param {action} The associated action to send, str.
+     * @param {data} Object in the form {artifact_id: [sample1, ...], ...}
+     */
+    this.send_batched = function(action, data) {
+        if (!(action in pending)) {
+          pending[action] = {};
+        }
+        for (var key in data) {
+          if (!(key in pending[action])) {
+            pending[action][key] = [];
+          }
+          pending[action][key] = pending[action][key].concat(data[key]);
+        }
+        if (pending_timer === null) {
+          var self = this;
+          pending_timer = setTimeout(function() {
+            var to_send = pending;
+            pending = {};
+            pending_timer = null;
+            for (var a in to_send) {
+              self.send(a, to_send[a]);
+            }
+          }, batch_delay);
+        }
+    };
+
     /**
      *
      * Verify the browser supports websockets, and if so, initialize the
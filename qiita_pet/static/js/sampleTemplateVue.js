@@ -121,9 +121,56 @@ Vue.component('sample-template-page', {
       $('#update-st-div').hide();
       // Force the first check to happen now
       vm.checkJob();
-      // Set the interval for further checking - this jobs tend to be way faster
-      // hence setting the interval every 2 seconds.
-      vm.interval = setInterval(vm.checkJob, 2000);
+      // The server pushes the job events, only poll if the websocket is
+      // not available - this jobs tend to be way faster hence setting the
+      // interval every 2 seconds.
+      vm.interval = setInterval(function() {
+        if (!vm.jobEventsConnected) {
+          vm.checkJob();
+        }
+      }, 2000);
+    },
+
+    /**
+     *
+     * Opens the websocket where the server pushes the job events of the study
+     *
+     **/
+    connectJobEvents: function() {
+      let vm = this;
+      vm.jobsSocket = null;
+      vm.jobEventsConnected = false;
+      if (!window.WebSocket) {
+        return;
+      }
+      var socket_protocol = window.location.protocol == "https:" ? 'wss://' : 'ws://';
+      var socket = new WebSocket(socket_protocol + window.location.host + vm.portal + '/consumer/jobs/');
+      socket.onopen = function() {
+        socket.send(JSON.stringify({study: vm.studyId}));
+        vm.jobEventsConnected = true;
+        // the job could have changed before subscribing
+        if (vm.interval !== null) {
+          vm.checkJob();
+        }
+      };
+      socket.onmessage = function(evt) {
+        // the server can send several events at once
+        var events = JSON.parse(evt.data);
+        if (!Array.isArray(events)) {
+          events = [events];
+        }
+        for (var i = 0; i < events.length; i++) {
+          if (vm.interval !== null && events[i]['job_id'] === vm.job) {
+            vm.checkJob();
+            break;
+          }
+        }
+      };
+      socket.onclose = function() {
+        // go back to polling
+        vm.jobEventsConnected = false;
+      };
+      vm.jobsSocket = socket;
     },
 
     /**
@@ -134,6 +181,7 @@ Vue.component('sample-template-page', {
     stopJobCheckInterval: function() {
       let vm = this;
       clearInterval(vm.interval);
+      vm.interval = null;
     },
 
     /**
@@ -626,6 +674,11 @@ Vue.component('sample-template-page', {
     destroy: function() {
       let vm = this;
       vm.stopJobCheckInterval()
+      if (vm.jobsSocket !== undefined && vm.jobsSocket !== null) {
+        vm.jobsSocket.onclose = null;
+        vm.jobsSocket.close();
+        vm.jobsSocket = null;
+      }
     }
   },
   /**
@@ -646,6 +699,8 @@ Vue.component('sample-template-page', {
 
     show_loading('sample-template-contents');
 
+    vm.connectJobEvents();
+
     // Get the overview information from the server
     vm.updateSampleTemplateOverview();
   }
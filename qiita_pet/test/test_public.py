@@ -6,6 +6,7 @@
 # The full license is in the file LICENSE, distributed with this software.
 # -----------------------------------------------------------------------------
 
+from json import loads
 from unittest import main
 
 from qiita_db.artifact import Artifact
@@ -59,5 +60,27 @@ class TestPublicHandler(TestHandlerBase):
         )
 
 
+class TestMetadataSearchHandler(TestHandlerBase):
+    def test_get(self):
+        response = self.get("/public/metadata_search/", {"query": "ph>6.9"})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(loads(response.body)["data"], {})
+
+        # artifact 1 is the first artifact within Study 1
+        Artifact(1).visibility = "public"
+        args = {"query": ["ph>6.9", "description_duplicate~burmese r"]}
+        response = self.get("/public/metadata_search/", args)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(
+            loads(response.body)["data"], {"1": ["1.SKB7.640196", "1.SKB8.640193"]}
+        )
+
+        response = self.get("/public/metadata_search/", {"query": "ph"})
+        self.assertEqual(response.code, 422)
+
+        response = self.get("/public/metadata_search/", {"query": "ph>high"})
+        self.assertEqual(response.code, 422)
+
+
 if __name__ == "__main__":
     main()
@@ -8,13 +8,138 @@
 
 from json import dumps, loads
 from unittest import main
+from unittest.mock import patch
 
-from tornado.gen import Return, coroutine
-from tornado.testing import gen_test
+from tornado.gen import Return, coroutine, moment, sleep
+from tornado.testing import AsyncTestCase, gen_test
 
+from qiita_core.qiita_settings import r_client
+from qiita_pet.handlers import websocket_handlers
+from qiita_pet.handlers.websocket_handlers import ChannelMultiplexer
 from qiita_pet.test.tornado_test_base import TestHandlerWebSocketBase
 
 
+class _FakeRedisClient(object):
+    def __init__(self):
+        self.subscribed = []
+        self.unsubscribed = []
+
+    def connect(self):
+        pass
+
+    def subscribe(self, channel, callback=None):
+        self.subscribed.append(channel)
+        self.callback = callback
+
+    def unsubscribe(self, channel):
+        self.unsubscribed.append(channel)
+
+
+class _FakeSocket(object):
+    def __init__(self):
+        self.messages = []
+
+    def write_message(self, message):
+        self.messages.append(message)
+
+
+class TestChannelMultiplexer(AsyncTestCase):
+    def setUp(self):
+        super(TestChannelMultiplexer, self).setUp()
+        self.mp = ChannelMultiplexer(max_pending=3)
+        self.client = _FakeRedisClient()
+        self.mp._client = self.client
+
+    def tearDown(self):
+        r_client.delete("test@foo.bar:messages")
+        super(TestChannelMultiplexer, self).tearDown()
+
+    @gen_test
+    def test_subscribe_unsubscribe(self):
+        r_client.rpush("test@foo.bar:messages", '{"a": 1}', '{"a": 2}')
+        s1 = _FakeSocket()
+        s2 = _FakeSocket()
+        self.mp.subscribe("test@foo.bar", s1)
+        self.mp.subscribe("test@foo.bar", s2)
+        # a single redis subscription is shared by both sockets
+        self.assertEqual(self.client.subscribed, ["test@foo.bar"])
+        yield moment
+        # queued messages are delivered together
+        self.assertEqual(s1.messages, ['[{"a": 1}, {"a": 2}]'])
+        self.assertEqual(s2.messages, ['[{"a": 1}, {"a": 2}]'])
+
+        self.client.callback([b"message", b"test@foo.bar", b'{"a": 3}'])
+        self.client.callback([b"message", b"other", b'{"a": 4}'])
+        yield moment
+        self.assertEqual(s1.messages[1:], ['{"a": 3}'])
+        self.assertEqual(s2.messages[1:], ['{"a": 3}'])
+
+        self.mp.unsubscribe("test@foo.bar", s1)
+        self.assertEqual(self.client.unsubscribed, [])
+        self.assertEqual(r_client.llen("test@foo.bar:messages"), 2)
+        self.mp.unsubscribe("test@foo.bar", s2)
+        self.assertEqual(self.client.unsubscribed, ["test@foo.bar"])
+        self.assertEqual(r_client.llen("test@foo.bar:messages"), 0)
+
+    @gen_test
+    def test_backpressure(self):
+        s1 = _FakeSocket()
+        self.mp.subscribe("test@foo.bar", s1)
+        for i in range(5):
+            self.client.callback(
+                [b"message", b"test@foo.bar", ('{"a": %d}' % i).encode()]
+            )
+        yield moment
+        # only the last max_pending messages are kept
+        self.assertEqual(s1.messages, ['[{"a": 2}, {"a": 3}, {"a": 4}]'])
+
+    @gen_test
+    def test_reconnect(self):
+        mp = ChannelMultiplexer(reconnect_delay=0.01)
+        clients = []
+
+        def new_client():
+            clients.append(_FakeRedisClient())
+            return clients[-1]
+
+        with patch.object(websocket_handlers.toredis, "Client", new_client):
+            s1 = _FakeSocket()
+            s2 = _FakeSocket()
+            mp.subscribe("test@foo.bar", s1)
+            mp.subscribe("other", s2)
+            self.assertEqual(len(clients), 1)
+            self.assertEqual(clients[0].subscribed, ["test@foo.bar", "other"])
+
+            # the connection is lost: toredis calls the subscription
+            # callback with None and then on_disconnect
+            clients[0].callback(None)
+            clients[0].on_disconnect()
+            self.assertIsNone(mp._client)
+            yield sleep(0.05)
+            # a new connection subscribes to all the channels
+            self.assertEqual(len(clients), 2)
+            self.assertEqual(clients[1].subscribed, [["other", "test@foo.bar"]])
+            clients[1].callback([b"message", b"test@foo.bar", b'{"a": 1}'])
+            yield moment
+            self.assertEqual(s1.messages, ['{"a": 1}'])
+
+            # the old connection is ignored
+            clients[0].on_disconnect()
+            yield sleep(0.05)
+            self.assertEqual(len(clients), 2)
+
+            # without websockets listening there is no need to reconnect
+            mp.unsubscribe("test@foo.bar", s1)
+            mp.unsubscribe("other", s2)
+            clients[1].on_disconnect()
+            yield sleep(0.05)
+            self.assertEqual(len(clients), 2)
+            # until a websocket subscribes again
+            mp.subscribe("other", s2)
+            self.assertEqual(len(clients), 3)
+            self.assertEqual(clients[2].subscribed, ["other"])
+
+
 # adapted from: https://gist.github.com/crodjer/1e9989ab30fdc32db926
 class TestSelectedSocketHandler(TestHandlerWebSocketBase):
     @coroutine
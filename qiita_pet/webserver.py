@@ -64,6 +64,7 @@ from qiita_pet.handlers.analysis_handlers import (
     AnalysisJobsHandler,
     AnalysisSummaryAJAX,
     CreateAnalysisHandler,
+    ListAnalysesAJAX,
     ListAnalysesHandler,
     SelectedSamplesHandler,
     ShareAnalysisAJAX,
@@ -102,7 +103,7 @@ from qiita_pet.handlers.prep_template import (
     PrepTemplateHandler,
     PrepTemplateJobHandler,
 )
-from qiita_pet.handlers.public import PublicHandler
+from qiita_pet.handlers.public import MetadataSearchHandler, PublicHandler
 from qiita_pet.handlers.qiita_redbiom import RedbiomPublicSearch
 from qiita_pet.handlers.resources import ResourcesHandler
 from qiita_pet.handlers.rest import ENDPOINTS as REST_ENDPOINTS
@@ -161,6 +162,7 @@ from qiita_pet.handlers.user_handlers import (
     UserProfileHandler,
 )
 from qiita_pet.handlers.websocket_handlers import (
+    JobEventsHandler,
     MessageHandler,
     SelectedSocketHandler,
     SelectSamplesHandler,
@@ -197,6 +199,7 @@ class Application(tornado.web.Application):
             (r"/static/(.*)", tornado.web.StaticFileHandler, {"path": STATIC_PATH}),
             # Analysis handlers
             (r"/analysis/list/", ListAnalysesHandler),
+            (r"/analysis/list_analyses/", ListAnalysesAJAX),
             (r"/analysis/dflt/sumary/", AnalysisSummaryAJAX),
             (r"/analysis/create/", CreateAnalysisHandler),
             (r"/analysis/selected/", SelectedSamplesHandler),
@@ -208,6 +211,7 @@ class Application(tornado.web.Application):
             (r"/artifact/samples/", ArtifactGetSamples),
             (r"/artifact/info/", ArtifactGetInfo),
             (r"/consumer/", MessageHandler),
+            (r"/consumer/jobs/", JobEventsHandler),
             (r"/admin/error/", LogEntryViewerHandler),
             (r"/admin/approval/", StudyApprovalList),
             (r"/admin/artifact/", ArtifactAdminAJAX),
@@ -291,6 +295,7 @@ class Application(tornado.web.Application):
             (r"/public_artifact_download/", DownloadPublicArtifactHandler),
             (r"/private_download/(.*)", DownloadPrivateArtifactHandler),
             (r"/public/", PublicHandler),
+            (r"/public/metadata_search/", MetadataSearchHandler),
             (r"/vamps/(.*)", VAMPSHandler),
             (r"/redbiom/(.*)", RedbiomPublicSearch),
             (r"/iframe/", IFrame),
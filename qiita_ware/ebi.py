@@ -247,7 +247,11 @@ class EBISubmission(object):
         get_output_fp = partial(join, self.full_ebi_dir)
         nvp = []
         nvim = []
-        for k, sample_prep in self.prep_template.items():
+        # reading the prep and sample information in bulk, instead of one
+        # query per sample and value
+        prep_template = self.prep_template.snapshot()
+        sample_template = self.sample_template.snapshot(samples=prep_template)
+        for k, sample_prep in prep_template.items():
             # validating required fields
             if "platform" not in sample_prep or sample_prep["platform"] is None:
                 nvp.append(k)
@@ -270,7 +274,7 @@ class EBISubmission(object):
             # to be using during submission and they come from the sample info
             # file, however, we are only retrieving the samples that exist in
             # the prep AKA not all samples
-            self.samples[k] = self.sample_template.get(sample_prep.id)
+            self.samples[k] = sample_template.get(sample_prep.id)
             self.samples_prep[k] = sample_prep
             self.sample_demux_fps[k] = get_output_fp(k)
 
@@ -1136,9 +1140,11 @@ class EBISubmission(object):
             fps.append((sample_name, (fwd_read, rev_read)))
 
         if "run_prefix" in self.prep_template.categories:
-            rps = [
-                (k, v) for k, v in self.prep_template.get_category("run_prefix").items()
-            ]
+            pt_id = self.prep_template.id
+            values = self.prep_template.get_categories(
+                ["run_prefix"], templates=[pt_id], missing="None"
+            )[pt_id]
+            rps = list(zip(values["sample_id"], values["run_prefix"]))
         else:
             rps = [(v, v.split(".", 1)[1]) for v in self.prep_template.keys()]
         rps.sort(key=lambda x: x[1])
@@ -355,18 +355,9 @@ def complete_job(job):
     with qdb.sql_connection.TRN:
         param_vals = job.parameters.values
         payload = loads(param_vals["payload"])
-        if payload["success"]:
-            artifacts = payload["artifacts"]
-            error = None
-        else:
-            artifacts = None
-            error = payload["error"]
         c_job = qdb.processing_job.ProcessingJob(param_vals["job_id"])
         c_job.step = "Completing via %s [%s]" % (job.id, job.external_id)
-        try:
-            c_job.complete(payload["success"], artifacts, error)
-        except Exception:
-            c_job._set_error(traceback.format_exception(*exc_info()))
+        c_job._complete_from_payload(payload)
 
         job._set_status("success")
 